@@ -0,0 +1,142 @@
+# agent/async_email_agent.py
+from __future__ import annotations
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional, Tuple
+
+from agent.email_agent import EmailAgent, _build_outgoing, _no_recipient, _queued_result, _result
+from tools import instrumentation
+from tools.gmail_tool import create_draft, send_message
+from tools.email_writer import aparse_prompt_to_fields, adraft_email, aparse_and_draft
+from tools.parse_batcher import get_parse_batcher
+from tools.speculation import aspeculative_parse_and_draft
+
+
+class AsyncEmailAgent(EmailAgent):
+    """
+    asyncio flavour of EmailAgent for many prompts at once.
+    LLM calls go through the shared AsyncOpenAI client; Gmail calls run in a
+    pool of gmail_workers threads sharing one service (each thread has its own
+    connection, see build_gmail_service).
+    With an outbox, arun() enqueues like run() does; drain_outbox() sends.
+    """
+
+    def __init__(self, *args, gmail_workers: int = 8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._gmail_executor = ThreadPoolExecutor(max_workers=gmail_workers, thread_name_prefix="gmail")
+
+    async def acompose(self, prompt: str) -> Dict[str, Any]:
+        if self.fused:
+            with instrumentation.span("parse_draft"):
+                parsed = await aparse_and_draft(prompt)
+            drafted = parsed.pop("draft")
+            if not (parsed.get("to_email") or "").strip():
+                drafted = None
+            return {"parsed": parsed, "drafted": drafted}
+
+        if self.speculative:
+            parsed = await aspeculative_parse_and_draft(prompt)
+            drafted = parsed.pop("draft")
+            return {"parsed": parsed, "drafted": drafted, "speculation": parsed.pop("speculation")}
+
+        with instrumentation.span("parse"):
+            if self.batch_parse:
+                parsed = await get_parse_batcher().aparse(prompt)
+            else:
+                parsed = await aparse_prompt_to_fields(prompt)
+        if not (parsed.get("to_email") or "").strip():
+            return {"parsed": parsed, "drafted": None}
+
+        instruction = parsed.get("notes") or prompt
+        with instrumentation.span("draft"):
+            drafted = await adraft_email(
+                parsed.get("to_name", ""), instruction, parsed.get("tone", "professional, friendly")
+            )
+        return {"parsed": parsed, "drafted": drafted}
+
+    async def adeliver(self, out: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        if out["action"] == "draft":
+            call = lambda: create_draft(self.service, message=out["message"])
+        else:
+            call = lambda: send_message(self.service, message=out["message"])
+        # Run in a copy of this task's context so the Gmail stage reports into its trace
+        ctx = contextvars.copy_context()
+        with instrumentation.span("gmail", action=out["action"]):
+            res = await loop.run_in_executor(self._gmail_executor, ctx.run, call)
+        return _result(out, res)
+
+    async def _in_gmail_pool(self, fn: Callable[[], Any]) -> Any:
+        # Blocking work (Gmail, the SQLite outbox) runs off the loop, in this task's context
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._gmail_executor, ctx.run, fn)
+
+    async def arun(
+        self, prompt: str, *, default_use_html: bool = True, idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of run(); idempotency_key only applies with an outbox.
+        """
+        with instrumentation.trace(self.instrument) as t:
+            result = await self._arun(prompt, default_use_html=default_use_html, idempotency_key=idempotency_key)
+            if t is not None:
+                result["instrumentation"] = t.as_dict()
+        return result
+
+    async def _arun(self, prompt: str, *, default_use_html: bool, idempotency_key: Optional[str]) -> Dict[str, Any]:
+        if self.outbox is not None:
+            idempotency_key, existing = await self._in_gmail_pool(lambda: self._outbox_key(prompt, idempotency_key))
+            if existing is not None:
+                return _queued_result(existing)
+
+        composed = await self.acompose(prompt)
+        parsed, drafted = composed["parsed"], composed["drafted"]
+        if drafted is None:
+            return _no_recipient(parsed)
+
+        if self.outbox is not None:
+            return await self._in_gmail_pool(
+                lambda: self._build_and_enqueue(parsed, drafted, idempotency_key, default_use_html=default_use_html)
+            )
+
+        if self.sender_pool is not None:
+            return await self._in_gmail_pool(
+                lambda: self.deliver_pooled(parsed, drafted, default_use_html=default_use_html)
+            )
+
+        with instrumentation.span("build"):
+            out = _build_outgoing(parsed, drafted, sender=self.sender, default_use_html=default_use_html)
+        return await self.adeliver(out)
+
+    async def run_many(
+        self,
+        prompts: Iterable[str],
+        *,
+        concurrency: int = 8,
+        default_use_html: bool = True,
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Process prompts with at most `concurrency` in flight.
+        Yields (index, result) as each prompt finishes; a failing prompt yields
+        {"ok": False, "error": ...} instead of aborting the rest.
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(i: int, prompt: str) -> Tuple[int, Dict[str, Any]]:
+            async with sem:
+                try:
+                    return i, await self.arun(prompt, default_use_html=default_use_html)
+                except Exception as e:
+                    return i, {"ok": False, "error": str(e), "prompt": prompt}
+
+        tasks = [asyncio.ensure_future(one(i, p)) for i, p in enumerate(prompts)]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    def close(self) -> None:
+        self._gmail_executor.shutdown(wait=True)
@@ -1,79 +1,318 @@
 # agent/email_agent.py
 from __future__ import annotations
-from typing import Dict, Any, Optional
+import threading
+from typing import Callable, Dict, Any, Optional, Tuple
 
+from tools import instrumentation
+from tools.credentials import CredentialRefresher, load_token_meta
 from tools.gmail_tool import (
-    get_gmail_service,
+    get_gmail_credentials,
+    build_gmail_service,
     get_sender_address,
     create_message,
     send_message,
     create_draft,
 )
-from tools.email_writer import parse_prompt_to_fields, draft_email
+from tools.email_writer import parse_prompt_to_fields, draft_email, draft_email_stream, parse_and_draft
+from tools.parse_batcher import get_parse_batcher
+from tools.speculation import speculative_parse_and_draft
+from tools.outbox import Outbox, drain, make_idempotency_key, message_id_for
+from tools.sender_pool import SenderPool
+
+
+def _no_recipient(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    return {"ok": False, "error": "No recipient email found in the prompt.", "parsed": parsed}
+
+
+def _build_outgoing(
+    parsed: Dict[str, Any],
+    drafted: Dict[str, str],
+    *,
+    sender: Optional[str],
+    default_use_html: bool = True,
+    headers: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Turn parsed fields + drafted content into {action, to, subject, body_text, message}.
+    """
+    to_email = (parsed.get("to_email") or "").strip()
+    subject = parsed.get("subject_override") or drafted["subject"]
+    body_html = drafted["html"] if (default_use_html and drafted["html"]) else None
+    body_text = drafted["plain"]
+    cc = parsed.get("cc") or None
+    bcc = parsed.get("bcc") or None
+    action = parsed.get("action")
+    action = action if action in ("send", "draft") else "send"
+
+    msg = create_message(
+        to=to_email,
+        subject=subject,
+        body_html=body_html,
+        body_text=body_text,
+        cc=cc,
+        bcc=bcc,
+        attachments=None,
+        sender=sender,
+        headers=headers,
+    )
+    return {"action": action, "to": to_email, "subject": subject, "body_text": body_text, "message": msg}
+
+
+def _result(out: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    result = {"ok": True, "mode": out["action"]}
+    if out["action"] == "draft":
+        result["draft_id"] = res.get("id")
+    else:
+        result["message_id"] = res.get("id")
+    result.update({"to": out["to"], "subject": out["subject"], "preview": {"plain": out["body_text"]}})
+    return result
+
+
+def _queued_result(row: Dict[str, Any], body_text: str = "") -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "mode": "queued",
+        "action": row["action"],
+        "outbox_id": row["id"],
+        "idempotency_key": row["idempotency_key"],
+        "status": row["status"],
+        "to": row["to_addr"],
+        "subject": row["subject"],
+        "preview": {"plain": body_text},
+    }
 
 
 class EmailAgent:
     """
     One-shot agent:
       prompt -> parse -> draft -> send OR draft.
+    With fused=True, parse and draft happen in a single LLM call.
+    With speculative=True, drafting starts from the raw prompt while the parse
+    is in flight, and is redone only if the parse changes it (see tools/speculation.py).
+    With batch_parse=True, prompts parsed at the same time by concurrent callers
+    share one parser completion (see tools/parse_batcher.py).
+    With an outbox, run() only enqueues; drain_outbox() does the sending.
+    With a sender_pool, each message is sent from the least-loaded of several
+    Gmail accounts (see tools/sender_pool.py) and the result names the "account".
+    With instrument=True, run() results carry an "instrumentation" entry with
+    per-stage wall times, token usage and Gmail retry counts (see
+    tools/instrumentation.py; hooks registered there fire either way).
+
+    Construction is network-free: the Gmail service is built on first use, the
+    sender address comes from the token's sidecar cache when available, and
+    (with refresh_ahead) the access token is refreshed in the background before
+    it expires.
     """
 
     def __init__(
         self,
         client_secret_path: str = "C:\\Users\\HP\\ai_teacher_assistant\\email_agent_test\\google_crediential.json",
         token_path: str = "token.json",
+        *,
+        fused: bool = False,
+        outbox: Optional[Outbox] = None,
+        refresh_ahead: bool = True,
+        instrument: bool = False,
+        sender_pool: Optional[SenderPool] = None,
+        speculative: bool = False,
+        batch_parse: bool = False,
     ):
-        self.service = get_gmail_service(
-            client_secret_path=client_secret_path, token_path=token_path
-        )
-        self.sender = get_sender_address(self.service)
+        self.client_secret_path = client_secret_path
+        self.token_path = token_path
+        self.fused = fused
+        self.speculative = speculative
+        self.batch_parse = batch_parse
+        self.outbox = outbox
+        self.refresh_ahead = refresh_ahead
+        self.instrument = instrument
+        assert not (outbox and sender_pool), "sender_pool cannot be combined with an outbox"
+        self.sender_pool = sender_pool
+        self.refresher: Optional[CredentialRefresher] = None
+        self._service = None
+        self._sender: Optional[str] = None
+        self._service_lock = threading.Lock()
 
-    def run(self, prompt: str, *, default_use_html: bool = True) -> Dict[str, Any]:
-        parsed = parse_prompt_to_fields(prompt)
+    @property
+    def service(self):
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    creds = get_gmail_credentials(self.client_secret_path, self.token_path)
+                    if self.refresh_ahead:
+                        self.refresher = CredentialRefresher(creds, self.token_path).start()
+                    self._service = build_gmail_service(creds)
+        return self._service
 
-        to_email = (parsed.get("to_email") or "").strip()
-        if not to_email:
-            return {"ok": False, "error": "No recipient email found in the prompt.", "parsed": parsed}
+    @property
+    def sender(self) -> str:
+        if self._sender is None:
+            self._sender = load_token_meta(self.token_path).get("email") or get_sender_address(
+                self.service, token_path=self.token_path
+            )
+        return self._sender
+
+    def compose(self, prompt: str, *, on_draft_event: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """
+        Return {"parsed": ..., "drafted": ...}; drafted is None when no recipient was found.
+        on_draft_event(field, text) receives the draft as it streams ("subject", then
+        "plain"/"html" chunks); it is not called in fused mode. Streaming takes
+        precedence over speculative drafting.
+        """
+        if self.fused:
+            with instrumentation.span("parse_draft"):
+                parsed = parse_and_draft(prompt)
+            drafted = parsed.pop("draft")
+            if not (parsed.get("to_email") or "").strip():
+                drafted = None
+            return {"parsed": parsed, "drafted": drafted}
+
+        if self.speculative and on_draft_event is None:
+            parsed = speculative_parse_and_draft(prompt)
+            drafted = parsed.pop("draft")
+            return {"parsed": parsed, "drafted": drafted, "speculation": parsed.pop("speculation")}
+
+        with instrumentation.span("parse"):
+            parsed = get_parse_batcher().parse(prompt) if self.batch_parse else parse_prompt_to_fields(prompt)
+        if not (parsed.get("to_email") or "").strip():
+            return {"parsed": parsed, "drafted": None}
 
         instruction = parsed.get("notes") or prompt
-        drafted = draft_email(parsed.get("to_name", ""), instruction, parsed.get("tone", "professional, friendly"))
-
-        subject = parsed.get("subject_override") or drafted["subject"]
-        body_html = drafted["html"] if (default_use_html and drafted["html"]) else None
-        body_text = drafted["plain"]
-        cc = parsed.get("cc") or None
-        bcc = parsed.get("bcc") or None
-        action = parsed.get("action")
-        action = action if action in ("send", "draft") else "send"
-
-        msg = create_message(
-            to=to_email,
-            subject=subject,
-            body_html=body_html,
-            body_text=body_text,
-            cc=cc,
-            bcc=bcc,
-            attachments=None,
-            sender=self.sender,
-        )
-
-        if action == "draft":
-            res = create_draft(self.service, message=msg)
-            return {
-                "ok": True,
-                "mode": "draft",
-                "draft_id": res.get("id"),
-                "to": to_email,
-                "subject": subject,
-                "preview": {"plain": body_text},
-            }
-        else:
-            res = send_message(self.service, message=msg)
-            return {
-                "ok": True,
-                "mode": "send",
-                "message_id": res.get("id"),
-                "to": to_email,
-                "subject": subject,
-                "preview": {"plain": body_text},
-            }
+        tone = parsed.get("tone", "professional, friendly")
+        with instrumentation.span("draft"):
+            if on_draft_event is None:
+                drafted = draft_email(parsed.get("to_name", ""), instruction, tone)
+            else:
+                for field, value in draft_email_stream(parsed.get("to_name", ""), instruction, tone):
+                    if field == "done":
+                        drafted = value
+                    else:
+                        on_draft_event(field, value)
+        return {"parsed": parsed, "drafted": drafted}
+
+    def deliver(self, out: Dict[str, Any]) -> Dict[str, Any]:
+        with instrumentation.span("gmail", action=out["action"]):
+            if out["action"] == "draft":
+                res = create_draft(self.service, message=out["message"])
+            else:
+                res = send_message(self.service, message=out["message"])
+        return _result(out, res)
+
+    def deliver_pooled(
+        self,
+        parsed: Dict[str, Any],
+        drafted: Dict[str, str],
+        *,
+        default_use_html: bool = True,
+        from_domain: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build and send through the sender pool; the message is (re)built for whichever account sends it.
+        """
+        built: Dict[str, Any] = {}
+
+        def build(account):
+            with instrumentation.span("build"):
+                built["out"] = _build_outgoing(
+                    parsed, drafted, sender=account.email, default_use_html=default_use_html
+                )
+            return built["out"]
+
+        action = parsed.get("action") if parsed.get("action") in ("send", "draft") else "send"
+        with instrumentation.span("gmail", action=action):
+            res = self.sender_pool.deliver(build, action=action, from_domain=from_domain)
+        result = _result(built["out"], res)
+        result["account"] = res["account"]
+        return result
+
+    def enqueue(self, out: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        with instrumentation.span("enqueue"):
+            row = self.outbox.enqueue(
+                out["message"], idempotency_key=idempotency_key, action=out["action"], to=out["to"], subject=out["subject"]
+            )
+        return _queued_result(row, out["body_text"])
+
+    def _outbox_key(self, prompt: str, idempotency_key: Optional[str]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        (key to enqueue under, row already queued for it or None).
+        """
+        if idempotency_key:
+            return idempotency_key, self.outbox.get(idempotency_key)
+        # Repeats within OUTBOX_DEDUPE_WINDOW are retries; later ones are new messages
+        return self.outbox.find_recent(make_idempotency_key(self.sender or "", prompt))
+
+    def _build_and_enqueue(
+        self, parsed: Dict[str, Any], drafted: Dict[str, str], idempotency_key: str, *, default_use_html: bool = True
+    ) -> Dict[str, Any]:
+        headers = {"Message-ID": message_id_for(idempotency_key)}
+        with instrumentation.span("build"):
+            out = _build_outgoing(parsed, drafted, sender=self.sender, default_use_html=default_use_html, headers=headers)
+        return self.enqueue(out, idempotency_key)
+
+    def run(
+        self,
+        prompt: str,
+        *,
+        default_use_html: bool = True,
+        idempotency_key: Optional[str] = None,
+        on_draft_event: Optional[Callable[[str, str], None]] = None,
+        from_domain: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        on_draft_event: see compose(); lets callers render the draft while it streams.
+        from_domain: with a sender_pool, only send from accounts in this domain.
+        With an outbox, the message is enqueued under idempotency_key, so re-running with
+        the same key never sends twice. Without a key, the same sender + prompt within
+        OUTBOX_DEDUPE_WINDOW seconds (default 1 hour) counts as a retry of the same message.
+        With instrument=True the result also has
+          "instrumentation": {timings: {parse, draft, build, gmail, quota_wait, gmail_backoff, total},
+                              usage: {parse, draft, total: {prompt_tokens, completion_tokens, total_tokens}},
+                              counters: {gmail_retries, llm_cache_hits}}
+        (stages that did not run are absent; gmail includes quota_wait and gmail_backoff).
+        """
+        with instrumentation.trace(self.instrument) as t:
+            result = self._run(
+                prompt,
+                default_use_html=default_use_html,
+                idempotency_key=idempotency_key,
+                on_draft_event=on_draft_event,
+                from_domain=from_domain,
+            )
+            if t is not None:
+                result["instrumentation"] = t.as_dict()
+        return result
+
+    def _run(
+        self,
+        prompt: str,
+        *,
+        default_use_html: bool,
+        idempotency_key: Optional[str],
+        on_draft_event: Optional[Callable[[str, str], None]],
+        from_domain: Optional[str],
+    ) -> Dict[str, Any]:
+        if self.outbox is not None:
+            idempotency_key, existing = self._outbox_key(prompt, idempotency_key)
+            if existing is not None:
+                return _queued_result(existing)
+
+        composed = self.compose(prompt, on_draft_event=on_draft_event)
+        parsed, drafted = composed["parsed"], composed["drafted"]
+        if drafted is None:
+            return _no_recipient(parsed)
+
+        if self.outbox is not None:
+            return self._build_and_enqueue(parsed, drafted, idempotency_key, default_use_html=default_use_html)
+
+        if self.sender_pool is not None:
+            return self.deliver_pooled(parsed, drafted, default_use_html=default_use_html, from_domain=from_domain)
+
+        with instrumentation.span("build"):
+            out = _build_outgoing(parsed, drafted, sender=self.sender, default_use_html=default_use_html)
+        return self.deliver(out)
+
+    def drain_outbox(self, *, workers: int = 4) -> Dict[str, int]:
+        """
+        Send everything queued in the outbox; the workers share this agent's Gmail service.
+        """
+        assert self.outbox is not None, "EmailAgent was created without an outbox"
+        return drain(self.outbox, lambda: self.service, workers=workers)
@@ -0,0 +1,160 @@
+# bench/fake_gmail.py
+"""
+In-process stand-in for the Gmail service object returned by get_gmail_service.
+
+It mirrors the call shape the tools use, e.g.
+  service.users().messages().send(userId="me", body={...}).execute()
+and batch requests via service.new_batch_http_request(), with configurable
+latency and error rate. Nothing leaves the process. list(q="rfc822msgid:<id>")
+finds stored messages and drafts by their Message-ID header, as Gmail does.
+"""
+from __future__ import annotations
+import base64
+import itertools
+import random
+import threading
+import time
+from email.parser import BytesHeaderParser
+from typing import Any, Callable, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+
+class _Resp(dict):
+    def __init__(self, status: int):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "Too Many Requests" if status == 429 else "Backend Error"
+
+
+class _Request:
+    def __init__(self, service: "FakeGmailService", fn: Callable[[], Dict[str, Any]], *, network: bool = True):
+        self._service = service
+        self._fn = fn
+        self._network = network
+
+    def execute(self, num_retries: int = 0) -> Dict[str, Any]:
+        if self._network:
+            self._service._round_trip()
+        self._service._maybe_fail()
+        return self._fn()
+
+
+class _Batch:
+    def __init__(self, service: "FakeGmailService", callback):
+        self._service = service
+        self._callback = callback
+        self._items: List = []
+
+    def add(self, request: _Request, callback=None, request_id: Optional[str] = None):
+        self._items.append((request, callback or self._callback, request_id or str(len(self._items))))
+
+    def execute(self):
+        # One HTTP round-trip for the whole batch, per-item failures
+        self._service._round_trip()
+        self._service.stats["batches"] += 1
+        for request, callback, request_id in self._items:
+            try:
+                callback(request_id, _Request(self._service, request._fn, network=False).execute(), None)
+            except HttpError as e:
+                callback(request_id, None, e)
+
+
+class _Resource:
+    def __init__(self, service: "FakeGmailService", kind: str):
+        self._service = service
+        self._kind = kind
+
+    # users()
+    def messages(self):
+        return _Resource(self._service, "messages")
+
+    def drafts(self):
+        return _Resource(self._service, "drafts")
+
+    def getProfile(self, userId: str = "me"):
+        return _Request(self._service, lambda: {"emailAddress": self._service.address})
+
+    # messages() / drafts()
+    def send(self, userId: str = "me", body: Optional[Dict[str, Any]] = None, media_body=None):
+        return _Request(self._service, lambda: self._service._store("sent", body))
+
+    def create(self, userId: str = "me", body: Optional[Dict[str, Any]] = None, media_body=None):
+        return _Request(self._service, lambda: self._service._store("drafts", body))
+
+    def list(self, userId: str = "me", q: str = "", maxResults: int = 100):
+        return _Request(self._service, lambda: {self._kind: self._service._find(self._kind, q)[:maxResults]})
+
+
+class FakeGmailService:
+    def __init__(
+        self,
+        *,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        address: str = "bench@example.com",
+        keep_bodies: bool = False,
+        seed: Optional[int] = None,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.address = address
+        self.keep_bodies = keep_bodies
+        self.sent: List[Dict[str, Any]] = []
+        self.drafts: List[Dict[str, Any]] = []
+        self.stats = {"requests": 0, "batches": 0, "errors": 0, "sent": 0, "drafts": 0}
+        self._ids = itertools.count(1)
+        self._by_message_id: Dict[str, Dict[str, str]] = {"sent": {}, "drafts": {}}  # kind -> {Message-ID: id}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def users(self):
+        return _Resource(self, "users")
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def _round_trip(self) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency_s + (self._random.random() * self.jitter_s if self.jitter_s else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def _maybe_fail(self) -> None:
+        with self._lock:
+            fail = self.error_rate and self._random.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+        if fail:
+            raise HttpError(_Resp(self.error_status), b'{"error": {"message": "fake error"}}')
+
+    def _store(self, kind: str, body: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        message_id = _message_id(body or {})
+        with self._lock:
+            n = next(self._ids)
+            self.stats[kind] += 1
+            if self.keep_bodies:
+                getattr(self, kind).append(body or {})
+            if message_id:
+                self._by_message_id[kind][message_id] = f"{kind[0]}{n:08x}"
+        return {"id": f"{kind[0]}{n:08x}", "threadId": f"t{n:08x}"}
+
+    def _find(self, kind: str, q: str) -> List[Dict[str, str]]:
+        if not q.startswith("rfc822msgid:"):
+            return []
+        with self._lock:
+            found = self._by_message_id["drafts" if kind == "drafts" else "sent"].get(q[len("rfc822msgid:"):])
+        return [{"id": found}] if found else []
+
+
+def _message_id(body: Dict[str, Any]) -> Optional[str]:
+    raw = (body.get("message") or body).get("raw")
+    if not raw:
+        return None
+    headers = BytesHeaderParser().parsebytes(base64.urlsafe_b64decode(raw.encode("ascii")))
+    return headers.get("Message-ID")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark: drives the agent against a fake Gmail service and a local
+OpenAI-compatible stub, and reports throughput and p50/p95/p99 per stage.
+
+  python -m bench.run_bench
+  python -m bench.run_bench --iterations 200 --llm-latency 0.3 --gmail-latency 0.05 --output bench_output.txt
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench.fake_gmail import FakeGmailService
+from bench.stub_llm import StubLLMServer
+
+
+PROMPTS = [
+    "Send a professional email to john@example.com about the meeting tomorrow",
+    "Draft a friendly email to friend@gmail.com inviting them to dinner this weekend",
+    "Write a formal email to hr@company.com requesting vacation days for next month",
+    "Send an email to client@company.com about project updates, cc manager@company.com",
+]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: List[float] = []
+        self.wall_s = 0.0
+        self.items = 0
+        self.errors = 0
+
+    def row(self) -> str:
+        s = sorted(self.samples)
+        tput = self.items / self.wall_s if self.wall_s else 0.0
+        return (
+            f"{self.name:<28}{self.items:>7}{self.errors:>7}{tput:>12.1f}"
+            f"{percentile(s, 50) * 1000:>10.2f}{percentile(s, 95) * 1000:>10.2f}{percentile(s, 99) * 1000:>10.2f}"
+        )
+
+
+HEADER = f"{'stage':<28}{'items':>7}{'errors':>7}{'items/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+
+
+def time_each(name: str, n: int, fn: Callable[[int], object]) -> StageStats:
+    stats = StageStats(name)
+    start = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        try:
+            fn(i)
+        except Exception:
+            stats.errors += 1
+        stats.samples.append(time.perf_counter() - t0)
+        stats.items += 1
+    stats.wall_s = time.perf_counter() - start
+    return stats
+
+
+def make_agent(service: FakeGmailService, *, cls=None, **kwargs):
+    """
+    An EmailAgent wired to the fake service; nothing touches OAuth or token files.
+    """
+    from agent.email_agent import EmailAgent
+
+    cls = cls or EmailAgent
+    agent = cls(client_secret_path="", token_path=os.path.join(tempfile.gettempdir(), "bench_token.json"),
+                refresh_ahead=False, **kwargs)
+    agent._service = service
+    agent._sender = service.address
+    return agent
+
+
+def run(args) -> List[StageStats]:
+    from agent.async_email_agent import AsyncEmailAgent
+    from tools.email_writer import parse_prompt_to_fields, draft_email
+    from tools.gmail_tool import create_message, send_message, send_messages_batch
+    from tools.message_template import MessageTemplate
+
+    n = args.iterations
+    results: List[StageStats] = []
+
+    attachment: Optional[str] = None
+    if args.attachment_kb:
+        fd, attachment = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(os.urandom(args.attachment_kb * 1024))
+    attachments = [attachment] if attachment else None
+
+    body_text = "Hi {{name}},\n\n" + "This is the body of a benchmark email. " * 20
+    body_html = "<p>" + body_text.replace("\n\n", "</p><p>") + "</p>"
+
+    results.append(time_each("create_message", n, lambda i: create_message(
+        to=f"user{i}@example.com", subject="Benchmark", body_html=body_html, body_text=body_text,
+        attachments=attachments, sender="bench@example.com")))
+
+    template = MessageTemplate(subject="Benchmark for {{name}}", body_html=body_html, body_text=body_text,
+                               attachments=attachments, sender="bench@example.com")
+    results.append(time_each("MessageTemplate.render", n, lambda i: template.render(
+        f"user{i}@example.com", {"name": f"User {i}"})))
+
+    results.append(time_each("parse (fast path)", n, lambda i: parse_prompt_to_fields(
+        f"draft: email to user{i}@example.com about the quarterly report", fast_path=True)))
+    results.append(time_each("parse (LLM)", n, lambda i: parse_prompt_to_fields(
+        PROMPTS[i % len(PROMPTS)] + f" #{i}", fast_path=False)))
+    results.append(time_each("draft_email", n, lambda i: draft_email(
+        f"User {i}", "Follow up on last week's meeting", "professional, friendly")))
+
+    service = FakeGmailService(latency_s=args.gmail_latency, error_rate=args.gmail_error_rate)
+    msg = create_message(to="user@example.com", subject="Benchmark", body_text=body_text)
+    results.append(time_each("gmail send_message", n, lambda i: send_message(service, message=msg)))
+
+    agent = make_agent(service)
+    results.append(time_each("EmailAgent.run", n, lambda i: agent.run(PROMPTS[i % len(PROMPTS)] + f" #{i}")))
+    fused = make_agent(service, fused=True)
+    results.append(time_each("EmailAgent.run (fused)", n, lambda i: fused.run(PROMPTS[i % len(PROMPTS)] + f" #{i}")))
+    speculative = make_agent(service, speculative=True)
+    results.append(time_each("EmailAgent.run (speculative)", n,
+                             lambda i: speculative.run(PROMPTS[i % len(PROMPTS)] + f" #{i}")))
+
+    bulk = StageStats("send_messages_batch")
+    messages = [template.render(f"user{i}@example.com", {"name": f"User {i}"}) for i in range(args.bulk)]
+    start = time.perf_counter()
+    for res in send_messages_batch(service, messages, batch_size=args.batch_size):
+        bulk.items += 1
+        bulk.errors += 0 if res["ok"] else 1
+    bulk.wall_s = time.perf_counter() - start
+    bulk.samples = [bulk.wall_s / max(1, bulk.items)] * bulk.items
+    results.append(bulk)
+
+    def run_many_stage(name: str, async_agent) -> StageStats:
+        many = StageStats(name)
+
+        async def drive():
+            t0 = time.perf_counter()
+            prompts = [PROMPTS[i % len(PROMPTS)] + f" @{i}" for i in range(n)]
+            async for i, res in async_agent.run_many(prompts, concurrency=args.concurrency):
+                # Completion time since the batch started (queueing included)
+                many.samples.append(time.perf_counter() - t0)
+                many.items += 1
+                many.errors += 0 if res.get("ok") else 1
+
+        start = time.perf_counter()
+        asyncio.run(drive())
+        many.wall_s = time.perf_counter() - start
+        async_agent.close()
+        return many
+
+    results.append(run_many_stage(f"run_many (c={args.concurrency})", make_agent(service, cls=AsyncEmailAgent)))
+    results.append(run_many_stage(f"run_many (c={args.concurrency}, batch parse)",
+                                  make_agent(service, cls=AsyncEmailAgent, batch_parse=True)))
+
+    if attachment:
+        os.remove(attachment)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark with fake Gmail and stub LLM backends")
+    parser.add_argument("--iterations", "-n", type=int, default=50, help="Items per stage")
+    parser.add_argument("--bulk", type=int, default=1000, help="Messages in the batch-send stage")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="run_many concurrency")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub LLM latency per completion (s)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--gmail-latency", type=float, default=0.02, help="Fake Gmail latency per HTTP call (s)")
+    parser.add_argument("--gmail-error-rate", type=float, default=0.0)
+    parser.add_argument("--attachment-kb", type=int, default=0, help="Attach a random file of this size")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep the Gmail quota limiter on")
+    parser.add_argument("--local-html", action="store_true",
+                        help="Writer returns one markup body; html is rendered locally (LOCAL_HTML=1)")
+    parser.add_argument("--output", "-o", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    stub = StubLLMServer(latency_s=args.llm_latency, error_rate=args.llm_error_rate).start()
+    # Must be set before the writer modules are imported
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_API_BASE": stub.url,
+        "PARSER_CACHE": "0",
+        "WRITER_CACHE": "0",
+        "FAST_PARSE": "0",
+    })
+    if not args.rate_limit:
+        os.environ["GMAIL_RATE_LIMIT"] = "0"
+    if args.local_html:
+        os.environ["LOCAL_HTML"] = "1"
+
+    try:
+        results = run(args)
+    finally:
+        stub.stop()
+    from tools.speculation import speculation_stats
+    spec = speculation_stats()
+
+    lines = [
+        f"LLM latency {args.llm_latency * 1000:.0f} ms, Gmail latency {args.gmail_latency * 1000:.0f} ms, "
+        f"n={args.iterations}, bulk={args.bulk}",
+        HEADER,
+        "-" * len(HEADER),
+    ] + [r.row() for r in results] + [
+        f"stub LLM requests: {stub.stats['requests']} (errors {stub.stats['errors']})",
+        f"speculative drafts kept: {spec['kept']}/{spec['kept'] + spec['redrafted']} ({spec['keep_rate']:.0%}, "
+        "stub tones are canned, so this says little about real prompts)",
+    ]
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        Path(args.output).write_text(report + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+# bench/stub_llm.py
+"""
+Local OpenAI-compatible stub server for offline benchmarks.
+
+Serves POST /v1/chat/completions (plain and streamed) with canned but
+well-formed parser / writer / fused JSON, with configurable latency, per-token
+streaming delay and error rate. Point OPENAI_API_BASE at StubLLMServer.url.
+
+Also implements the slice of /v1/files and /v1/batches that
+tools/batch_drafts.py uses: uploaded batch input is answered in a background
+thread after batch_delay_s, with error_rate applied per request line.
+"""
+from __future__ import annotations
+import email.parser
+import email.policy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+_EMAIL_RE = re.compile(r"[\w\.\+-]+@[\w\.-]+\.\w+")
+_NAME_RE = re.compile(r"Recipient name:\s*(.+)")
+# Canned parser tones, picked per prompt independently of the prompt's wording, so
+# benchmarks don't share the tone heuristic speculation uses to keep or redraft
+_CANNED_TONES = ("professional", "friendly", "professional, friendly", "formal", "")
+
+
+def _parsed_fields(user: str) -> Dict[str, str]:
+    emails = _EMAIL_RE.findall(user)
+    return {
+        "to_email": emails[0] if emails else "",
+        "to_name": "",
+        "tone": _CANNED_TONES[zlib.crc32(user.encode("utf-8")) % len(_CANNED_TONES)],
+        "cc": ", ".join(emails[1:]),
+        "bcc": "",
+        "action": "draft" if "draft" in user.lower() else "send",
+        "subject_override": "",
+        "notes": "",
+    }
+
+
+def _drafted(name: str) -> Dict[str, str]:
+    plain = (
+        f"Hi {name},\n\n"
+        "Thanks for your time last week. This is a short note to follow up on the points we discussed "
+        "and confirm the next steps. Please let me know if anything needs to change before Friday.\n\n"
+        "Best regards"
+    )
+    html = "<p>" + plain.replace("\n\n", "</p><p>").replace("\n", "<br>") + "</p>"
+    return {"subject": "Following up", "plain": plain, "html": html}
+
+
+def canned_reply(system: str, user: str) -> Dict[str, Any]:
+    """
+    JSON content the real models would return for our parser / batch parser / writer / fused prompts.
+    """
+    if system.startswith("Extract email-send intent from each"):
+        return {"results": [dict(_parsed_fields(item["prompt"]), id=item["id"]) for item in json.loads(user)]}
+    if system.startswith("Extract email-send intent"):
+        return _parsed_fields(user)
+    if "AND write the email" in system:
+        out = _parsed_fields(user)
+        name = "there"
+    else:
+        m = _NAME_RE.search(user)
+        out, name = {}, m.group(1).strip() if m else "there"
+    drafted = _drafted(name)
+    if "subject, body" in system:
+        # LOCAL_HTML: one markup body, no html copy
+        drafted = {"subject": drafted["subject"], "body": drafted["plain"]}
+    out.update(drafted)
+    return out
+
+
+def _usage(prompt: str, completion: str) -> Dict[str, int]:
+    p, c = max(1, len(prompt) // 4), max(1, len(completion) // 4)
+    return {"prompt_tokens": p, "completion_tokens": c, "total_tokens": p + c}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real gateway
+    server: "_Server"
+
+    def log_message(self, format, *args):  # keep benchmark output clean
+        pass
+
+    def _json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _not_found(self) -> None:
+        self._json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _raw(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        stub = self.server.stub
+        raw = self._raw()
+        stub._count("requests")
+        path = self.path.rstrip("/")
+        if path.endswith("/files"):
+            return self._json(200, stub.upload(_multipart_file(self.headers.get("Content-Type", ""), raw)))
+        body = json.loads(raw or b"{}")
+        if path.endswith("/batches"):
+            return self._json(200, stub.create_batch(body))
+        if path.endswith("/chat/completions"):
+            if stub.latency_s:
+                time.sleep(stub.latency_s + random.random() * stub.jitter_s)
+            if stub.error_rate and random.random() < stub.error_rate:
+                stub._count("errors")
+                return self._json(500, {"error": {"message": "stub error", "type": "server_error"}})
+            return self._completion(body)
+        return self._not_found()
+
+    def do_GET(self):
+        stub = self.server.stub
+        m = re.search(r"/(files|batches)/([\w-]+)(/content)?$", self.path.rstrip("/"))
+        if not m:
+            return self._not_found()
+        kind, object_id, content = m.groups()
+        with stub._lock:
+            found = (stub.files if kind == "files" else stub.batches).get(object_id)
+            found = dict(found) if found is not None else None  # batches are updated in the background
+        if found is None:
+            return self._not_found()
+        if kind == "batches":
+            return self._json(200, found)
+        if not content:
+            return self._json(200, found["object"])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(found["data"])))
+        self.end_headers()
+        self.wfile.write(found["data"])
+
+    def _completion(self, body: Dict[str, Any]) -> None:
+        stub = self.server.stub
+        if not body.get("stream"):
+            return self._json(200, stub.completion(body))
+
+        messages = body.get("messages") or []
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        content = json.dumps(stub.reply(system, user))
+        model = body.get("model", "stub")
+        cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i in range(0, len(content), stub.stream_chunk_chars):
+            chunk = {
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + stub.stream_chunk_chars]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if stub.token_delay_s:
+                time.sleep(stub.token_delay_s)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            final = {"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [], "usage": _usage(system + user, content)}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def _multipart_file(content_type: str, raw: bytes) -> Tuple[str, str, bytes]:
+    """
+    (filename, purpose, data) from the multipart/form-data body of a file upload.
+    """
+    msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + raw
+    )
+    filename, purpose, data = "", "", b""
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name == "file":
+            filename = part.get_filename() or "upload.jsonl"
+            data = part.get_payload(decode=True) or b""
+        elif name == "purpose":
+            purpose = part.get_content().strip()
+    return filename, purpose, data
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: "StubLLMServer"
+
+
+class StubLLMServer:
+    def __init__(
+        self,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        error_rate: float = 0.0,
+        token_delay_s: float = 0.0,
+        stream_chunk_chars: int = 8,
+        batch_delay_s: float = 0.0,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.error_rate = error_rate
+        self.token_delay_s = token_delay_s
+        self.stream_chunk_chars = stream_chunk_chars
+        self.batch_delay_s = batch_delay_s
+        self.stats = {"requests": 0, "errors": 0, "batch_requests": 0}
+        self.files: Dict[str, Dict[str, Any]] = {}  # id -> {object, data}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply(self, system: str, user: str) -> Dict[str, Any]:
+        return canned_reply(system, user)
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        A non-streamed chat.completion object for a request body.
+        """
+        messages = body.get("messages") or []
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in messages if m.get("role") == "user"), "")
+        content = json.dumps(self.reply(system, user))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(system + user, content),
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += n
+
+    # ---- files / batches ----
+
+    def upload(self, upload: Tuple[str, str, bytes]) -> Dict[str, Any]:
+        filename, purpose, data = upload
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        obj = {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+               "filename": filename, "purpose": purpose}
+        with self._lock:
+            self.files[file_id] = {"object": obj, "data": data}
+        return obj
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        now = int(time.time())
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint"), "errors": None,
+            "input_file_id": body.get("input_file_id"), "completion_window": body.get("completion_window"),
+            "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "created_at": now, "in_progress_at": now, "expires_at": now + 86400, "finalizing_at": None,
+            "completed_at": None, "failed_at": None, "expired_at": None, "cancelling_at": None, "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+            snapshot = json.loads(json.dumps(batch))
+        threading.Thread(target=self._run_batch, args=(batch_id,), name="stub-batch", daemon=True).start()
+        return snapshot
+
+    def _run_batch(self, batch_id: str) -> None:
+        with self._lock:
+            batch = self.batches[batch_id]
+            source = self.files.get(batch["input_file_id"])
+        if self.batch_delay_s:
+            time.sleep(self.batch_delay_s)
+        if source is None:
+            with self._lock:
+                batch.update(status="failed", failed_at=int(time.time()),
+                             errors={"object": "list", "data": [{"code": "invalid_file", "message": "no such file"}]})
+            return
+        output, errors = [], []
+        for line in source["data"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            record = {"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request.get("custom_id"), "error": None}
+            if self.error_rate and random.random() < self.error_rate:
+                record["response"] = {"status_code": 500, "request_id": uuid.uuid4().hex,
+                                      "body": {"error": {"message": "stub error", "type": "server_error"}}}
+                errors.append(record)
+            else:
+                record["response"] = {"status_code": 200, "request_id": uuid.uuid4().hex,
+                                      "body": self.completion(request.get("body") or {})}
+                output.append(record)
+        self._count("batch_requests", len(output) + len(errors))
+        self._count("errors", len(errors))
+
+        def store(records) -> Optional[str]:
+            if not records:
+                return None
+            data = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+            return self.upload((f"{batch_id}_output.jsonl", "batch_output", data))["id"]
+
+        output_file_id, error_file_id = store(output), store(errors)
+        with self._lock:
+            batch.update(
+                status="completed", output_file_id=output_file_id, error_file_id=error_file_id,
+                completed_at=int(time.time()),
+                request_counts={"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)},
+            )
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every completion")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of completions that return 500")
+    args = parser.parse_args()
+    server = StubLLMServer(port=args.port, latency_s=args.latency, error_rate=args.error_rate).start()
+    print(f"Stub LLM listening on {server.url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -5,12 +5,17 @@ Command Line Interface for the Email Agent
 
 import argparse
 import sys
-from agent.email_agent import EmailAgent
-from config import setup_environment, get_google_credentials_path, get_token_path, validate_config
+
+# The agent, Gmail and OpenAI modules are imported only once a command actually
+# needs them, so `--help` and argument errors return immediately.
 
 
 def main():
     """Main CLI function"""
+    if len(sys.argv) > 1 and sys.argv[1] == "campaign":
+        campaign_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description="AI Email Agent - Send emails using natural language prompts",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -19,6 +24,8 @@ Examples:
   python cli.py "Send a professional email to john@example.com about the meeting"
   python cli.py "Draft a friendly email to friend@gmail.com inviting them to dinner"
   python cli.py --interactive
+  python cli.py campaign recipients.csv "Announce our new pricing" --draft
+  python cli.py campaign leads.csv "Pitch our API to {{company}}" --batch
         """
     )
     
@@ -40,6 +47,30 @@ Examples:
         help="Create draft instead of sending"
     )
     
+    parser.add_argument(
+        "--fused",
+        action="store_true",
+        help="Parse and draft in a single LLM call (faster)"
+    )
+    
+    parser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="Start drafting while the prompt is still being parsed"
+    )
+    
+    parser.add_argument(
+        "--accounts",
+        action="append",
+        help="Token file or glob of a sending account (repeatable); spreads sends across accounts"
+    )
+    
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Show per-stage timings and token usage"
+    )
+    
     parser.add_argument(
         "--verbose", "-v",
         action="store_true",
@@ -48,24 +79,9 @@ Examples:
     
     args = parser.parse_args()
     
-    # Set up environment
-    try:
-        setup_environment()
-        validate_config()
-    except ValueError as e:
-        print(f"❌ Configuration error: {e}")
-        sys.exit(1)
-    
     # Create agent
-    try:
-        agent = EmailAgent(
-            client_secret_path=get_google_credentials_path(),
-            token_path=get_token_path()
-        )
-        print(f"✅ Email Agent initialized (Sender: {agent.sender})")
-    except Exception as e:
-        print(f"❌ Failed to initialize Email Agent: {e}")
-        sys.exit(1)
+    agent = create_agent(fused=args.fused, speculative=args.speculative, instrument=args.timings,
+                         accounts=args.accounts)
     
     # Interactive mode
     if args.interactive:
@@ -89,6 +105,104 @@ Examples:
     print_result(result, args.verbose)
 
 
+def create_agent(accounts=None, **kwargs):
+    """Set up the environment and create an EmailAgent, exiting on failure.
+    accounts: token paths / globs for a multi-account sender pool"""
+    from config import setup_environment, get_google_credentials_path, get_token_path, validate_config
+    
+    try:
+        setup_environment()
+        validate_config()
+    except ValueError as e:
+        print(f"❌ Configuration error: {e}")
+        sys.exit(1)
+    
+    try:
+        from agent.email_agent import EmailAgent
+        
+        if accounts:
+            from tools.sender_pool import SenderPool
+            kwargs["sender_pool"] = SenderPool.from_token_paths(accounts, get_google_credentials_path())
+        
+        agent = EmailAgent(
+            client_secret_path=get_google_credentials_path(),
+            token_path=get_token_path(),
+            **kwargs
+        )
+        if agent.sender_pool is not None:
+            senders = ", ".join(a.email for a in agent.sender_pool.accounts)
+            print(f"✅ Email Agent initialized (Senders: {senders})")
+        else:
+            print(f"✅ Email Agent initialized (Sender: {agent.sender})")
+    except Exception as e:
+        print(f"❌ Failed to initialize Email Agent: {e}")
+        sys.exit(1)
+    return agent
+
+
+def campaign_main(argv):
+    """Mail-merge a CSV of recipients from one drafted email (or one per row with --batch)"""
+    parser = argparse.ArgumentParser(
+        prog="cli.py campaign",
+        description="Draft one email and mail-merge it to every row of a CSV. "
+                    "Use {{name}} or {{column}} placeholders; the CSV is streamed in chunks. "
+                    "With --batch every row gets its own draft, written offline by the OpenAI Batch API."
+    )
+    parser.add_argument("csv", help="CSV file with one recipient per row")
+    parser.add_argument("instruction", help="What the email should say")
+    parser.add_argument("--subject", help="Subject line (default: drafted by the AI)")
+    parser.add_argument("--tone", default="professional, friendly", help="Tone of the email")
+    parser.add_argument("--email-column", default="email", help="CSV column with the address")
+    parser.add_argument("--name-column", default="name", help="CSV column with the recipient name")
+    parser.add_argument("--attach", action="append", default=[], help="Attachment path (repeatable)")
+    parser.add_argument("--chunksize", type=int, default=500, help="CSV rows read per chunk")
+    parser.add_argument("--draft", "-d", action="store_true", help="Create drafts instead of sending")
+    parser.add_argument("--plain", action="store_true", help="Send plain text only")
+    parser.add_argument("--dry-run", action="store_true", help="Build messages without sending")
+    parser.add_argument("--batch", action="store_true",
+                        help="Draft every row separately through the OpenAI Batch API (cheaper, slower)")
+    parser.add_argument("--batch-dir", default="campaign_batch",
+                        help="Where batch input files and the resume manifest are kept")
+    parser.add_argument("--poll", type=float, help="Seconds between batch status checks")
+    parser.add_argument("--timeout", type=float, help="Give up waiting for batches after this many seconds")
+    args = parser.parse_args(argv)
+    
+    from tools.campaign import run_campaign, run_batch_campaign
+    
+    agent = create_agent()
+    kwargs = dict(
+        sender=agent.sender,
+        tone=args.tone,
+        subject=args.subject,
+        action="draft" if args.draft else "send",
+        email_column=args.email_column,
+        name_column=args.name_column,
+        attachments=args.attach,
+        use_html=not args.plain,
+        chunksize=args.chunksize,
+        dry_run=args.dry_run,
+    )
+    if args.batch:
+        if args.poll is not None:
+            kwargs["poll_s"] = args.poll
+        try:
+            stats = run_batch_campaign(agent.service, args.csv, args.instruction,
+                                       work_dir=args.batch_dir, timeout=args.timeout, **kwargs)
+        except TimeoutError as e:
+            pending = getattr(e, "pending", None)
+            print(f"\n⏳ Timed out after {args.timeout:g}s; still running: {', '.join(pending) if pending else e}")
+            print("   Delivered rows are saved in the manifest; re-run the same command to resume.")
+            sys.exit(1)
+        print(f"\n📦 Batches: {', '.join(stats['batches']) or '-'}  Requests written: {stats['requests']}")
+    else:
+        stats = run_campaign(agent.service, args.csv, args.instruction, **kwargs)
+        print(f"\n📋 Subject: {stats['subject']}")
+    print(f"✅ Built: {stats['built']}  Sent: {stats['sent']}  Drafted: {stats['drafted']}")
+    print(f"⏭️  Skipped: {stats['skipped']}  ❌ Failed: {stats['failed']}")
+    for err in stats["errors"][:10]:
+        print(f"   - {err['to']}: {err['error']}")
+
+
 def run_interactive_mode(agent, verbose=False):
     """Run the agent in interactive mode"""
     print("\n🤖 AI Email Agent - Interactive Mode")
@@ -109,8 +223,10 @@ def run_interactive_mode(agent, verbose=False):
             if not prompt:
                 continue
             
-            result = agent.run(prompt)
-            print_result(result, verbose)
+            printer = DraftStreamPrinter()
+            result = agent.run(prompt, on_draft_event=printer)
+            printer.finish()
+            print_result(result, verbose, streamed=printer.started)
             
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
@@ -119,19 +235,40 @@ def run_interactive_mode(agent, verbose=False):
             print(f"❌ Error: {e}")
 
 
-def print_result(result, verbose=False):
+class DraftStreamPrinter:
+    """Render a draft live as it streams from the writer model"""
+    
+    def __init__(self):
+        self.started = False
+    
+    def __call__(self, field, text):
+        if field == "subject":
+            self.started = True
+            print(f"\n📋 Subject: {text}")
+            print("-" * 40)
+        elif field == "plain":
+            self.started = True
+            print(text, end="", flush=True)
+    
+    def finish(self):
+        if self.started:
+            print("\n" + "-" * 40)
+
+
+def print_result(result, verbose=False, streamed=False):
     """Print the result in a formatted way"""
     if result["ok"]:
         print(f"\n✅ Success: Email {result['mode']}")
         print(f"📧 To: {result['to']}")
         print(f"📋 Subject: {result['subject']}")
         
-        if verbose:
+        # A streamed body has already been rendered live
+        if verbose and not streamed:
             print(f"📄 Full content:")
             print("-" * 40)
             print(result['preview']['plain'])
             print("-" * 40)
-        else:
+        elif not streamed:
             print(f"📄 Preview: {result['preview']['plain'][:150]}...")
         
         if result['mode'] == 'draft':
@@ -142,6 +279,19 @@ def print_result(result, verbose=False):
         print(f"\n❌ Error: {result['error']}")
         if verbose and 'parsed' in result:
             print(f"🔍 Parsed data: {result['parsed']}")
+    
+    if 'instrumentation' in result:
+        print_instrumentation(result['instrumentation'])
+
+
+def print_instrumentation(info):
+    """Print stage timings, token usage and retry counters"""
+    timings = "  ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in info['timings'].items())
+    print(f"⏱️  {timings}")
+    for stage, usage in info['usage'].items():
+        print(f"🔢 {stage}: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens")
+    if info['counters']:
+        print("🔁 " + "  ".join(f"{k}={v}" for k, v in info['counters'].items()))
 
 
 if __name__ == "__main__":
@@ -24,6 +24,10 @@ OPENAI_API_KEY = "bb13adc6deb74e9eb2ff033941bd7a34"
 OPENAI_API_BASE = "https://api.aimlapi.com/v1"
 PARSER_MODEL = "openai/gpt-4o"
 WRITER_MODEL = "openai/gpt-4o"
+# Optional: route across several models by measured latency, e.g.
+# "openai/gpt-4o-mini@2000,openai/gpt-4o" (see tools/model_router.py)
+PARSER_MODELS = ""
+WRITER_MODELS = ""
 
 # Email Configuration
 DEFAULT_TONE = "professional, friendly"
@@ -35,17 +39,24 @@ RATE_LIMIT_BACKOFF = 1.5
 ATTACHMENTS_DIR = PROJECT_ROOT / "attachments"
 LOGS_DIR = PROJECT_ROOT / "logs"
 
-# Create directories if they don't exist
-ATTACHMENTS_DIR.mkdir(exist_ok=True)
-LOGS_DIR.mkdir(exist_ok=True)
+
+def ensure_directories():
+    """Create the attachments and logs directories if they don't exist"""
+    ATTACHMENTS_DIR.mkdir(exist_ok=True)
+    LOGS_DIR.mkdir(exist_ok=True)
 
 
 def setup_environment():
     """Set up environment variables from config"""
+    ensure_directories()
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
     os.environ["OPENAI_API_BASE"] = OPENAI_API_BASE
     os.environ["PARSER_MODEL"] = PARSER_MODEL
     os.environ["WRITER_MODEL"] = WRITER_MODEL
+    if PARSER_MODELS:
+        os.environ["PARSER_MODELS"] = PARSER_MODELS
+    if WRITER_MODELS:
+        os.environ["WRITER_MODELS"] = WRITER_MODELS
 
 
 def get_google_credentials_path():
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+HTTP service mode for the Email Agent.
+
+Keeps one warm EmailAgent (credentials, Gmail service and pooled LLM clients
+are built once) and serves JSON requests concurrently:
+
+  POST /compose  {"prompt": "..."}                       -> parsed fields + draft, nothing sent
+  POST /send     {"prompt": "...", "use_html": true,
+                  "idempotency_key": "...",
+                  "from_domain": "..."}                  -> EmailAgent.run result, or 202 + job id
+  GET  /jobs/ID  result of a /send that outlived the request timeout (202 while running)
+  GET  /metrics  Prometheus text format
+  GET  /healthz  queue depth (plus per-account quota with --accounts and
+                 per-model latency with PARSER_MODELS / WRITER_MODELS)
+
+Requests are handed to a fixed worker pool through a bounded queue; when the
+queue is full the server answers 503 with Retry-After instead of piling up work.
+A /send still running after the request timeout can't be called back (it may
+be about to send), so it answers 202 with a job id to poll instead. Retrying a
+/send with the same idempotency_key returns that job rather than running it again.
+
+With --outbox, /send only enqueues; a background thread drains the outbox after
+each enqueue and every SERVER_OUTBOX_POLL seconds (for retries and rows left by
+a previous run).
+
+  python server.py --port 8080 --workers 8 --queue-size 64
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tools import instrumentation
+from tools.metrics import Registry
+from tools.model_router import router_stats
+
+# The agent, Gmail and OpenAI modules are imported in main(), so --help is instant.
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "8"))
+SERVER_QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", "64"))
+SERVER_REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", "120"))
+SERVER_OUTBOX_POLL = float(os.getenv("SERVER_OUTBOX_POLL", "5"))
+MAX_BODY_BYTES = 64 * 1024
+# Finished /send jobs kept for /jobs/ID and idempotency_key retries
+JOBS_KEPT = 1000
+
+REGISTRY = Registry(prefix="email_agent_")
+REQUESTS = REGISTRY.counter("requests_total", "HTTP requests by endpoint and status code", ["endpoint", "status"])
+REQUEST_SECONDS = REGISTRY.histogram("request_seconds", "End-to-end request latency", ["endpoint"])
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("queue_wait_seconds", "Time a request waited for a worker")
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Time spent per pipeline stage", ["stage"])
+REJECTED = REGISTRY.counter("rejected_total", "Requests rejected because the queue was full")
+ERRORS = REGISTRY.counter("errors_total", "Requests that raised, by endpoint", ["endpoint"])
+TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens used", ["stage", "kind"])
+GMAIL_RETRIES = REGISTRY.counter("gmail_retries_total", "Gmail send retries after rate limiting")
+LLM_REROUTES = REGISTRY.counter("llm_reroutes_total", "LLM requests hedged or failed over to another model",
+                                ["kind"])
+SPECULATIVE = REGISTRY.counter("speculative_drafts_total", "Speculative drafts by outcome", ["outcome"])
+QUEUE_DEPTH = REGISTRY.gauge("queue_depth", "Requests waiting for a worker")
+IN_FLIGHT = REGISTRY.gauge("in_flight", "Requests being processed by a worker")
+QUEUE_CAPACITY = REGISTRY.gauge("queue_capacity", "Size of the bounded request queue")
+WORKERS = REGISTRY.gauge("workers", "Worker threads")
+
+
+class WorkQueue:
+    """Fixed pool of worker threads fed by a bounded queue"""
+
+    def __init__(self, workers, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"agent-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn):
+        """Return a Future, or None when the queue is full"""
+        future = Future()
+        try:
+            self._queue.put_nowait((fn, future, time.perf_counter()))
+        except queue.Full:
+            return None
+        return future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            fn, future, enqueued = item
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued)
+            if not future.set_running_or_notify_cancel():
+                continue
+            IN_FLIGHT.inc()
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                IN_FLIGHT.dec()
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+
+
+def _record_instrumentation(result):
+    info = result.get("instrumentation")
+    if not info:
+        return
+    for stage, usage in info["usage"].items():
+        if stage == "total":
+            continue
+        TOKENS.inc(usage["prompt_tokens"], stage=stage, kind="prompt")
+        TOKENS.inc(usage["completion_tokens"], stage=stage, kind="completion")
+    retries = info["counters"].get("gmail_retries")
+    if retries:
+        GMAIL_RETRIES.inc(retries)
+    for kind in ("hedges", "failovers"):
+        n = info["counters"].get(f"llm_{kind}")
+        if n:
+            LLM_REROUTES.inc(n, kind=kind)
+    for outcome in ("kept", "redrafted", "unused", "skipped"):
+        n = info["counters"].get(f"speculative_{outcome}")
+        if n:
+            SPECULATIVE.inc(n, outcome=outcome)
+
+
+class EmailAgentService:
+    """Request handling on top of a warm EmailAgent"""
+
+    def __init__(self, agent, *, workers=SERVER_WORKERS, queue_size=SERVER_QUEUE_SIZE,
+                 request_timeout=SERVER_REQUEST_TIMEOUT, outbox_poll=SERVER_OUTBOX_POLL):
+        self.agent = agent
+        self.request_timeout = request_timeout
+        self.outbox_poll = outbox_poll
+        self.work = WorkQueue(workers, queue_size)
+        QUEUE_DEPTH.set_function(self.work.depth)
+        QUEUE_CAPACITY.set(queue_size)
+        WORKERS.set(workers)
+        self._jobs = OrderedDict()  # job id -> (Future, idempotency key)
+        self._job_keys = {}  # idempotency key -> job id
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._drain_wake = threading.Event()
+        self._drainer = None
+        if agent.outbox is not None:
+            self._drainer = threading.Thread(target=self._drain_loop, name="outbox-drain", daemon=True)
+            self._drainer.start()
+
+    def _drain_loop(self):
+        """Send what /send enqueued: right after an enqueue, else every outbox_poll seconds"""
+        while not self._stopping.is_set():
+            self._drain_wake.clear()
+            try:
+                self.agent.drain_outbox()
+            except Exception as e:
+                print(f"⚠️ Outbox drain failed: {e}")
+            self._drain_wake.wait(self.outbox_poll)
+
+    def shutdown(self):
+        self._stopping.set()
+        self._drain_wake.set()
+        self.work.shutdown()
+        if self._drainer is not None:
+            self._drainer.join(timeout=5)
+
+    def compose(self, body):
+        composed = self.agent.compose(body["prompt"])
+        if composed["drafted"] is None:
+            return {"ok": False, "error": "No recipient email found in the prompt.", "parsed": composed["parsed"]}
+        return {"ok": True, **composed}
+
+    def send(self, body):
+        result = self.agent.run(
+            body["prompt"],
+            default_use_html=body.get("use_html", True),
+            idempotency_key=body.get("idempotency_key"),
+            from_domain=body.get("from_domain"),
+        )
+        if result.get("mode") == "queued":
+            self._drain_wake.set()
+        return result
+
+    def _job(self, endpoint, fn, body):
+        try:
+            result = fn(body)
+        except Exception:
+            ERRORS.inc(endpoint=endpoint)
+            raise
+        _record_instrumentation(result)
+        return result
+
+    def _outcome(self, future, timeout):
+        """(status, payload) of a finished job; raises FutureTimeout while it runs"""
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeout:
+            raise
+        except Exception as e:
+            from tools.sender_pool import NoSenderAvailable
+
+            return (503 if isinstance(e, NoSenderAvailable) else 500), {"ok": False, "error": str(e)}
+        return (200 if result.get("ok") else 422), result
+
+    def _track(self, future, key):
+        job_id = uuid.uuid4().hex
+        with self._jobs_lock:
+            self._jobs[job_id] = (future, key)
+            if key:
+                self._job_keys[key] = job_id
+            while len(self._jobs) > JOBS_KEPT:
+                _, (_, old_key) = self._jobs.popitem(last=False)
+                if old_key and self._job_keys.get(old_key) not in self._jobs:
+                    del self._job_keys[old_key]
+        return job_id
+
+    def job_status(self, job_id, wait=0.0):
+        """(status, payload) of a /send job: its result, or 202 while it is still running"""
+        with self._jobs_lock:
+            entry = self._jobs.get(job_id)
+        if entry is None:
+            return 404, {"ok": False, "error": f"Unknown job {job_id}"}
+        try:
+            status, payload = self._outcome(entry[0], wait)
+        except FutureTimeout:
+            return 202, {"ok": None, "status": "running", "job_id": job_id, "poll": f"/jobs/{job_id}"}
+        return status, dict(payload, job_id=job_id)
+
+    def handle(self, endpoint, body):
+        """Run endpoint on a worker; return (status, payload)"""
+        if not isinstance(body, dict) or not str(body.get("prompt") or "").strip():
+            return 400, {"ok": False, "error": "Body must be a JSON object with a non-empty 'prompt'."}
+
+        key = str(body.get("idempotency_key") or "") if endpoint == "/send" else ""
+        if key:
+            with self._jobs_lock:
+                job_id = self._job_keys.get(key)
+            if job_id is not None:
+                return self.job_status(job_id, wait=self.request_timeout)
+
+        fn = self.compose if endpoint == "/compose" else self.send
+        future = self.work.submit(lambda: self._job(endpoint, fn, body))
+        if future is None:
+            REJECTED.inc()
+            return 503, {"ok": False, "error": "Server busy, retry later."}
+        if endpoint == "/send":
+            return self.job_status(self._track(future, key), wait=self.request_timeout)
+        try:
+            return self._outcome(future, self.request_timeout)
+        except FutureTimeout:
+            # Composing has no side effects, so a late compose is simply dropped
+            future.cancel()
+            return 504, {"ok": False, "error": f"Timed out after {self.request_timeout:.0f}s."}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EmailAgent/1.0"
+
+    def log_message(self, format, *args):
+        if os.getenv("SERVER_ACCESS_LOG", "0") == "1":
+            super().log_message(format, *args)
+
+    def _send(self, status, payload, content_type="application/json", headers=None):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _finish(self, endpoint, status, started, payload, **kwargs):
+        self._send(status, payload, **kwargs)
+        REQUESTS.inc(endpoint=endpoint, status=str(status))
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    def do_GET(self):
+        started = time.perf_counter()
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/jobs/"):
+            status, payload = self.server.service.job_status(path[len("/jobs/"):])
+            self._finish("/jobs", status, started, payload)
+        elif path == "/metrics":
+            self._send(200, REGISTRY.render().encode("utf-8"), content_type="text/plain; version=0.0.4")
+        elif path == "/healthz":
+            payload = {"ok": True, "queue_depth": self.server.service.work.depth()}
+            agent = self.server.service.agent
+            if agent.sender_pool is not None:
+                payload["accounts"] = agent.sender_pool.stats()
+            if agent.outbox is not None:
+                payload["outbox"] = agent.outbox.stats()
+            models = router_stats()
+            if models:
+                payload["models"] = models
+            self._send(200, payload)
+        else:
+            self._send(404, {"ok": False, "error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        path = self.path.split("?", 1)[0]
+        if path not in ("/compose", "/send"):
+            # The body is left unread, so it must not be parsed as the next request
+            self.close_connection = True
+            return self._send(404, {"ok": False, "error": f"Unknown path {path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            return self._finish(path, 400, started, {"ok": False, "error": "Invalid Content-Length."})
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            return self._finish(path, 413, started, {"ok": False, "error": "Request body too large."})
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._finish(path, 400, started, {"ok": False, "error": "Invalid JSON."})
+
+        status, payload = self.server.service.handle(path, body)
+        headers = {"Retry-After": "1"} if status == 503 else None
+        self._finish(path, status, started, payload, headers=headers)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def create_server(agent, host=SERVER_HOST, port=SERVER_PORT, **service_kwargs):
+    """Bind an HTTP server around an existing (warm) agent"""
+    httpd = _Server((host, port), _Handler)
+    httpd.service = EmailAgentService(agent, **service_kwargs)
+    return httpd
+
+
+def _observe_stage(name, seconds, attrs):
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Email Agent as an HTTP service")
+    parser.add_argument("--host", default=SERVER_HOST, help="Bind address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Port (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker threads (default: %(default)s)")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE,
+                        help="Requests allowed to wait for a worker before 503 (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=SERVER_REQUEST_TIMEOUT,
+                        help="Seconds a request may take before 504 (default: %(default)s)")
+    parser.add_argument("--fused", action="store_true", help="Parse and draft in a single LLM call")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Start drafting while the prompt is still being parsed")
+    parser.add_argument("--batch-parse", action="store_true",
+                        help="Parse concurrent prompts together in one LLM call")
+    parser.add_argument("--outbox", help="SQLite outbox path; /send enqueues and a background thread sends")
+    parser.add_argument("--accounts", action="append",
+                        help="Token file or glob of a sending account (repeatable); spreads sends across accounts")
+    args = parser.parse_args()
+
+    from cli import create_agent
+
+    outbox = None
+    if args.outbox:
+        from tools.outbox import Outbox
+        outbox = Outbox(args.outbox)
+    agent = create_agent(fused=args.fused, speculative=args.speculative, batch_parse=args.batch_parse,
+                         outbox=outbox, instrument=True, accounts=args.accounts)
+    # Build credentials and Gmail clients before taking traffic
+    for account in (agent.sender_pool.accounts if agent.sender_pool else []):
+        account.service
+    if agent.sender_pool is None:
+        agent.service
+    instrumentation.add_hook(_observe_stage)
+
+    httpd = create_server(agent, args.host, args.port, workers=args.workers, queue_size=args.queue_size,
+                          request_timeout=args.timeout)
+    host, port = httpd.server_address[:2]
+    print(f"🚀 Email Agent listening on http://{host}:{port} "
+          f"({args.workers} workers, queue {args.queue_size}); metrics at /metrics")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Shutting down...")
+    finally:
+        httpd.server_close()
+        httpd.service.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
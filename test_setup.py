@@ -4,9 +4,14 @@ Test script to identify setup issues
 """
 
 import os
+import subprocess
 import sys
+import time
 from pathlib import Path
 
+# Wall-clock budget for `python cli.py --help`, in seconds
+CLI_STARTUP_BUDGET = float(os.getenv("CLI_STARTUP_BUDGET", "1.0"))
+
 def test_imports():
     """Test if all required modules can be imported"""
     print("🔍 Testing imports...")
@@ -108,6 +113,26 @@ def test_openai_client():
     
     return True
 
+def test_cli_startup():
+    """Test that the CLI starts within its time budget"""
+    print("\n🔍 Testing CLI startup time...")
+    
+    cli = Path(__file__).parent / "cli.py"
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, str(cli), "--help"], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    
+    if proc.returncode != 0:
+        print(f"❌ cli.py --help failed: {proc.stderr.strip()}")
+        return False
+    if elapsed > CLI_STARTUP_BUDGET:
+        print(f"❌ cli.py --help took {elapsed:.2f}s (budget {CLI_STARTUP_BUDGET:.2f}s)")
+        print("   Check for heavy imports at module level in cli.py or config.py")
+        return False
+    
+    print(f"✅ cli.py --help took {elapsed:.2f}s (budget {CLI_STARTUP_BUDGET:.2f}s)")
+    return True
+
 def main():
     """Run all tests"""
     print("🧪 Email Agent Setup Test")
@@ -118,6 +143,7 @@ def main():
         ("Configuration", test_config),
         ("Gmail Service", test_gmail_service),
         ("OpenAI Client", test_openai_client),
+        ("CLI Startup", test_cli_startup),
     ]
     
     results = []
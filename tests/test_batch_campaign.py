@@ -0,0 +1,155 @@
+# tests/test_batch_campaign.py
+"""
+run_batch_campaign end to end against bench/stub_llm.py and bench/fake_gmail.py,
+through a minimal urllib client for the /files and /batches endpoints.
+"""
+import json
+import os
+import urllib.request
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("pandas")
+
+from bench.fake_gmail import FakeGmailService  # noqa: E402
+from bench.stub_llm import StubLLMServer  # noqa: E402
+import cli  # noqa: E402
+import tools.campaign as campaign  # noqa: E402
+from tools.batch_drafts import BatchesPending  # noqa: E402
+from tools.campaign import run_batch_campaign  # noqa: E402
+
+INSTRUCTION = "Pitch our product to {{company}}"
+
+
+def _ns(obj):
+    if isinstance(obj, dict):
+        return SimpleNamespace(**{k: _ns(v) for k, v in obj.items()})
+    return obj
+
+
+class BatchClient:
+    """
+    The slice of the OpenAI client tools/batch_drafts.py uses. The first
+    `fail_first` batches get a bogus input file, so the stub fails them.
+    """
+
+    def __init__(self, base_url: str, fail_first: int = 0):
+        self.base_url = base_url
+        self.fail_first = fail_first
+        self.created = 0
+        self.files = SimpleNamespace(create=self._upload, content=self._content)
+        self.batches = SimpleNamespace(create=self._create, retrieve=self._retrieve)
+
+    def _request(self, path, data=None, content_type="application/json"):
+        headers = {"Content-Type": content_type} if data is not None else {}
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        with urllib.request.urlopen(req) as resp:
+            return resp.read()
+
+    def _upload(self, file, purpose):
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"purpose\"\r\n\r\n{purpose}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"input.jsonl\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + file.read() + f"\r\n--{boundary}--\r\n".encode()
+        return _ns(json.loads(self._request("/files", body, f"multipart/form-data; boundary={boundary}")))
+
+    def _content(self, file_id):
+        return SimpleNamespace(text=self._request(f"/files/{file_id}/content").decode("utf-8"))
+
+    def _create(self, **kwargs):
+        self.created += 1
+        if self.created <= self.fail_first:
+            kwargs["input_file_id"] = "file-missing"
+        return _ns(json.loads(self._request("/batches", json.dumps(kwargs).encode())))
+
+    def _retrieve(self, batch_id):
+        return _ns(json.loads(self._request(f"/batches/{batch_id}")))
+
+
+@pytest.fixture
+def stub():
+    with StubLLMServer() as server:
+        yield server
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "leads.csv"
+    rows = "".join(f"u{i}@x.com,User {i},Co{i}\n" for i in range(12))
+    path.write_text("email,name,company\n" + rows + ",nobody,\n", encoding="utf-8")
+    return str(path)
+
+
+def _run(csv_path, work_dir, client, service, **kwargs):
+    return run_batch_campaign(
+        service, csv_path, INSTRUCTION, work_dir=str(work_dir), client=client,
+        chunksize=5, max_requests=5, poll_s=0.05, timeout=30, **kwargs,
+    )
+
+
+def test_failed_batch_rows_are_resubmitted_and_resume_skips_delivered(stub, csv_path, tmp_path):
+    work_dir = tmp_path / "work"
+    service = FakeGmailService(seed=1)
+    client = BatchClient(stub.url, fail_first=1)
+
+    stats = _run(csv_path, work_dir, client, service)
+    assert (stats["sent"], stats["failed"], stats["skipped"]) == (12, 0, 1)
+    assert len(stats["batches"]) == 4  # three parts, then one retry of the failed part's rows
+    manifest = json.loads((work_dir / "manifest.json").read_text())
+    assert manifest["parts"][-1] == "retry-1.jsonl"
+    assert manifest["batch_ids"] == stats["batches"]
+    assert len(manifest["done"]) == 12
+
+    again = _run(csv_path, work_dir, client, service)
+    assert (again["sent"], again["failed"]) == (0, 0)
+    assert client.created == 4
+
+
+def test_rows_stay_failed_once_resubmits_run_out(stub, csv_path, tmp_path):
+    client = BatchClient(stub.url, fail_first=1)
+    stats = _run(csv_path, tmp_path / "work", client, FakeGmailService(seed=1), resubmits=0)
+    assert (stats["sent"], stats["failed"]) == (7, 5)
+    assert {e["error"] for e in stats["errors"]} == {"no result from the batch"}
+
+
+def test_dry_run_only_writes_inputs(stub, csv_path, tmp_path):
+    work_dir = tmp_path / "work"
+    client = BatchClient(stub.url)
+    stats = _run(csv_path, work_dir, client, FakeGmailService(seed=1), dry_run=True)
+    assert stats["requests"] == 12 and stats["batches"] == []
+    assert client.created == 0
+    assert sorted(os.listdir(work_dir)) == ["part-0.jsonl", "part-1.jsonl", "part-2.jsonl"]
+
+
+def test_header_injection_fails_only_its_row(stub, tmp_path):
+    path = tmp_path / "leads.csv"
+    path.write_text('email,name,company\n"a@x.com\nBcc: evil@x.com",A,Co\nb@x.com,B,Co\n', encoding="utf-8")
+    stats = _run(str(path), tmp_path / "work", BatchClient(stub.url), FakeGmailService(seed=1))
+    assert (stats["sent"], stats["failed"]) == (1, 1)
+
+
+def test_timeout_reports_pending_batches(csv_path, tmp_path):
+    with StubLLMServer(batch_delay_s=5) as slow:
+        with pytest.raises(BatchesPending) as exc:
+            run_batch_campaign(FakeGmailService(), csv_path, INSTRUCTION, work_dir=str(tmp_path / "work"),
+                               client=BatchClient(slow.url), poll_s=0.05, timeout=0.2)
+    manifest = json.loads((tmp_path / "work" / "manifest.json").read_text())
+    assert exc.value.pending == manifest["batch_ids"]
+
+
+def test_cli_timeout_exits_with_a_resume_hint(monkeypatch, capsys):
+    def timed_out(*args, **kwargs):
+        raise BatchesPending(["batch_abc"])
+
+    monkeypatch.setattr(cli, "create_agent", lambda: SimpleNamespace(sender=None, service=None))
+    monkeypatch.setattr(campaign, "run_batch_campaign", timed_out)
+    with pytest.raises(SystemExit) as exc:
+        cli.campaign_main(["leads.csv", INSTRUCTION, "--batch", "--timeout", "1"])
+    assert exc.value.code == 1
+    out = capsys.readouterr().out
+    assert "batch_abc" in out and "re-run the same command" in out
@@ -0,0 +1,22 @@
+# tests/test_cli_startup.py
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+CLI_STARTUP_BUDGET = float(os.getenv("CLI_STARTUP_BUDGET", "1.0"))
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_cli_help_within_budget():
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, str(ROOT / "cli.py"), "--help"], cwd=ROOT, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    assert proc.returncode == 0, proc.stderr
+    assert elapsed < CLI_STARTUP_BUDGET, (
+        f"cli.py --help took {elapsed:.2f}s (budget {CLI_STARTUP_BUDGET:.2f}s); "
+        "check for heavy imports at module level in cli.py or config.py"
+    )
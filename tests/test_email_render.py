@@ -0,0 +1,26 @@
+# tests/test_email_render.py
+import pytest
+
+from tools.email_render import _inline_html, _inline_plain
+
+
+@pytest.mark.parametrize("text, html_out, plain_out", [
+    (
+        "[x](https://ex.com/?q=**bold**) and **b**",
+        '<a href="https://ex.com/?q=**bold**">x</a> and <strong>b</strong>',
+        "x (https://ex.com/?q=**bold**) and b",
+    ),
+    (
+        "see [*Docs*](https://a.com/*x*)",
+        'see <a href="https://a.com/*x*"><em>Docs</em></a>',
+        "see Docs (https://a.com/*x*)",
+    ),
+    ("[y](javascript:alert(1)) *z*", "y <em>z</em>", "y z"),
+])
+def test_emphasis_never_rewrites_urls(text, html_out, plain_out):
+    assert _inline_html(text) == html_out
+    assert _inline_plain(text) == plain_out
+
+
+def test_placeholder_tokens_in_input_are_not_expanded():
+    assert _inline_html("a \x000\x00 [u](https://e.com)") == 'a 0 <a href="https://e.com">u</a>'
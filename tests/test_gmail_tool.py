@@ -0,0 +1,32 @@
+# tests/test_gmail_tool.py
+import email
+import os
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from tools.gmail_tool import write_message_file  # noqa: E402
+
+
+def test_spooled_message_round_trips_attachments(tmp_path):
+    blobs = {"a.bin": os.urandom(300_000), "b.txt": b"plain text attachment\n" * 100}
+    paths = []
+    for name, data in blobs.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        paths.append(str(path))
+    # Body text that looks like the old fixed splice token must stay in the body
+    body = "See attached. @@EMAIL_AGENT_ATTACHMENT_0@@"
+
+    with write_message_file(to="bob@x.com", subject="Files", body_text=body, attachments=paths,
+                            spool_bytes=64 * 1024) as fp:
+        msg = email.message_from_binary_file(fp)
+
+    attached = {p.get_filename(): p.get_payload(decode=True) for p in msg.walk() if p.get_filename()}
+    assert attached == blobs
+    texts = [
+        p.get_payload(decode=True).decode() for p in msg.walk()
+        if p.get_content_type() == "text/plain" and not p.get_filename()
+    ]
+    assert texts == [body]
@@ -0,0 +1,33 @@
+# tests/test_intent_parser.py
+import pytest
+
+from tools.intent_parser import fast_parse
+
+
+@pytest.mark.parametrize("prompt, action", [
+    ("Send an email to bob@x.com about the draft budget", "send"),
+    ("send: email to bob@x.com regarding the draft contract", "send"),
+    ("Email bob@x.com about the draft", None),  # no "to": deferred to the LLM
+    ("draft: email to bob@x.com about the Q3 report", "draft"),
+    ("Draft an email to bob@x.com about the budget", "draft"),
+])
+def test_action_comes_from_leading_verb(prompt, action):
+    data = fast_parse(prompt)
+    if action is None:
+        assert data is None
+    else:
+        assert data is not None
+        assert data["action"] == action
+        assert data["to_email"] == "bob@x.com"
+
+
+def test_cc_and_subject_are_not_taken_as_recipient():
+    data = fast_parse('draft: email to a@b.com cc c@d.com, e@f.com about launch, subject: "Launch day"')
+    assert data["to_email"] == "a@b.com"
+    assert data["cc"] == "c@d.com, e@f.com"
+    assert data["subject_override"] == "Launch day"
+
+
+def test_nuanced_prompts_defer_to_llm():
+    assert fast_parse("Send an email to my boss Jim at jim@x.com about the offsite") is None
+    assert fast_parse("What is the weather?") is None
@@ -0,0 +1,31 @@
+# tests/test_json_stream.py
+import json
+
+import pytest
+
+from tools.json_stream import JsonFieldStreamer
+
+TEXT = "Party 🎉 time — café 👍🏽!"
+
+
+def _feed(raw, size):
+    streamer = JsonFieldStreamer()
+    pieces = []
+    for i in range(0, len(raw), size):
+        pieces.extend(streamer.feed(raw[i:i + size]))
+    return streamer, pieces
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 7, 1000])
+def test_surrogate_pairs_combine_across_chunks(size):
+    raw = json.dumps({"subject": TEXT, "n": 1, "plain": "ok"})  # ensure_ascii writes emoji as \uXXXX surrogate pairs
+    assert "\\ud83c" in raw
+    streamer, pieces = _feed(raw, size)
+    assert streamer.values == {"subject": TEXT, "plain": "ok"}
+    assert "".join(text for key, text in pieces if key == "subject") == TEXT
+
+
+def test_lone_surrogates_become_replacement_characters():
+    streamer, _ = _feed('{"subject": "a\\ud83cb\\udc00c\\ud83c"}', 3)
+    assert streamer.values["subject"] == "a�b�c�"
+    "".join(streamer.values.values()).encode("utf-8")  # nothing unencodable leaks out
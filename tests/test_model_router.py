@@ -0,0 +1,41 @@
+# tests/test_model_router.py
+import time
+
+from tools.model_router import MIN_SAMPLES, ModelRouter
+
+
+def _router():
+    router = ModelRouter([("slow", None), ("fast", None)], hedge=True, hedge_budget=1.0, explore=0.0)
+    for _ in range(MIN_SAMPLES):
+        # Measured fastest, so "slow" ranks first; its 10ms p95 is the hedge deadline
+        router.record("slow", 0.01, True)
+        router.record("fast", 0.02, True)
+    return router
+
+
+def test_slow_primary_loses_to_the_hedge():
+    router = _router()
+    calls = []
+
+    def fn(model):
+        calls.append(model)
+        time.sleep(1.0 if model == "slow" else 0.01)
+        return model
+
+    t0 = time.perf_counter()
+    assert router.call(fn) == "fast"
+    assert time.perf_counter() - t0 < 0.5
+    assert calls == ["slow", "fast"]
+    assert router.stats()["hedges"] == 1
+
+
+def test_failed_primary_fails_over():
+    router = _router()
+
+    def fn(model):
+        if model == "slow":
+            raise RuntimeError("boom")
+        return model
+
+    assert router.call(fn) == "fast"
+    assert router.stats()["hedges"] == 0
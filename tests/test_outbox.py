@@ -0,0 +1,114 @@
+# tests/test_outbox.py
+import asyncio
+import subprocess
+import sys
+import threading
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import tools.outbox as outbox_mod  # noqa: E402
+from agent.async_email_agent import AsyncEmailAgent  # noqa: E402
+from bench.fake_gmail import FakeGmailService  # noqa: E402
+from tools.gmail_tool import create_message, send_message  # noqa: E402
+from tools.outbox import Outbox, drain, message_id_for  # noqa: E402
+
+
+def _message(key, to="bob@x.com"):
+    return create_message(to=to, subject="Hi", body_text="Hello", headers={"Message-ID": message_id_for(key)})
+
+
+def _dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return Outbox(str(tmp_path / "outbox.sqlite"), lease_s=300)
+
+
+def test_crash_after_gmail_accepted_is_recovered_without_resend(outbox):
+    gmail = FakeGmailService()
+    outbox.enqueue(_message("k1"), idempotency_key="k1", to="bob@x.com")
+    item = outbox.claim()
+    send_message(gmail, message={"raw": item["raw"]})  # reached Gmail, then the process died
+    outbox._db().execute("UPDATE outbox SET owner = ? WHERE id = ?", (f"{outbox._host}:{_dead_pid()}", item["id"]))
+
+    stats = drain(outbox, lambda: gmail, workers=2, poll_s=0.01)
+    assert stats["sent"] == 1 and stats["sending"] == 0
+    assert gmail.stats["sent"] == 1
+    assert outbox.get("k1")["gmail_id"] is not None
+
+
+def test_expired_lease_is_checked_against_gmail_first(tmp_path):
+    box = Outbox(str(tmp_path / "outbox.sqlite"), lease_s=0)
+    gmail = FakeGmailService()
+    box.enqueue(_message("k1"), idempotency_key="k1", to="bob@x.com")
+    first = box.claim()
+    assert first["recovering"] is False
+    send_message(gmail, message={"raw": first["raw"]})
+
+    again = box.claim()  # lease of 0s: another worker may take it over
+    assert again["id"] == first["id"] and again["recovering"] is True
+    outbox_mod._process(box, gmail, again)
+    assert box.get("k1")["status"] == "sent"
+    assert gmail.stats["sent"] == 1
+
+
+def test_repeat_within_dedupe_window_maps_to_the_same_row(outbox, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(outbox_mod.time, "time", lambda: now[0])
+    key, row = outbox.find_recent("base", window_s=3600)
+    assert row is None
+    outbox.enqueue(_message(key), idempotency_key=key, to="bob@x.com")
+
+    now[0] += 3000  # next bucket, still inside the window
+    again, row = outbox.find_recent("base", window_s=3600)
+    assert row is not None and row["idempotency_key"] == key
+
+    now[0] += 3600  # past the window: a new message
+    later, row = outbox.find_recent("base", window_s=3600)
+    assert row is None and later != key
+
+
+def test_two_workers_never_claim_the_same_row(outbox):
+    for i in range(60):
+        outbox.enqueue(_message(f"k{i}"), idempotency_key=f"k{i}", to=f"u{i}@x.com")
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = outbox.claim()
+            if item is None:
+                return
+            with lock:
+                claimed.append(item["id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(claimed) == 60 and len(set(claimed)) == 60
+
+
+def test_async_agent_enqueues_instead_of_sending(tmp_path, monkeypatch):
+    async def adraft(to_name, instruction, tone):
+        return {"subject": "Launch", "plain": "See you there.", "html": ""}
+
+    monkeypatch.setattr("agent.async_email_agent.adraft_email", adraft)
+    agent = AsyncEmailAgent(token_path=str(tmp_path / "token.json"), outbox=Outbox(str(tmp_path / "o.sqlite")))
+    gmail = FakeGmailService()
+    agent._service, agent._sender = gmail, "me@example.com"
+    try:
+        first = asyncio.run(agent.arun("Send an email to bob@x.com about the launch"))
+        again = asyncio.run(agent.arun("Send an email to bob@x.com about the launch"))
+    finally:
+        agent.close()
+    assert first["mode"] == "queued" and gmail.stats["sent"] == 0
+    assert again["outbox_id"] == first["outbox_id"]
+    assert agent.drain_outbox()["sent"] == 1
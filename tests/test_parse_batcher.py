@@ -0,0 +1,70 @@
+# tests/test_parse_batcher.py
+import asyncio
+import json
+import threading
+
+import tools.parse_batcher as pb
+from tools.parse_batcher import ParseBatcher, addresses_in_prompt
+
+
+def _swapped_answer(model, system, user, **kwargs):
+    # The model mixes up the first two prompts' recipients
+    items = [{"id": r["id"], "to_email": f"u{r['id']}@x.com", "tone": "formal"} for r in json.loads(user)]
+    items[0]["to_email"], items[1]["to_email"] = items[1]["to_email"], items[0]["to_email"]
+    return {"results": items}
+
+
+def _prompts(n):
+    return [f"Email u{i}@x.com about order {i}" for i in range(n)]
+
+
+def test_addresses_must_come_from_the_items_own_prompt():
+    assert addresses_in_prompt({"to_email": "a@x.com", "cc": "B@y.com"}, "send to A@x.com cc b@y.com")
+    assert not addresses_in_prompt({"to_email": "a@x.com"}, "send to c@x.com")
+    assert not addresses_in_prompt({"to_email": "a@x.com", "bcc": "z@x.com"}, "send to a@x.com")
+
+
+def test_mixed_up_items_are_parsed_alone(monkeypatch):
+    singles = []
+    monkeypatch.setattr(pb, "_chat_json", _swapped_answer)
+    monkeypatch.setattr(pb, "parse_prompt_to_fields",
+                        lambda prompt, fast_path=False: singles.append(prompt) or {"to_email": "single"})
+    batcher = ParseBatcher(window_ms=200, max_batch=3, fast_path=False)
+    prompts = _prompts(3)
+    out = {}
+    threads = [threading.Thread(target=lambda p=p: out.__setitem__(p, batcher.parse(p))) for p in prompts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(singles) == sorted(prompts[:2])
+    assert out[prompts[2]]["to_email"] == "u2@x.com"
+    assert batcher.stats()["fallbacks"] == 2
+    cache = pb.get_cache("parser")
+    if cache:  # batch answers are never cached
+        assert cache.get(pb.cache_key(pb.PARSER_MODEL, pb._PARSER_SYSTEM_PROMPT, prompts[2], 0)) is None
+
+
+def test_async_batches_stay_on_their_own_loop(monkeypatch):
+    async def answer(*args, **kwargs):
+        return _swapped_answer(*args, **kwargs)
+
+    async def single(prompt, fast_path=False):
+        return {"to_email": "single"}
+
+    monkeypatch.setattr(pb, "_achat_json", answer)
+    monkeypatch.setattr(pb, "aparse_prompt_to_fields", single)
+    batcher = ParseBatcher(window_ms=50, max_batch=10, fast_path=False)
+
+    async def burst():
+        return await asyncio.gather(*(batcher.aparse(p) for p in _prompts(3)))
+
+    results = {}
+    threads = [threading.Thread(target=lambda k=k: results.__setitem__(k, asyncio.run(burst()))) for k in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for fields in results.values():
+        assert [f["to_email"] for f in fields] == ["single", "single", "u2@x.com"]
+    assert batcher._apending == {} and batcher._ahandles == {}
@@ -0,0 +1,26 @@
+# tests/test_rate_limiter.py
+import pytest
+
+from tools.rate_limiter import QUOTA_COSTS, QuotaRateLimiter
+
+
+@pytest.mark.parametrize("path", [None, "bucket.sqlite"])
+def test_low_rate_still_allows_a_send(tmp_path, path):
+    limiter = QuotaRateLimiter(10, path=str(tmp_path / path) if path else None)
+    assert limiter.rate == 10 and limiter.capacity == QUOTA_COSTS["messages.send"]
+    assert limiter.try_acquire(QUOTA_COSTS["messages.send"]) == 0.0
+    # The next send waits for 100 units at the configured 10 units/s
+    assert limiter.try_acquire(QUOTA_COSTS["messages.send"]) == pytest.approx(10.0, abs=0.1)
+
+
+def test_shared_file_shares_one_budget(tmp_path):
+    path = str(tmp_path / "bucket.sqlite")
+    a, b = QuotaRateLimiter(250, path=path), QuotaRateLimiter(250, path=path)
+    assert a.try_acquire(200) == 0.0
+    assert b.try_acquire(100) > 0.0
+
+
+@pytest.mark.parametrize("rate, capacity", [(0, None), (-5, None), (250, 50)])
+def test_invalid_settings_raise_value_error(rate, capacity):
+    with pytest.raises(ValueError):
+        QuotaRateLimiter(rate, capacity)
@@ -0,0 +1,21 @@
+# tests/test_sender_pool.py
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from tools.credentials import save_token_meta  # noqa: E402
+from tools.sender_pool import SenderAccount, SenderPool  # noqa: E402
+
+
+def test_failed_build_releases_the_account(tmp_path, monkeypatch):
+    monkeypatch.setenv("GMAIL_RATE_LIMIT", "0")
+    token = str(tmp_path / "token.json")
+    save_token_meta(token, email="me@example.com")
+    pool = SenderPool([SenderAccount(token, "client_secret.json")])
+
+    def build(account):
+        raise ValueError("header may not contain CR or LF")
+
+    with pytest.raises(ValueError):
+        pool.deliver(build)
+    assert pool.accounts[0].in_flight == 0
@@ -0,0 +1,47 @@
+# tests/test_server_outbox.py
+import json
+import threading
+import time
+import urllib.request
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+import agent.email_agent as email_agent  # noqa: E402
+import server  # noqa: E402
+from bench.fake_gmail import FakeGmailService  # noqa: E402
+from tools.outbox import Outbox  # noqa: E402
+
+
+def _draft(to_name, instruction, tone):
+    return {"subject": "Launch", "plain": "See you there.", "html": "<p>See you there.</p>"}
+
+
+def test_enqueued_send_is_drained_by_the_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_agent, "draft_email", _draft)
+    agent = email_agent.EmailAgent(token_path=str(tmp_path / "token.json"),
+                                   outbox=Outbox(str(tmp_path / "outbox.sqlite")))
+    gmail = FakeGmailService()
+    agent._service, agent._sender = gmail, "me@example.com"
+
+    httpd = server.create_server(agent, "127.0.0.1", 0, workers=2, outbox_poll=30)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        host, port = httpd.server_address[:2]
+        body = json.dumps({"prompt": "Send an email to bob@x.com about the launch", "idempotency_key": "k1"})
+        req = urllib.request.Request(f"http://{host}:{port}/send", data=body.encode(),
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req) as resp:
+            result = json.loads(resp.read())
+        assert result["mode"] == "queued"
+
+        deadline = time.monotonic() + 5
+        while agent.outbox.get("k1")["status"] != "sent" and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert agent.outbox.get("k1")["status"] == "sent"
+        assert gmail.stats["sent"] == 1
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        httpd.service.shutdown()
@@ -0,0 +1,125 @@
+# tools/attachment_cache.py
+"""
+Cache of base64-encoded attachment parts.
+
+When one file is attached to thousands of messages, reading, MIME-type guessing
+and base64 encoding it per message dominates CPU. Entries are keyed by
+(absolute path, size, mtime), so an edited file is re-encoded. The in-memory
+tier is an LRU bounded by encoded bytes; with a spill_dir, evicted entries are
+written to disk and read back instead of re-encoded.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+from typing import Dict, Optional, Tuple
+
+
+_Key = Tuple[str, int, int]
+
+
+def _guess_mime_type(path: str) -> Tuple[str, str]:
+    ctype, encoding = mimetypes.guess_type(path)
+    if ctype is None or encoding is not None:
+        ctype = "application/octet-stream"
+    maintype, subtype = ctype.split("/", 1)
+    return maintype, subtype
+
+
+class AttachmentCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, spill_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> (maintype, subtype, encoded payload)
+        self._memory: "OrderedDict[_Key, Tuple[str, str, str]]" = OrderedDict()
+        self._spilled: Dict[_Key, Tuple[str, str, str]] = {}  # key -> (maintype, subtype, spill file)
+        self._bytes = 0
+        self._stats = {"hits": 0, "spill_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _key(path: str) -> _Key:
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+    def _encoded(self, path: str) -> Tuple[str, str, str]:
+        key = self._key(path)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+            spilled = self._spilled.get(key)
+
+        if spilled is not None and os.path.exists(spilled[2]):
+            with open(spilled[2], "r", encoding="ascii") as f:
+                entry = (spilled[0], spilled[1], f.read())
+            stat = "spill_hits"
+        else:
+            maintype, subtype = _guess_mime_type(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            # Same encoding as email.encoders.encode_base64
+            encoded = base64.encodebytes(data).decode("ascii")
+            if not data.endswith(b"\n") and encoded.endswith("\n"):
+                encoded = encoded[:-1]
+            entry = (maintype, subtype, encoded)
+            stat = "misses"
+
+        with self._lock:
+            self._stats[stat] += 1
+            if key not in self._memory:
+                self._memory[key] = entry
+                self._bytes += len(entry[2])
+                self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        # Keep at least the newest entry, even if it alone exceeds max_bytes
+        while self._bytes > self.max_bytes and len(self._memory) > 1:
+            key, (maintype, subtype, encoded) = self._memory.popitem(last=False)
+            self._bytes -= len(encoded)
+            self._stats["evictions"] += 1
+            if self.spill_dir and key not in self._spilled:
+                name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest() + ".b64"
+                spill_path = os.path.join(self.spill_dir, name)
+                with open(spill_path, "w", encoding="ascii") as f:
+                    f.write(encoded)
+                self._spilled[key] = (maintype, subtype, spill_path)
+
+    def part(self, path: str) -> MIMEBase:
+        """
+        A fresh attachment part for `path`, built from the cached encoding.
+        """
+        maintype, subtype, encoded = self._encoded(path)
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(encoded)
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
+        return part
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return: {hits, spill_hits, misses, evictions, entries, bytes}
+        """
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = len(self._memory)
+            out["bytes"] = self._bytes
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, spill_path in self._spilled.values():
+                if os.path.exists(spill_path):
+                    os.remove(spill_path)
+            self._memory.clear()
+            self._spilled.clear()
+            self._bytes = 0
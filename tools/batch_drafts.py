@@ -0,0 +1,192 @@
+# tools/batch_drafts.py
+"""
+Offline drafting through the OpenAI Batch API, for campaigns that can wait.
+
+Writer requests are written to JSONL files in the batch input format, uploaded
+and submitted; results come back within the completion window (usually much
+sooner) at a fraction of the interactive cost, without spending the gateway's
+per-minute request budget.
+
+    writer = BatchInputWriter(work_dir)
+    writer.add(draft_request("row-1", "Ann", "..."))
+    writer.close()
+    batch_ids = [submit_batch(path) for path in writer.paths]
+    batches = wait_for_batches(batch_ids)
+    for custom_id, drafted, error in iter_batch_results(batches[batch_ids[0]]):
+        ...
+
+Works against any OpenAI-compatible gateway with /files and /batches
+(bench/stub_llm.py implements both for offline tests).
+
+Environment variables:
+  - LLM_BATCH_POLL (seconds between status checks, default 30)
+  - LLM_BATCH_WINDOW (completion window, default 24h)
+"""
+from __future__ import annotations
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tools import instrumentation
+from tools.email_writer import (
+    DEFAULT_TONE,
+    WRITER_MODEL,
+    _WRITER_SYSTEM_PROMPT,
+    _make_client,
+    _normalize_draft,
+    _writer_user_prompt,
+)
+
+LLM_BATCH_POLL = float(os.getenv("LLM_BATCH_POLL", "30"))
+LLM_BATCH_WINDOW = os.getenv("LLM_BATCH_WINDOW", "24h")
+# OpenAI accepts up to 50,000 requests per batch input file
+MAX_BATCH_REQUESTS = 50_000
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def draft_request(custom_id: str, to_name: str, instruction: str, tone: str = DEFAULT_TONE) -> Dict[str, Any]:
+    """
+    One batch input line asking WRITER_MODEL for the same draft draft_email would write.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": WRITER_MODEL,
+            "messages": [
+                {"role": "system", "content": _WRITER_SYSTEM_PROMPT},
+                {"role": "user", "content": _writer_user_prompt(to_name, instruction, tone)},
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.4,
+        },
+    }
+
+
+def submit_batch(path: str, *, metadata: Optional[Dict[str, str]] = None, client=None) -> str:
+    """
+    Upload a batch input file and start the batch. Returns the batch id.
+    """
+    client = client or _make_client()
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=LLM_BATCH_WINDOW,
+        **({"metadata": metadata} if metadata else {}),
+    )
+    print(f"📤 Submitted {os.path.basename(path)} as batch {batch.id}")
+    return batch.id
+
+
+class BatchesPending(TimeoutError):
+    """
+    Raised by wait_for_batches when the timeout passes; .pending lists the batch ids still running.
+    """
+
+    def __init__(self, pending: List[str]):
+        self.pending = list(pending)
+        super().__init__(f"{len(self.pending)} batch(es) still running: {', '.join(self.pending)}")
+
+
+def wait_for_batches(
+    batch_ids: Iterable[str],
+    *,
+    poll_s: float = LLM_BATCH_POLL,
+    timeout: Optional[float] = None,
+    client=None,
+) -> Dict[str, Any]:
+    """
+    Poll until every batch reaches a terminal status; returns {batch_id: batch}.
+    Raises BatchesPending (a TimeoutError) after `timeout` seconds; the batches keep running server-side.
+    """
+    client = client or _make_client()
+    pending = list(batch_ids)
+    done: Dict[str, Any] = {}
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        for batch_id in list(pending):
+            batch = client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                pending.remove(batch_id)
+                done[batch_id] = batch
+                print(f"📥 Batch {batch_id}: {batch.status} {_counts(batch)}")
+        if not pending:
+            return done
+        if deadline is not None and time.monotonic() + poll_s > deadline:
+            raise BatchesPending(pending)
+        time.sleep(poll_s)
+
+
+def _counts(batch: Any) -> str:
+    counts = getattr(batch, "request_counts", None)
+    if counts is None:
+        return ""
+    return f"({counts.completed}/{counts.total} completed, {counts.failed} failed)"
+
+
+def _error_text(record: Dict[str, Any]) -> str:
+    error = record.get("error") or ((record.get("response") or {}).get("body") or {}).get("error") or {}
+    if isinstance(error, dict):
+        return error.get("message") or error.get("code") or "request failed"
+    return str(error)
+
+
+def iter_batch_results(batch: Any, *, client=None) -> Iterator[Tuple[str, Optional[Dict[str, str]], Optional[str]]]:
+    """
+    Yield (custom_id, {subject, plain, html} or None, error or None) for every request of a
+    finished batch, successes first, then the error file.
+    """
+    client = client or _make_client()
+    for file_id in (getattr(batch, "output_file_id", None), getattr(batch, "error_file_id", None)):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record.get("custom_id", "")
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                yield custom_id, None, _error_text(record)
+                continue
+            body = response.get("body") or {}
+            instrumentation.record_usage(body.get("usage"), stage="batch_draft")
+            try:
+                data = json.loads(body["choices"][0]["message"]["content"])
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                yield custom_id, None, f"malformed completion: {e}"
+                continue
+            yield custom_id, _normalize_draft(data), None
+
+
+class BatchInputWriter:
+    """
+    Spread request lines over part-N.jsonl files of at most max_requests lines each.
+    """
+
+    def __init__(self, work_dir: str, max_requests: int = MAX_BATCH_REQUESTS):
+        self.work_dir = work_dir
+        self.max_requests = max_requests
+        self.paths: List[str] = []
+        self._file = None
+        self._lines = 0
+
+    def add(self, request: Dict[str, Any]) -> None:
+        if self._file is None or self._lines >= self.max_requests:
+            self.close()
+            path = os.path.join(self.work_dir, f"part-{len(self.paths)}.jsonl")
+            self._file = open(path, "w", encoding="utf-8")
+            self.paths.append(path)
+            self._lines = 0
+        self._file.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self._lines += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
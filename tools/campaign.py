@@ -0,0 +1,324 @@
+# tools/campaign.py
+from __future__ import annotations
+import json
+import os
+from email.errors import HeaderParseError
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from tools.attachment_cache import AttachmentCache
+from tools.batch_drafts import (
+    LLM_BATCH_POLL,
+    MAX_BATCH_REQUESTS,
+    BatchInputWriter,
+    draft_request,
+    iter_batch_results,
+    submit_batch,
+    wait_for_batches,
+)
+from tools.email_writer import draft_email, DEFAULT_TONE
+from tools.gmail_tool import send_messages_batch, create_drafts_batch, create_message, DEFAULT_BATCH_SIZE
+from tools.message_template import MessageTemplate, personalise
+
+
+MAX_REPORTED_ERRORS = 100
+
+
+def _add_error(stats: Dict[str, Any], to: str, error: Any, status: Any = None) -> None:
+    stats["failed"] += 1
+    if len(stats["errors"]) < MAX_REPORTED_ERRORS:
+        stats["errors"].append({"to": to, "status": status, "error": error})
+
+
+def draft_base_email(instruction: str, tone: str = DEFAULT_TONE, *, name_placeholder: str = "{{name}}") -> Dict[str, str]:
+    """
+    Draft the campaign email once, addressed to a placeholder instead of a real name.
+    """
+    instruction = (
+        f"{instruction}\n"
+        f"This is a mail-merge template: write the recipient name exactly as {name_placeholder} "
+        "and keep any other {{placeholders}} verbatim."
+    )
+    return draft_email(name_placeholder, instruction, tone)
+
+
+def run_campaign(
+    service,
+    csv_path: str,
+    instruction: str,
+    *,
+    sender: Optional[str] = None,
+    tone: str = DEFAULT_TONE,
+    subject: Optional[str] = None,
+    action: str = "send",
+    email_column: str = "email",
+    name_column: str = "name",
+    attachments: Optional[Iterable[str]] = None,
+    use_html: bool = True,
+    chunksize: int = 500,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Mail-merge a CSV: one LLM draft for the whole list, then per-row placeholder
+    substitution. The CSV is streamed in chunks of `chunksize` rows, so memory
+    stays bounded regardless of list size.
+    {{name}} resolves to `name_column` (or "there"); any other {{column}} to that CSV column.
+    Rows whose address or subject values contain line breaks count as failed.
+    With dry_run=True messages are built (and counted) but not sent.
+    Returns: {subject, built, sent, drafted, skipped, failed, errors}
+    """
+    assert action in ("send", "draft"), "action must be 'send' or 'draft'"
+    base = draft_base_email(instruction, tone)
+    base_subject = subject or base["subject"]
+    # The MIME tree (attachments included) is built and encoded once; rows only fill slots
+    template = MessageTemplate(
+        subject=base_subject,
+        body_html=base["html"] if use_html else None,
+        body_text=base["plain"],
+        attachments=attachments,
+        sender=sender,
+    )
+
+    stats: Dict[str, Any] = {"subject": base_subject, "built": 0, "sent": 0, "drafted": 0, "skipped": 0, "failed": 0, "errors": []}
+
+    reader = pd.read_csv(csv_path, chunksize=chunksize, dtype=str, keep_default_na=False)
+    for chunk_no, chunk in enumerate(reader):
+        assert email_column in chunk.columns, f"CSV has no '{email_column}' column"
+        rows, messages = [], []
+        for row in chunk.to_dict("records"):
+            to = (row.get(email_column) or "").strip()
+            if not to:
+                stats["skipped"] += 1
+                continue
+            row = dict(row)
+            row["name"] = (row.get(name_column) or "").strip() or "there"
+            try:
+                messages.append(template.render(to, row))
+            except ValueError as e:  # e.g. a line break in a value that ends up in a header
+                _add_error(stats, to, str(e))
+                continue
+            rows.append(to)
+
+        stats["built"] += len(messages)
+        if dry_run or not messages:
+            continue
+
+        batch_fn = create_drafts_batch if action == "draft" else send_messages_batch
+        for to, res in zip(rows, batch_fn(service, messages, batch_size=batch_size)):
+            if res["ok"]:
+                stats["drafted" if action == "draft" else "sent"] += 1
+            else:
+                _add_error(stats, to, res.get("error"), res.get("status"))
+        print(f"Chunk {chunk_no + 1}: {stats['sent'] + stats['drafted']} done, {stats['failed']} failed")
+
+    return stats
+
+
+def _load_manifest(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _batch_rows(
+    csv_path: str,
+    instruction: str,
+    tone: str,
+    *,
+    email_column: str,
+    name_column: str,
+    chunksize: int,
+) -> Iterator[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """
+    Yield (custom_id, address, draft request) per CSV row; the request is None for rows without an address.
+    Rows are numbered over the whole file, so ids are stable across runs.
+    """
+    row_no = 0
+    reader = pd.read_csv(csv_path, chunksize=chunksize, dtype=str, keep_default_na=False)
+    for chunk in reader:
+        assert email_column in chunk.columns, f"CSV has no '{email_column}' column"
+        for row in chunk.to_dict("records"):
+            row_no += 1
+            custom_id = f"row-{row_no}"
+            to = (row.get(email_column) or "").strip()
+            if not to:
+                yield custom_id, "", None
+                continue
+            row = dict(row)
+            row["name"] = (row.get(name_column) or "").strip() or "there"
+            yield custom_id, to, draft_request(custom_id, row["name"], personalise(instruction, row), tone)
+
+
+def run_batch_campaign(
+    service,
+    csv_path: str,
+    instruction: str,
+    *,
+    work_dir: str,
+    sender: Optional[str] = None,
+    tone: str = DEFAULT_TONE,
+    subject: Optional[str] = None,
+    action: str = "send",
+    email_column: str = "email",
+    name_column: str = "name",
+    attachments: Optional[Iterable[str]] = None,
+    use_html: bool = True,
+    chunksize: int = 500,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_requests: int = MAX_BATCH_REQUESTS,
+    poll_s: float = LLM_BATCH_POLL,
+    timeout: Optional[float] = None,
+    resubmits: int = 1,
+    dry_run: bool = False,
+    client=None,
+) -> Dict[str, Any]:
+    """
+    Like run_campaign, but every row gets its own draft: {{column}} placeholders in
+    `instruction` are filled from the row, and the drafts are written offline through
+    the OpenAI Batch API (see tools/batch_drafts.py). Finished drafts go straight to
+    message building and Gmail batch sends, `chunksize` messages at a time.
+    Rows left without a draft (an error result, or a failed or expired batch) are
+    submitted again in a new batch, up to `resubmits` times.
+    Submitted batches and delivered rows are recorded in work_dir/manifest.json after
+    every step; running again with the same work_dir submits what wasn't submitted,
+    resumes polling and skips rows already delivered.
+    With dry_run=True only the batch input files are written and counted.
+    Raises BatchesPending (a TimeoutError) when batches are still running after `timeout`.
+    Returns: {batches, requests, built, sent, drafted, skipped, failed, errors}
+    """
+    assert action in ("send", "draft"), "action must be 'send' or 'draft'"
+    os.makedirs(work_dir, exist_ok=True)
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    manifest = _load_manifest(manifest_path)
+    if manifest is not None:
+        assert manifest["csv"] == os.path.abspath(csv_path) and manifest["instruction"] == instruction, (
+            f"{work_dir} belongs to another campaign"
+        )
+        print(f"🔁 Resuming {len(manifest['batch_ids'])} batch(es) from {manifest_path}")
+    writer = BatchInputWriter(work_dir, max_requests) if manifest is None else None
+    rows = dict(email_column=email_column, name_column=name_column, chunksize=chunksize)
+
+    stats: Dict[str, Any] = {
+        "batches": [], "requests": 0, "built": 0, "sent": 0, "drafted": 0, "skipped": 0, "failed": 0, "errors": [],
+    }
+
+    recipients: Dict[str, str] = {}
+    for custom_id, to, request in _batch_rows(csv_path, instruction, tone, **rows):
+        if request is None:
+            stats["skipped"] += 1
+            continue
+        recipients[custom_id] = to
+        if writer is not None:
+            writer.add(request)
+            stats["requests"] += 1
+
+    if writer is not None:
+        writer.close()
+        if dry_run or not writer.paths:
+            return stats
+        manifest = {
+            "csv": os.path.abspath(csv_path), "instruction": instruction,
+            "parts": [os.path.basename(path) for path in writer.paths],
+            "batch_ids": [], "resubmits": 0, "done": [],
+        }
+        _save_manifest(manifest_path, manifest)
+    done: Set[str] = set(manifest["done"])
+    if dry_run:
+        stats["requests"] = len(set(recipients) - done)
+        return stats
+
+    def submit_parts() -> None:
+        # batch_ids[i] belongs to parts[i]; saved after each submit so a crash never submits a part twice
+        for part in manifest["parts"][len(manifest["batch_ids"]):]:
+            batch_id = submit_batch(
+                os.path.join(work_dir, part),
+                metadata={"campaign": os.path.basename(os.path.abspath(work_dir))},
+                client=client,
+            )
+            manifest["batch_ids"].append(batch_id)
+            _save_manifest(manifest_path, manifest)
+
+    cache = AttachmentCache() if attachments else None
+    pending: List[Tuple[str, Dict[str, Any]]] = []  # (custom_id, message)
+
+    def flush() -> None:
+        if not pending:
+            return
+        batch_fn = create_drafts_batch if action == "draft" else send_messages_batch
+        for (custom_id, _), res in zip(pending, batch_fn(service, [m for _, m in pending], batch_size=batch_size)):
+            if res["ok"]:
+                stats["drafted" if action == "draft" else "sent"] += 1
+                done.add(custom_id)
+            else:
+                _add_error(stats, recipients[custom_id], res.get("error"), res.get("status"))
+        pending.clear()
+        manifest["done"] = sorted(done)
+        _save_manifest(manifest_path, manifest)
+        print(f"📨 {stats['sent'] + stats['drafted']} done, {stats['failed']} failed")
+
+    drafted_ids: Set[str] = set()
+    draft_errors: Dict[str, str] = {}
+    waited: Set[str] = set()
+    while True:
+        submit_parts()
+        new_ids = [b for b in manifest["batch_ids"] if b not in waited]
+        batches = wait_for_batches(new_ids, poll_s=poll_s, timeout=timeout, client=client)
+        waited.update(new_ids)
+        for batch_id in new_ids:
+            for custom_id, drafted, error in iter_batch_results(batches[batch_id], client=client):
+                to = recipients.get(custom_id)
+                if to is None or custom_id in done or custom_id in drafted_ids:
+                    continue
+                if drafted is None:
+                    draft_errors[custom_id] = error
+                    continue
+                drafted_ids.add(custom_id)
+                draft_errors.pop(custom_id, None)
+                try:
+                    message = create_message(
+                        to=to,
+                        subject=subject or drafted["subject"],
+                        body_html=drafted["html"] if (use_html and drafted["html"]) else None,
+                        body_text=drafted["plain"],
+                        attachments=attachments,
+                        sender=sender,
+                        attachment_cache=cache,
+                    )
+                except (ValueError, HeaderParseError) as e:  # e.g. a header injected through the address or subject
+                    _add_error(stats, to, str(e))
+                    continue
+                pending.append((custom_id, message))
+                stats["built"] += 1
+                if len(pending) >= chunksize:
+                    flush()
+        flush()
+
+        # Error results and rows of failed or expired batches, which never come back
+        missing = {c for c in recipients if c not in done and c not in drafted_ids}
+        if not missing or manifest["resubmits"] >= resubmits:
+            break
+        manifest["resubmits"] += 1
+        part = f"retry-{manifest['resubmits']}.jsonl"
+        with open(os.path.join(work_dir, part), "w", encoding="utf-8") as f:
+            for custom_id, _, request in _batch_rows(csv_path, instruction, tone, **rows):
+                if custom_id in missing and request is not None:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        print(f"🔁 Resubmitting {len(missing)} row(s) without a draft")
+        stats["requests"] += len(missing)
+        manifest["parts"].append(part)
+        _save_manifest(manifest_path, manifest)
+
+    for custom_id in sorted(missing, key=lambda c: int(c.split("-")[1])):
+        _add_error(stats, recipients[custom_id], draft_errors.get(custom_id, "no result from the batch"))
+    stats["batches"] = list(manifest["batch_ids"])
+    return stats
@@ -0,0 +1,105 @@
+# tools/credentials.py
+"""
+Token-side caches that keep OAuth and profile lookups off the hot path.
+
+  - <token_path>.meta.json stores the sender address and token expiry next to
+    token.json, so an agent can start without a getProfile round-trip.
+  - CredentialRefresher refreshes the access token in a background thread a few
+    minutes before it expires, so no request ever waits on an OAuth refresh.
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+
+def token_meta_path(token_path: str) -> str:
+    return f"{token_path}.meta.json"
+
+
+def load_token_meta(token_path: str) -> Dict[str, Any]:
+    try:
+        with open(token_meta_path(token_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_token_meta(token_path: str, **fields: Any) -> Dict[str, Any]:
+    """
+    Merge fields into the sidecar file; returns the updated metadata.
+    """
+    meta = load_token_meta(token_path)
+    meta.update({k: v for k, v in fields.items() if v is not None})
+    tmp = token_meta_path(token_path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, token_meta_path(token_path))
+    return meta
+
+
+def save_credentials(creds, token_path: str) -> None:
+    """
+    Write token.json and record the expiry in the sidecar.
+    """
+    tmp = f"{token_path}.tmp"
+    with open(tmp, "w") as token:
+        token.write(creds.to_json())
+    os.replace(tmp, token_path)
+    expiry = creds.expiry.replace(tzinfo=timezone.utc).isoformat() if creds.expiry else None
+    save_token_meta(token_path, expiry=expiry)
+
+
+def seconds_until_expiry(creds) -> Optional[float]:
+    if not creds.expiry:
+        return None
+    # google-auth keeps expiry as a naive UTC datetime
+    return (creds.expiry.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+
+
+class CredentialRefresher:
+    """
+    Daemon thread that refreshes `creds` in place `margin_s` seconds before expiry
+    and persists the new token. Services built from the same creds object pick
+    up the new access token automatically.
+    """
+
+    def __init__(self, creds, token_path: str, *, margin_s: float = 300.0, retry_s: float = 30.0):
+        self.creds = creds
+        self.token_path = token_path
+        self.margin_s = margin_s
+        self.retry_s = retry_s
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "CredentialRefresher":
+        if self.creds.refresh_token and self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="token-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def refresh_now(self) -> None:
+        from google.auth.transport.requests import Request
+
+        with self.lock:
+            self.creds.refresh(Request())
+            save_credentials(self.creds, self.token_path)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            remaining = seconds_until_expiry(self.creds)
+            wait = 3600.0 if remaining is None else max(0.0, remaining - self.margin_s)
+            if self._stop.wait(wait):
+                return
+            try:
+                self.refresh_now()
+            except Exception as e:
+                print(f"Token refresh failed ({e}); retrying in {self.retry_s:.0f}s…")
+                if self._stop.wait(self.retry_s):
+                    return
@@ -0,0 +1,176 @@
+# tools/email_render.py
+"""
+Local rendering of the writer's lightweight markup into the html and plain parts.
+
+With LOCAL_HTML=1 the writer model returns one body instead of a plain and an
+html copy of the same text (about half the output tokens); this module builds
+both parts from it. Supported markup:
+
+    Paragraphs separated by blank lines
+    - bullet / * bullet
+    1. numbered item
+    **bold**, *italic*, [link text](https://example.com)
+
+Everything else is escaped, so model output can never inject tags, and only
+http(s) and mailto links are kept. {{placeholders}} pass through untouched.
+
+The html is wrapped in the branded template: EMAIL_HTML_TEMPLATE names an html
+file with {{content}} (and optionally {{subject}}) slots; a simple built-in
+layout is used otherwise.
+"""
+from __future__ import annotations
+import html
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+_BULLET_RE = re.compile(r"^\s*[-*•]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+_LINK_RE = re.compile(r"\[([^\]\n]+)\]\(((?:[^()\s]|\([^()\s]*\))+)\)")  # one level of (...) in URLs
+_BOLD_RE = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*")
+_ITALIC_RE = re.compile(r"(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?![\w*])")
+_SAFE_URL_RE = re.compile(r"^(?:https?://|mailto:)", re.I)
+_TOKEN_RE = re.compile(r"\x00(\d+)\x00")
+_SLOT_RE = re.compile(r"\{\{\s*(content|subject)\s*\}\}")
+
+_P_STYLE = "margin:0 0 16px;"
+_LIST_STYLE = "margin:0 0 16px;padding-left:24px;"
+
+DEFAULT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{{subject}}</title>
+</head>
+<body style="margin:0;padding:0;background:#f4f5f7;">
+<table role="presentation" width="100%" cellpadding="0" cellspacing="0" style="background:#f4f5f7;">
+<tr><td align="center" style="padding:24px 12px;">
+<table role="presentation" width="600" cellpadding="0" cellspacing="0" style="max-width:600px;width:100%;background:#ffffff;border-radius:6px;">
+<tr><td style="padding:32px;font-family:Arial,Helvetica,sans-serif;font-size:15px;line-height:1.6;color:#1f2933;">
+{{content}}
+</td></tr>
+</table>
+</td></tr>
+</table>
+</body>
+</html>
+"""
+
+_template_lock = threading.Lock()
+_template: Optional[str] = None
+
+
+def get_template() -> str:
+    """
+    The html wrapper: EMAIL_HTML_TEMPLATE's file if set, else DEFAULT_TEMPLATE. Read once.
+    """
+    global _template
+    with _template_lock:
+        if _template is None:
+            path = os.getenv("EMAIL_HTML_TEMPLATE")
+            if path:
+                with open(path, "r", encoding="utf-8") as f:
+                    _template = f.read()
+                assert "{{content}}" in _template.replace(" ", ""), f"{path} has no {{{{content}}}} slot"
+            else:
+                _template = DEFAULT_TEMPLATE
+        return _template
+
+
+def _with_links(text: str, link: Callable[["re.Match[str]"], str], emphasis: Callable[[str], str]) -> str:
+    # Links are swapped for \x00N\x00 tokens while emphasis is applied, so ** or * in a URL stays intact
+    links: List[str] = []
+
+    def stash(m: "re.Match[str]") -> str:
+        links.append(link(m))
+        return f"\x00{len(links) - 1}\x00"
+
+    text = emphasis(_LINK_RE.sub(stash, text.replace("\x00", "")))
+    return _TOKEN_RE.sub(lambda m: links[int(m.group(1))], text)
+
+
+def _emphasis_html(text: str) -> str:
+    text = _BOLD_RE.sub(r"<strong>\1</strong>", text)
+    return _ITALIC_RE.sub(r"<em>\1</em>", text)
+
+
+def _emphasis_plain(text: str) -> str:
+    text = _BOLD_RE.sub(r"\1", text)
+    return _ITALIC_RE.sub(r"\1", text)
+
+
+def _inline_html(text: str) -> str:
+    def link(m: "re.Match[str]") -> str:
+        label, url = _emphasis_html(m.group(1)), html.unescape(m.group(2))
+        if not _SAFE_URL_RE.match(url):
+            return label
+        return f'<a href="{html.escape(url)}">{label}</a>'
+
+    return _with_links(html.escape(text), link, _emphasis_html)
+
+
+def _inline_plain(text: str) -> str:
+    def link(m: "re.Match[str]") -> str:
+        label, url = _emphasis_plain(m.group(1)), m.group(2)
+        return label if label == url or not _SAFE_URL_RE.match(url) else f"{label} ({url})"
+
+    return _with_links(text, link, _emphasis_plain)
+
+
+def _blocks(markup: str) -> List[Tuple[str, List[str]]]:
+    """
+    Split markup into ("p" | "ul" | "ol", items) blocks; a paragraph's items are its lines.
+    """
+    blocks: List[Tuple[str, List[str]]] = []
+    for chunk in re.split(r"\n\s*\n", markup.replace("\r\n", "\n").strip()):
+        current: Optional[Tuple[str, List[str]]] = None
+        for line in chunk.split("\n"):
+            m, kind = _BULLET_RE.match(line), "ul"
+            if not m:
+                m, kind = _NUMBERED_RE.match(line), "ol"
+            text = m.group(1).strip() if m else line.strip()
+            kind = kind if m else "p"
+            if not text:
+                continue
+            if current is not None and current[0] == kind:
+                current[1].append(text)
+            else:
+                current = (kind, [text])
+                blocks.append(current)
+    return blocks
+
+
+def render_markup(markup: str) -> Tuple[str, str]:
+    """
+    Return (html fragment, plain text) for the writer's markup.
+    """
+    html_parts, plain_parts = [], []
+    for kind, items in _blocks(markup):
+        if kind == "p":
+            html_parts.append(f'<p style="{_P_STYLE}">' + "<br>\n".join(_inline_html(i) for i in items) + "</p>")
+            plain_parts.append("\n".join(_inline_plain(i) for i in items))
+        else:
+            lis = "".join(f"<li>{_inline_html(i)}</li>" for i in items)
+            html_parts.append(f'<{kind} style="{_LIST_STYLE}">{lis}</{kind}>')
+            plain_parts.append("\n".join(
+                (f"{n}. " if kind == "ol" else "- ") + _inline_plain(i) for n, i in enumerate(items, 1)
+            ))
+    return "\n".join(html_parts), "\n\n".join(plain_parts)
+
+
+def wrap_html(content: str, subject: str = "") -> str:
+    """
+    Put an html fragment into the branded template.
+    """
+    values = {"content": content, "subject": html.escape(subject)}
+    return _SLOT_RE.sub(lambda m: values[m.group(1)], get_template())
+
+
+def render_draft(subject: str, body: str) -> Dict[str, str]:
+    """
+    Returns: {subject, plain, html} from a subject and a markup body.
+    """
+    fragment, plain = render_markup(body)
+    return {"subject": subject, "plain": plain, "html": wrap_html(fragment, subject)}
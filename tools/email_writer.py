@@ -3,87 +3,374 @@ from __future__ import annotations
 import json
 import os
 import re
-from typing import Dict, Any
+import threading
+import time
+from typing import Dict, Any, Iterator, Optional, Tuple
 
-from openai import OpenAI
+from tools import instrumentation
+from tools.email_render import render_draft
+from tools.intent_parser import fast_parse
+from tools.json_stream import JsonFieldStreamer
+from tools.llm_cache import LLMCache, cache_key
+from tools.llm_client import get_client, get_async_client
+from tools.model_router import ModelRouter, get_router
 
 
-def _make_client() -> OpenAI:
+def _make_client():
     """
+    Return the shared, connection-pooled client (see tools/llm_client.py).
     Uses environment variables:
       - OPENAI_API_KEY (required)
       - OPENAI_API_BASE (optional, for compatible gateways)
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    assert api_key, "Set OPENAI_API_KEY in your environment."
-    base = os.getenv("OPENAI_API_BASE")  # e.g., https://api.aimlapi.com/v1
-    if base:
-        return OpenAI(api_key=api_key, base_url=base)
-    return OpenAI(api_key=api_key)
+    return get_client()
 
 
 PARSER_MODEL = os.getenv("PARSER_MODEL", "gpt-4o-mini")
 WRITER_MODEL = os.getenv("WRITER_MODEL", "gpt-4o-mini")
+# PARSER_MODELS / WRITER_MODELS route across several models instead (see tools/model_router.py)
+# Rule-based fast path for formulaic prompts (see tools/intent_parser.py); set FAST_PARSE=0 to disable
+FAST_PARSE = os.getenv("FAST_PARSE", "1") != "0"
 
+# Response caches (see tools/llm_cache.py). The parser runs at temperature 0 and is
+# cached by default; writer output is non-deterministic, so its cache is opt-in.
+PARSER_CACHE = os.getenv("PARSER_CACHE", "1") != "0"
+WRITER_CACHE = os.getenv("WRITER_CACHE", "0") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH") or None  # SQLite file; unset = memory only
+PARSER_CACHE_TTL = float(os.getenv("PARSER_CACHE_TTL", str(7 * 24 * 3600)))
+WRITER_CACHE_TTL = float(os.getenv("WRITER_CACHE_TTL", "3600"))
 
-def parse_prompt_to_fields(prompt: str) -> Dict[str, str]:
+# Writer returns one markup body; html and plain are rendered locally (see tools/email_render.py)
+LOCAL_HTML = os.getenv("LOCAL_HTML", "0") == "1"
+
+DEFAULT_TONE = "professional, friendly"
+
+_PARSER_SYSTEM_PROMPT = (
+    "Extract email-send intent from a single user instruction. "
+    "Return compact JSON with keys: to_email, to_name, tone, cc, bcc, action, subject_override, notes. "
+    "cc/bcc must be comma-separated strings or empty. "
+    "If an item is missing, set it to an empty string. DO NOT invent emails."
+)
+
+# LOCAL_HTML halves the writer's output: one body instead of the same text twice
+_DRAFT_KEYS = "subject, body" if LOCAL_HTML else "subject, plain, html"
+_BODY_FORMAT = (
+    " body is the email text only: paragraphs separated by blank lines, '- ' for bullet points, "
+    "**bold** for emphasis, [text](https://...) for links. No HTML."
+    if LOCAL_HTML else ""
+)
+
+_WRITER_SYSTEM_PROMPT = f"You write concise, polite emails. Return JSON with keys: {_DRAFT_KEYS}.{_BODY_FORMAT}"
+# Streaming: key order matters, so the subject and plain body arrive before the html copy
+_WRITER_STREAM_SYSTEM_PROMPT = (
+    f"You write concise, polite emails. Return JSON with keys in this exact order: {_DRAFT_KEYS}.{_BODY_FORMAT}"
+)
+
+_FUSED_SYSTEM_PROMPT = (
+    "From a single user instruction, extract the email-send intent AND write the email. "
+    "Return compact JSON with keys: to_email, to_name, tone, cc, bcc, action, subject_override, notes, "
+    f"{_DRAFT_KEYS}.{_BODY_FORMAT} "
+    "cc/bcc must be comma-separated strings or empty. action is 'send' or 'draft'. "
+    "If an intent item is missing, set it to an empty string. DO NOT invent emails. "
+    "The email itself is concise and polite, 120-180 words, in the requested tone "
+    "(default: professional, friendly), addressed to the recipient name (or 'there'). "
+    "Avoid flowery language."
+)
+
+_EMAIL_RE = re.compile(r"[\w\.-]+@[\w\.-]+\.\w+")
+
+_cache_lock = threading.Lock()
+_caches: Dict[str, Optional[LLMCache]] = {}
+
+
+def get_cache(kind: str) -> Optional[LLMCache]:
     """
-    Return: {to_email, to_name, tone, cc, bcc, action, subject_override, notes}
-    action: 'send' | 'draft' (default 'send')
+    Return the shared 'parser' or 'writer' cache, or None when that cache is disabled.
     """
+    assert kind in ("parser", "writer")
+    with _cache_lock:
+        if kind not in _caches:
+            enabled = PARSER_CACHE if kind == "parser" else WRITER_CACHE
+            ttl = PARSER_CACHE_TTL if kind == "parser" else WRITER_CACHE_TTL
+            _caches[kind] = LLMCache(LLM_CACHE_PATH, table=f"{kind}_cache", ttl_s=ttl) if enabled else None
+        return _caches[kind]
+
+
+def _chat_json(
+    model: str,
+    system_prompt: str,
+    user: str,
+    temperature: float,
+    cache: Optional[LLMCache] = None,
+    router: Optional[ModelRouter] = None,
+) -> Dict[str, Any]:
+    """
+    One JSON-mode chat completion; returns the decoded object.
+    With a router, the model is picked (and the call hedged) by it; `model` still keys the cache.
+    """
+    key = cache_key(model, system_prompt, user, temperature) if cache else None
+    if cache:
+        hit = cache.get(key)
+        if hit is not None:
+            instrumentation.incr("llm_cache_hits")
+            return hit
+
     client = _make_client()
 
-    system_prompt = (
-        "Extract email-send intent from a single user instruction. "
-        "Return compact JSON with keys: to_email, to_name, tone, cc, bcc, action, subject_override, notes. "
-        "cc/bcc must be comma-separated strings or empty. "
-        "If an item is missing, set it to an empty string. DO NOT invent emails."
-    )
+    def create(m: str):
+        return client.chat.completions.create(
+            model=m,
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user}],
+            response_format={"type": "json_object"},
+            temperature=temperature,
+        )
 
-    resp = client.chat.completions.create(
-        model=PARSER_MODEL,
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
-        response_format={"type": "json_object"},
-        temperature=0,
-    )
+    resp = router.call(create, size=len(user)) if router else create(model)
+    instrumentation.record_usage(resp.usage)
+    data = json.loads(resp.choices[0].message.content)
+    if cache:
+        cache.set(key, data)
+    return data
+
+
+async def _achat_json(
+    model: str,
+    system_prompt: str,
+    user: str,
+    temperature: float,
+    cache: Optional[LLMCache] = None,
+    router: Optional[ModelRouter] = None,
+) -> Dict[str, Any]:
+    """
+    Async variant of _chat_json on the shared AsyncOpenAI client.
+    """
+    key = cache_key(model, system_prompt, user, temperature) if cache else None
+    if cache:
+        hit = cache.get(key)
+        if hit is not None:
+            instrumentation.incr("llm_cache_hits")
+            return hit
+
+    client = get_async_client()
+
+    def create(m: str):
+        return client.chat.completions.create(
+            model=m,
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user}],
+            response_format={"type": "json_object"},
+            temperature=temperature,
+        )
+
+    resp = await (router.acall(create, size=len(user)) if router else create(model))
+    instrumentation.record_usage(resp.usage)
     data = json.loads(resp.choices[0].message.content)
+    if cache:
+        cache.set(key, data)
+    return data
 
+
+def _normalize_fields(data: Dict[str, Any], prompt: str) -> Dict[str, Any]:
     # Fallback: regex email if model missed it
     if not data.get("to_email"):
-        m = re.search(r"[\w\.-]+@[\w\.-]+\.\w+", prompt)
+        m = _EMAIL_RE.search(prompt)
         if m:
             data["to_email"] = m.group(0)
 
     # Normalize defaults
     data["action"] = (data.get("action") or "send").lower()
-    data["tone"] = data.get("tone") or "professional, friendly"
+    data["tone"] = data.get("tone") or DEFAULT_TONE
     for k in ("cc", "bcc", "to_name", "subject_override", "notes"):
         data[k] = (data.get(k) or "").strip()
     return data
 
 
-def draft_email(to_name: str, instruction: str, tone: str = "professional, friendly") -> Dict[str, str]:
-    """
-    Returns: {subject, plain, html}
-    """
-    client = _make_client()
+def _normalize_draft(data: Dict[str, Any]) -> Dict[str, str]:
+    if LOCAL_HTML:
+        return render_draft(data.get("subject", "Hello"), data.get("body") or data.get("plain", ""))
+    return {
+        "subject": data.get("subject", "Hello"),
+        "plain": data.get("plain") or data.get("body", ""),
+        "html": data.get("html", ""),
+    }
+
 
-    system_prompt = "You write concise, polite emails. Return JSON with keys: subject, plain, html."
-    usr = f"""
+def _writer_user_prompt(to_name: str, instruction: str, tone: str) -> str:
+    return f"""
 Recipient name: {to_name or 'there'}
 Instruction / purpose: {instruction}
 Tone: {tone}
 Length: 120-180 words. Avoid flowery language.
 """
-    resp = client.chat.completions.create(
-        model=WRITER_MODEL,
-        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": usr}],
-        response_format={"type": "json_object"},
-        temperature=0.4,
+
+
+def parse_prompt_to_fields(prompt: str, *, fast_path: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Return: {to_email, to_name, tone, cc, bcc, action, subject_override, notes}
+    action: 'send' | 'draft' (default 'send')
+    Confident formulaic prompts are parsed locally without calling PARSER_MODEL.
+    """
+    if fast_path if fast_path is not None else FAST_PARSE:
+        data = fast_parse(prompt)
+        if data is not None:
+            return _normalize_fields(data, prompt)
+
+    data = _chat_json(
+        PARSER_MODEL, _PARSER_SYSTEM_PROMPT, prompt, temperature=0,
+        cache=get_cache("parser"), router=get_router("parser"),
     )
-    data = json.loads(resp.choices[0].message.content)
-    return {
-        "subject": data.get("subject", "Hello"),
-        "plain": data.get("plain") or data.get("body", ""),
-        "html": data.get("html", ""),
-    }
+    return _normalize_fields(data, prompt)
+
+
+def draft_email(to_name: str, instruction: str, tone: str = DEFAULT_TONE) -> Dict[str, str]:
+    """
+    Returns: {subject, plain, html}
+    """
+    usr = _writer_user_prompt(to_name, instruction, tone)
+    data = _chat_json(
+        WRITER_MODEL, _WRITER_SYSTEM_PROMPT, usr, temperature=0.4,
+        cache=get_cache("writer"), router=get_router("writer"),
+    )
+    return _normalize_draft(data)
+
+
+def draft_email_stream(
+    to_name: str, instruction: str, tone: str = DEFAULT_TONE
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of draft_email. Yields:
+      ("subject", full_subject)  once the subject is complete
+      ("plain", text_chunk)      as body text arrives
+      ("html", text_chunk)       as the html copy arrives
+      ("done", {subject, plain, html})  last
+    """
+    usr = _writer_user_prompt(to_name, instruction, tone)
+    cache = get_cache("writer")
+    key = cache_key(WRITER_MODEL, _WRITER_STREAM_SYSTEM_PROMPT, usr, 0.4) if cache else None
+    hit = cache.get(key) if cache else None
+    if hit is not None:
+        instrumentation.incr("llm_cache_hits")
+        drafted = _normalize_draft(hit)
+        yield "subject", drafted["subject"]
+        yield "plain", drafted["plain"]
+        yield "html", drafted["html"]
+        yield "done", drafted
+        return
+
+    client = _make_client()
+    # Streams only report usage when asked to; only ask when someone is listening
+    extra = {"stream_options": {"include_usage": True}} if instrumentation.active() else {}
+    # Streams are routed but not hedged: the caller is already reading the first one
+    router = get_router("writer")
+    model = router.choose(len(usr)) if router else WRITER_MODEL
+    started = time.perf_counter()
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": _WRITER_STREAM_SYSTEM_PROMPT}, {"role": "user", "content": usr}],
+            response_format={"type": "json_object"},
+            temperature=0.4,
+            stream=True,
+            **extra,
+        )
+    except Exception:
+        if router:
+            router.record(model, time.perf_counter() - started, False)
+        raise
+    streamer = JsonFieldStreamer()
+    parts = []
+    subject_sent = False
+    usage = None
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+            instrumentation.record_usage(chunk.usage)
+        if not chunk.choices:
+            continue
+        text = chunk.choices[0].delta.content or ""
+        if not text:
+            continue
+        parts.append(text)
+        for field, piece in streamer.feed(text):
+            if field in ("plain", "body", "html"):
+                if not subject_sent and "subject" in streamer.values:
+                    subject_sent = True
+                    yield "subject", streamer.values["subject"]
+                yield ("html" if field == "html" else "plain"), piece
+
+    if router:
+        router.record(model, time.perf_counter() - started, True, usage)
+
+    try:
+        data = json.loads("".join(parts))
+    except ValueError:
+        # Truncated or malformed JSON: fall back to whatever fields were decoded
+        data = dict(streamer.values)
+    if cache:
+        cache.set(key, data)
+    drafted = _normalize_draft(data)
+    if not subject_sent:
+        yield "subject", drafted["subject"]
+    yield "done", drafted
+
+
+def parse_and_draft(prompt: str) -> Dict[str, Any]:
+    """
+    Fused mode: parse the intent and write the email in ONE completion.
+    Returns: {to_email, to_name, tone, cc, bcc, action, subject_override, notes,
+              draft: {subject, plain, html}}
+    Uses WRITER_MODEL, since the output is mostly prose.
+    """
+    data = _chat_json(
+        WRITER_MODEL, _FUSED_SYSTEM_PROMPT, prompt, temperature=0.4,
+        cache=get_cache("writer"), router=get_router("writer"),
+    )
+    drafted = _normalize_draft(data)
+    for k in ("subject", "plain", "body", "html"):
+        data.pop(k, None)
+    fields = _normalize_fields(data, prompt)
+    fields["draft"] = drafted
+    return fields
+
+
+async def aparse_prompt_to_fields(prompt: str, *, fast_path: Optional[bool] = None) -> Dict[str, str]:
+    """
+    Async variant of parse_prompt_to_fields.
+    """
+    if fast_path if fast_path is not None else FAST_PARSE:
+        data = fast_parse(prompt)
+        if data is not None:
+            return _normalize_fields(data, prompt)
+
+    data = await _achat_json(
+        PARSER_MODEL, _PARSER_SYSTEM_PROMPT, prompt, temperature=0,
+        cache=get_cache("parser"), router=get_router("parser"),
+    )
+    return _normalize_fields(data, prompt)
+
+
+async def adraft_email(to_name: str, instruction: str, tone: str = DEFAULT_TONE) -> Dict[str, str]:
+    """
+    Async variant of draft_email.
+    """
+    usr = _writer_user_prompt(to_name, instruction, tone)
+    data = await _achat_json(
+        WRITER_MODEL, _WRITER_SYSTEM_PROMPT, usr, temperature=0.4,
+        cache=get_cache("writer"), router=get_router("writer"),
+    )
+    return _normalize_draft(data)
+
+
+async def aparse_and_draft(prompt: str) -> Dict[str, Any]:
+    """
+    Async variant of parse_and_draft.
+    """
+    data = await _achat_json(
+        WRITER_MODEL, _FUSED_SYSTEM_PROMPT, prompt, temperature=0.4,
+        cache=get_cache("writer"), router=get_router("writer"),
+    )
+    drafted = _normalize_draft(data)
+    for k in ("subject", "plain", "body", "html"):
+        data.pop(k, None)
+    fields = _normalize_fields(data, prompt)
+    fields["draft"] = drafted
+    return fields
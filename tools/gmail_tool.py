@@ -1,20 +1,26 @@
 # tools/gmail_tool.py
 from __future__ import annotations
 import base64
-import mimetypes
+import json
 import os
+import tempfile
+import threading
 import time
+import uuid
 from email import encoders
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Iterable, Optional, Tuple, Dict, Any
+from typing import IO, Callable, Iterable, List, Optional, Dict, Any
 
-from googleapiclient.discovery import build
+# googleapiclient.discovery, google.oauth2 and google_auth_oauthlib are slow to
+# import, so they are imported where they are used (see get_gmail_service).
 from googleapiclient.errors import HttpError
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+
+from tools import instrumentation
+from tools.attachment_cache import AttachmentCache, _guess_mime_type
+from tools.credentials import load_token_meta, save_token_meta, save_credentials, token_meta_path
+from tools.rate_limiter import QuotaRateLimiter, get_rate_limiter
 
 
 SCOPES = [
@@ -22,16 +28,68 @@ SCOPES = [
     "https://www.googleapis.com/auth/gmail.modify",
 ]
 
+# Gmail accepts at most 100 calls per batch request; it recommends 50 or fewer.
+GMAIL_BATCH_LIMIT = 100
+DEFAULT_BATCH_SIZE = 50
+RETRYABLE_STATUSES = (403, 429, 500, 502, 503, 504)
+# Gmail may return 5xx after it has accepted a message, so sends are only
+# retried when the request was rejected for rate limits.
+RATE_LIMIT_STATUSES = (403, 429)
 
-def _guess_mime_type(path: str) -> Tuple[str, str]:
-    ctype, encoding = mimetypes.guess_type(path)
-    if ctype is None or encoding is not None:
-        ctype = "application/octet-stream"
-    maintype, subtype = ctype.split("/", 1)
-    return maintype, subtype
+# A gmail.v1.json shipped next to this file wins; otherwise the document bundled
+# with googleapiclient is copied to GMAIL_DISCOVERY_CACHE on first use.
+PACKAGED_DISCOVERY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gmail.v1.json")
+DISCOVERY_CACHE_PATH = os.getenv(
+    "GMAIL_DISCOVERY_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "email_agent", "gmail.v1.json")
+)
 
+# Streaming uploads: attachment bytes are encoded 57 * 1024 at a time (whole
+# 76-character base64 lines); resumable chunks must be multiples of 256 KiB.
+_B64_READ_SIZE = 57 * 1024
+# Placeholder for attachment i, made unique per message by a random nonce so
+# body text can never be mistaken for it
+_ATTACHMENT_TOKEN = "@@EMAIL_AGENT_ATTACHMENT_{}_{}@@"
+DEFAULT_UPLOAD_CHUNK = 4 * 1024 * 1024
 
-def get_gmail_service(
+_discovery_lock = threading.Lock()
+_discovery_doc: Optional[Dict[str, Any]] = None
+
+
+def _http_status(e: Exception) -> Optional[int]:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "resp", None), "status", None)
+    return int(status) if status is not None else None
+
+
+def _gmail_discovery_document() -> Dict[str, Any]:
+    """
+    Return the Gmail v1 discovery document without any network round-trip,
+    parsing it at most once per process.
+    """
+    global _discovery_doc
+    with _discovery_lock:
+        if _discovery_doc is not None:
+            return _discovery_doc
+        for path in (PACKAGED_DISCOVERY_PATH, DISCOVERY_CACHE_PATH):
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    _discovery_doc = json.load(f)
+                return _discovery_doc
+
+        from googleapiclient.discovery_cache import get_static_doc
+
+        content = get_static_doc("gmail", "v1")
+        assert content, "googleapiclient ships no static Gmail discovery document; upgrade google-api-python-client"
+        _discovery_doc = json.loads(content)
+        try:
+            os.makedirs(os.path.dirname(DISCOVERY_CACHE_PATH), exist_ok=True)
+            with open(DISCOVERY_CACHE_PATH, "w", encoding="utf-8") as f:
+                f.write(content)
+        except OSError:
+            pass  # the cache is an optimisation only
+        return _discovery_doc
+
+
+def get_gmail_credentials(
     client_secret_path: str = None,
     token_path: str = "token.json",
     scopes: Iterable[str] = SCOPES,
@@ -40,6 +98,10 @@ def get_gmail_service(
     Desktop OAuth (loopback) flow; avoids redirect_uri_mismatch.
     Creates/refreshes token.json automatically.
     """
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
     if os.path.exists(token_path):
         creds = Credentials.from_authorized_user_file(token_path, scopes)
@@ -55,33 +117,95 @@ def get_gmail_service(
                 client_secret_path, scopes
             )
             creds = flow.run_local_server(port=0)
-        with open(token_path, "w") as token:
-            token.write(creds.to_json())
+            # A fresh login may be a different account: drop the cached sender
+            if os.path.exists(token_meta_path(token_path)):
+                os.remove(token_meta_path(token_path))
+        save_credentials(creds, token_path)
+
+    return creds
+
 
-    return build("gmail", "v1", credentials=creds)
+_thread_http = threading.local()
+
+
+def _authorized_http(creds):
+    """
+    This thread's AuthorizedHttp for `creds`, created on first use and reused,
+    so each thread keeps its own warm connection.
+    """
+    cache = getattr(_thread_http, "by_creds", None)
+    if cache is None:
+        cache = _thread_http.by_creds = {}
+    entry = cache.get(id(creds))
+    if entry is None or entry[0] is not creds:
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+
+        entry = cache[id(creds)] = (creds, google_auth_httplib2.AuthorizedHttp(creds, http=build_http()))
+    return entry[1]
+
+
+def build_gmail_service(creds, *, thread_safe: bool = True):
+    """
+    A Gmail v1 service. httplib2 connections are not thread-safe, so by default
+    every request is bound to the calling thread's own AuthorizedHttp. One
+    service can then be shared by any number of threads.
+    """
+    from googleapiclient.discovery import build_from_document
+
+    if not thread_safe:
+        return build_from_document(_gmail_discovery_document(), credentials=creds)
+
+    from googleapiclient.http import HttpRequest
+
+    def request_builder(http, *args, **kwargs):
+        return HttpRequest(_authorized_http(creds), *args, **kwargs)
+
+    return build_from_document(_gmail_discovery_document(), credentials=creds, requestBuilder=request_builder)
+
+
+def get_gmail_service(
+    client_secret_path: str = None,
+    token_path: str = "token.json",
+    scopes: Iterable[str] = SCOPES,
+):
+    """
+    Credentials from get_gmail_credentials + a Gmail v1 service.
+    """
+    return build_gmail_service(get_gmail_credentials(client_secret_path, token_path, scopes))
 
 
-def get_sender_address(service) -> str:
+def get_sender_address(service, token_path: Optional[str] = None) -> str:
+    """
+    With token_path, the address is read from / saved to the token's sidecar cache.
+    """
+    if token_path:
+        cached = load_token_meta(token_path).get("email")
+        if cached:
+            return cached
     profile = service.users().getProfile(userId="me").execute()
-    return profile.get("emailAddress")
+    email = profile.get("emailAddress")
+    if token_path and email:
+        save_token_meta(token_path, email=email)
+    return email
 
 
-def create_message(
+def _mime_skeleton(
     *,
     to: str,
     subject: str,
-    body_html: Optional[str] = None,
-    body_text: Optional[str] = None,
-    cc: Optional[str] = None,
-    bcc: Optional[str] = None,
-    attachments: Optional[Iterable[str]] = None,
-    sender: Optional[str] = None,
-) -> Dict[str, Any]:
+    body_html: Optional[str],
+    body_text: Optional[str],
+    cc: Optional[str],
+    bcc: Optional[str],
+    sender: Optional[str],
+    headers: Optional[Dict[str, str]],
+    with_attachments: bool,
+) -> MIMEMultipart:
     """
-    Build a MIME message. Provide body_html OR body_text (or both).
-    attachments: iterable of file paths.
+    The message container with bodies and headers, ready for attachment parts.
     """
-    if attachments:
+    if with_attachments:
         msg = MIMEMultipart()
         alt = MIMEMultipart("alternative")
         msg.attach(alt)
@@ -109,6 +233,41 @@ def create_message(
         msg["Cc"] = cc
     if bcc:
         msg["Bcc"] = bcc
+    for name, value in (headers or {}).items():
+        msg[name] = value
+    return msg
+
+
+def create_message(
+    *,
+    to: str,
+    subject: str,
+    body_html: Optional[str] = None,
+    body_text: Optional[str] = None,
+    cc: Optional[str] = None,
+    bcc: Optional[str] = None,
+    attachments: Optional[Iterable[str]] = None,
+    sender: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    attachment_cache: Optional[AttachmentCache] = None,
+) -> Dict[str, Any]:
+    """
+    Build a MIME message. Provide body_html OR body_text (or both).
+    attachments: iterable of file paths.
+    headers: extra headers, e.g. {"Message-ID": ...}.
+    attachment_cache: reuse encoded attachment parts across messages (bulk sends).
+    """
+    msg = _mime_skeleton(
+        to=to,
+        subject=subject,
+        body_html=body_html,
+        body_text=body_text,
+        cc=cc,
+        bcc=bcc,
+        sender=sender,
+        headers=headers,
+        with_attachments=bool(attachments),
+    )
 
     # Add attachments
     if attachments:
@@ -118,6 +277,9 @@ def create_message(
                 continue
             if not os.path.exists(path):
                 raise FileNotFoundError(f"Attachment not found: {path}")
+            if attachment_cache is not None:
+                msg.attach(attachment_cache.part(path))
+                continue
             maintype, subtype = _guess_mime_type(path)
             with open(path, "rb") as f:
                 part = MIMEBase(maintype, subtype)
@@ -132,12 +294,149 @@ def create_message(
     return {"raw": raw, "bcc": bcc}
 
 
-def send_message(service, *, user_id: str = "me", message: Dict[str, Any], max_retries: int = 5):
+def write_message_file(
+    *,
+    to: str,
+    subject: str,
+    body_html: Optional[str] = None,
+    body_text: Optional[str] = None,
+    cc: Optional[str] = None,
+    bcc: Optional[str] = None,
+    attachments: Optional[Iterable[str]] = None,
+    sender: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    spool_bytes: int = 1024 * 1024,
+) -> IO[bytes]:
+    """
+    Like create_message, but writes the RFC 822 message to a spooled temp file
+    (rewound, ready to upload). Attachments are streamed through base64 in
+    fixed-size chunks, so peak memory stays around spool_bytes whatever their size.
+    The caller closes the file.
+    """
+    paths = [p.strip() for p in (attachments or []) if p.strip()]
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Attachment not found: {path}")
+
+    msg = _mime_skeleton(
+        to=to,
+        subject=subject,
+        body_html=body_html,
+        body_text=body_text,
+        cc=cc,
+        bcc=bcc,
+        sender=sender,
+        headers=headers,
+        with_attachments=bool(paths),
+    )
+    # Serialise the structure with placeholder payloads, then splice the
+    # encoded file contents in while copying it out.
+    nonce = uuid.uuid4().hex
+    for i, path in enumerate(paths):
+        maintype, subtype = _guess_mime_type(path)
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(_ATTACHMENT_TOKEN.format(nonce, i))
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header("Content-Disposition", "attachment", filename=os.path.basename(path))
+        msg.attach(part)
+    skeleton = msg.as_bytes()
+
+    out = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    pos = 0
+    for i, path in enumerate(paths):
+        token = _ATTACHMENT_TOKEN.format(nonce, i).encode("ascii")
+        at = skeleton.index(token, pos)
+        out.write(skeleton[pos:at])
+        with open(path, "rb") as f:
+            prev = b""
+            while True:
+                chunk = f.read(_B64_READ_SIZE)
+                if not chunk:
+                    break
+                out.write(prev)
+                prev = base64.encodebytes(chunk)
+            out.write(prev.rstrip(b"\n"))
+        pos = at + len(token)
+    out.write(skeleton[pos:])
+    out.seek(0)
+    return out
+
+
+def send_message_media(
+    service,
+    fp: IO[bytes],
+    *,
+    user_id: str = "me",
+    action: str = "send",
+    chunksize: int = DEFAULT_UPLOAD_CHUNK,
+    max_retries: int = 5,
+    limiter: Optional[QuotaRateLimiter] = None,
+):
+    """
+    Send (or save as a draft) an RFC 822 message from a file object using Gmail's
+    resumable media upload. After a network error or 5xx the upload resumes from
+    the last acknowledged chunk instead of starting over.
+    """
+    from googleapiclient.http import MediaIoBaseUpload
+
+    assert action in ("send", "draft")
+    limiter = limiter or get_rate_limiter()
+    if limiter:
+        limiter.acquire_for("drafts.create" if action == "draft" else "messages.send")
+
+    media = MediaIoBaseUpload(fp, mimetype="message/rfc822", chunksize=chunksize, resumable=True)
+    if action == "draft":
+        request = service.users().drafts().create(userId=user_id, body={}, media_body=media)
+    else:
+        request = service.users().messages().send(userId=user_id, body={}, media_body=media)
+
+    failures = 0
+    response = None
+    while response is None:
+        try:
+            _, response = request.next_chunk()
+        except (HttpError, OSError) as e:
+            status = _http_status(e) if isinstance(e, HttpError) else None
+            if failures >= max_retries or (status is not None and status not in RETRYABLE_STATUSES):
+                raise
+            sleep_s = min(30, (1.5 ** failures))
+            failures += 1
+            print(f"Upload interrupted ({e}); resuming in {sleep_s:.1f}s ({failures}/{max_retries})…")
+            instrumentation.incr("gmail_retries")
+            instrumentation.add_time("gmail_backoff", sleep_s)
+            time.sleep(sleep_s)
+    return response
+
+
+def send_large_message(service, *, action: str = "send", user_id: str = "me", **message_fields):
+    """
+    write_message_file + send_message_media in one call; message_fields are the
+    create_message keyword arguments. Use it instead of create_message + send_message
+    for large attachments: the message is never held in memory or base64-encoded twice,
+    and an interrupted upload resumes.
+    """
+    with write_message_file(**message_fields) as fp:
+        return send_message_media(service, fp, user_id=user_id, action=action)
+
+
+def send_message(
+    service,
+    *,
+    user_id: str = "me",
+    message: Dict[str, Any],
+    max_retries: int = 5,
+    limiter: Optional[QuotaRateLimiter] = None,
+):
     """
     Sends an email with exponential backoff on rate limits.
+    Quota units are taken from `limiter` (default: get_rate_limiter()) before each attempt.
     """
     assert message and "raw" in message
+    limiter = limiter or get_rate_limiter()
     for attempt in range(max_retries):
+        if limiter:
+            with instrumentation.span("quota_wait"):
+                limiter.acquire_for("messages.send")
         try:
             return (
                 service.users()
@@ -146,20 +445,154 @@ def send_message(service, *, user_id: str = "me", message: Dict[str, Any], max_r
                 .execute()
             )
         except HttpError as e:
-            status = getattr(e, "status_code", None) or getattr(getattr(e, "resp", None), "status", None)
-            if status in [403, 429]:
+            status = _http_status(e)
+            if status in [403, 429] and attempt < max_retries - 1:
                 sleep_s = min(30, (1.5 ** attempt))
                 print(f"Rate-limited (attempt {attempt+1}/{max_retries}). Sleeping {sleep_s:.1f}s…")
+                instrumentation.incr("gmail_retries")
+                instrumentation.add_time("gmail_backoff", sleep_s)
                 time.sleep(sleep_s)
                 continue
             raise
 
 
-def create_draft(service, *, user_id: str = "me", message: Dict[str, Any]):
+def create_draft(
+    service,
+    *,
+    user_id: str = "me",
+    message: Dict[str, Any],
+    limiter: Optional[QuotaRateLimiter] = None,
+):
     assert message and "raw" in message
+    limiter = limiter or get_rate_limiter()
+    if limiter:
+        with instrumentation.span("quota_wait"):
+            limiter.acquire_for("drafts.create")
     return (
         service.users()
         .drafts()
         .create(userId=user_id, body={"message": {"raw": message["raw"]}})
         .execute()
     )
+
+
+def _execute_batched(
+    service,
+    messages: List[Dict[str, Any]],
+    make_request: Callable[[Dict[str, Any]], Any],
+    *,
+    method: str,
+    batch_size: int,
+    max_retries: int,
+    limiter: Optional[QuotaRateLimiter],
+    retry_statuses: Iterable[int] = RATE_LIMIT_STATUSES,
+) -> List[Dict[str, Any]]:
+    """
+    Run one API call per message through Gmail batch requests.
+    Batching saves HTTP round-trips, not quota: every sub-request still takes
+    its `method` cost from the limiter.
+    Failed sub-requests with a status in retry_statuses are re-batched with backoff;
+    everything else is reported as-is. A chunk lost to a transport error (timeout,
+    dropped connection) is reported as failed with status None and not retried,
+    since some of its messages may have gone out.
+    Returns per-item {"ok": True, "id", "response"} or {"ok": False, "status", "error"}, in input order.
+    """
+    assert 0 < batch_size <= GMAIL_BATCH_LIMIT, f"batch_size must be 1..{GMAIL_BATCH_LIMIT}"
+    for m in messages:
+        assert m and "raw" in m
+    results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+    pending = list(range(len(messages)))
+    limiter = limiter or get_rate_limiter()
+    retry_statuses = tuple(retry_statuses)
+
+    for attempt in range(max_retries):
+        failed: List[int] = []
+
+        def callback(request_id, response, exception):
+            i = int(request_id)
+            if exception is None:
+                results[i] = {"ok": True, "id": response.get("id"), "response": response}
+                return
+            status = _http_status(exception)
+            results[i] = {"ok": False, "status": status, "error": str(exception)}
+            if status in retry_statuses:
+                failed.append(i)
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for i in chunk:
+                if limiter:
+                    limiter.acquire_for(method)
+                batch.add(make_request(messages[i]), request_id=str(i))
+            try:
+                batch.execute()
+            except HttpError as e:
+                # The whole batch round-trip failed
+                status = _http_status(e)
+                for i in chunk:
+                    results[i] = {"ok": False, "status": status, "error": str(e)}
+                if status in retry_statuses:
+                    failed.extend(chunk)
+            except Exception as e:
+                # Keep the results of the chunks already sent
+                for i in chunk:
+                    results[i] = {"ok": False, "status": None, "error": f"{type(e).__name__}: {e}"}
+
+        if not failed or attempt == max_retries - 1:
+            break
+        sleep_s = min(30, (1.5 ** attempt))
+        print(f"{len(failed)} batched request(s) failed (attempt {attempt+1}/{max_retries}). Sleeping {sleep_s:.1f}s…")
+        time.sleep(sleep_s)
+        pending = sorted(failed)
+
+    return results
+
+
+def send_messages_batch(
+    service,
+    messages: List[Dict[str, Any]],
+    *,
+    user_id: str = "me",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_retries: int = 5,
+    limiter: Optional[QuotaRateLimiter] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Send many messages using Gmail batch requests (up to batch_size per HTTP round-trip).
+    Returns one result dict per message, in input order.
+    """
+    return _execute_batched(
+        service,
+        messages,
+        lambda m: service.users().messages().send(userId=user_id, body={"raw": m["raw"]}),
+        method="messages.send",
+        batch_size=batch_size,
+        max_retries=max_retries,
+        limiter=limiter,
+    )
+
+
+def create_drafts_batch(
+    service,
+    messages: List[Dict[str, Any]],
+    *,
+    user_id: str = "me",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_retries: int = 5,
+    limiter: Optional[QuotaRateLimiter] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Create many drafts using Gmail batch requests. Same result shape as send_messages_batch.
+    """
+    return _execute_batched(
+        service,
+        messages,
+        lambda m: service.users().drafts().create(userId=user_id, body={"message": {"raw": m["raw"]}}),
+        method="drafts.create",
+        batch_size=batch_size,
+        max_retries=max_retries,
+        limiter=limiter,
+        # A duplicate draft is harmless, so server errors are retried too
+        retry_statuses=RETRYABLE_STATUSES,
+    )
@@ -0,0 +1,176 @@
+# tools/instrumentation.py
+"""
+Per-request timing, token usage and retry counters.
+
+A Trace is bound to the current context (thread or asyncio task) for the
+duration of one EmailAgent.run. Code along the way records into it without
+passing it around:
+
+    with span("parse"):            # wall time, summed per name
+        ...
+    record_usage(resp.usage)       # tokens, attributed to the innermost span
+    incr("gmail_retries")          # counters
+
+When no trace is active and no hooks are registered these are no-ops.
+
+Hooks plug the same events into metrics / tracing backends:
+  add_hook(fn)             fn(name, duration_s, attrs) after every span
+  add_span_factory(f)      f(name) returns a context manager entered around
+                           every span (e.g. an OpenTelemetry tracer.start_as_current_span)
+"""
+from __future__ import annotations
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+SpanHook = Callable[[str, float, Dict[str, Any]], None]
+SpanFactory = Callable[[str], ContextManager[Any]]
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("email_agent_trace", default=None)
+# Open span names, per context: stages running concurrently (e.g. on an executor
+# thread with a copied context) each see their own innermost span
+_open_spans: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("email_agent_spans", default=())
+_hooks: List[SpanHook] = []
+_span_factories: List[SpanFactory] = []
+_hooks_lock = threading.Lock()
+
+_USAGE_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.usage: Dict[str, Dict[str, int]] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()  # spans may close on executor threads
+
+    def add_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def add_usage(self, stage: str, usage: Dict[str, int]) -> None:
+        with self._lock:
+            total = self.usage.setdefault(stage, {k: 0 for k in _USAGE_KEYS})
+            for k in _USAGE_KEYS:
+                total[k] += int(usage.get(k) or 0)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        Return: {timings: {stage: seconds, ..., total}, usage: {stage: {...tokens}, total: {...}}, counters}
+        """
+        with self._lock:
+            timings = {k: round(v, 6) for k, v in self.timings.items()}
+            usage = {k: dict(v) for k, v in self.usage.items()}
+            counters = dict(self.counters)
+        timings["total"] = round(time.perf_counter() - self.started, 6)
+        if usage:
+            usage["total"] = {k: sum(u[k] for u in usage.values()) for k in _USAGE_KEYS}
+        return {"timings": timings, "usage": usage, "counters": counters}
+
+
+def add_hook(hook: SpanHook) -> None:
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def add_span_factory(factory: SpanFactory) -> None:
+    with _hooks_lock:
+        _span_factories.append(factory)
+
+
+def clear_hooks() -> None:
+    with _hooks_lock:
+        _hooks.clear()
+        _span_factories.clear()
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def active() -> bool:
+    return _current.get() is not None or bool(_hooks) or bool(_span_factories)
+
+
+@contextmanager
+def trace(enabled: bool = True) -> Iterator[Optional[Trace]]:
+    """
+    Bind a fresh Trace to the current context; yields None when not enabled.
+    """
+    if not enabled:
+        yield None
+        return
+    t = Trace()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """
+    Time a stage. Durations with the same name are summed in the trace.
+    """
+    t = _current.get()
+    if t is None and not _hooks and not _span_factories:
+        yield
+        return
+
+    with ExitStack() as stack:
+        for factory in list(_span_factories):
+            stack.enter_context(factory(name))
+        token = _open_spans.set(_open_spans.get() + (name,))
+        t0 = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - t0
+            _open_spans.reset(token)
+            if t is not None:
+                t.add_time(name, duration)
+            if error is not None:
+                attrs["error"] = type(error).__name__
+            for hook in list(_hooks):
+                try:
+                    hook(name, duration, attrs)
+                except Exception as e:  # a broken exporter must not fail the send
+                    print(f"⚠️ Instrumentation hook failed: {e}")
+
+
+def record_usage(usage: Any, stage: Optional[str] = None) -> None:
+    """
+    Add a completion's token usage (OpenAI `usage` object or dict) to the trace,
+    under `stage` or the innermost open span.
+    """
+    t = _current.get()
+    if t is None or usage is None:
+        return
+    if not isinstance(usage, dict):
+        usage = {k: getattr(usage, k, 0) for k in _USAGE_KEYS}
+    spans = _open_spans.get()
+    t.add_usage(stage or (spans[-1] if spans else "llm"), usage)
+
+
+def incr(name: str, n: int = 1) -> None:
+    t = _current.get()
+    if t is not None:
+        t.incr(name, n)
+
+
+def add_time(name: str, seconds: float) -> None:
+    t = _current.get()
+    if t is not None:
+        t.add_time(name, seconds)
@@ -0,0 +1,124 @@
+# tools/intent_parser.py
+"""
+Rule-based fast path for formulaic prompts, e.g.
+  "draft: email to a@b.com cc c@d.com about the Q3 report"
+
+fast_parse() returns the same fields as parse_prompt_to_fields (before
+normalisation) when it is confident, and None otherwise so the caller can fall
+back to the parser LLM.
+"""
+from __future__ import annotations
+import re
+import threading
+from typing import Dict, Optional
+
+
+_EMAIL = r"[\w\.\+-]+@[\w\.-]+\.\w+"
+_EMAIL_RE = re.compile(_EMAIL)
+_EMAIL_LIST = rf"{_EMAIL}(?:\s*(?:,|and)\s*{_EMAIL})*"
+
+_VERB_RE = re.compile(r"^\s*(draft|send|write|compose|email)\b\s*:?", re.I)
+_CC_RE = re.compile(rf"\bcc\s*:?\s*({_EMAIL_LIST})", re.I)
+_BCC_RE = re.compile(rf"\bbcc\s*:?\s*({_EMAIL_LIST})", re.I)
+_SUBJECT_RE = re.compile(r"""\bsubject\s*:\s*(?:"([^"]+)"|'([^']+)'|([^\n,;]+))""", re.I)
+_TO_RE = re.compile(
+    rf"\b[Tt]o\s+(?:(?P<name>[A-Z][\w'\.-]*(?:\s+[A-Z][\w'\.-]*){{0,3}})\s*[<(]\s*(?P<email1>{_EMAIL})\s*[>)]"
+    rf"|(?P<email2>{_EMAIL}))"
+)
+_TOPIC_RE = re.compile(r"\b(?:about|regarding|re:|concerning)\s+(\S.*)", re.I)
+_TONE_RE = re.compile(
+    r"\b(professional|friendly|formal|informal|casual|polite|warm|urgent|apologetic|concise|enthusiastic)\b",
+    re.I,
+)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _emails(text: str) -> str:
+    return ", ".join(_EMAIL_RE.findall(text))
+
+
+def guess_tone(prompt: str) -> str:
+    """
+    Tone words mentioned in the prompt, e.g. "formal, friendly"; "" if none.
+    """
+    tones = []
+    for t in _TONE_RE.findall(prompt):
+        if t.lower() not in tones:
+            tones.append(t.lower())
+    return ", ".join(tones)
+
+
+def _parse(prompt: str) -> Optional[Dict[str, str]]:
+    verb_m = _VERB_RE.match(prompt)
+    if not verb_m:
+        return None
+
+    cc_m = _CC_RE.search(prompt)
+    bcc_m = _BCC_RE.search(prompt)
+    subj_m = _SUBJECT_RE.search(prompt)
+
+    # Mask the cc/bcc/subject clauses so their emails are not taken as the recipient
+    masked = prompt
+    for m in (bcc_m, cc_m, subj_m):
+        if m:
+            masked = masked[: m.start()] + " " * (m.end() - m.start()) + masked[m.end():]
+
+    to_matches = list(_TO_RE.finditer(masked))
+    if len(to_matches) != 1 or len(_EMAIL_RE.findall(masked)) != 1:
+        return None
+    to_m = to_matches[0]
+
+    topic_m = _TOPIC_RE.search(masked[to_m.end():])
+    if not topic_m or not topic_m.group(1).strip(" .,;"):
+        return None
+
+    # Anything unexplained between the verb and "to" (e.g. "to my boss Jim") is
+    # the kind of nuance the LLM handles better.
+    head = masked[verb_m.end(): to_m.start()]
+    head = _TONE_RE.sub(" ", head)
+    if re.sub(r"\b(?:an?|the|email|mail|message|note|e-mail)\b", " ", head, flags=re.I).strip(" ,:"):
+        return None
+
+    subject = ""
+    if subj_m:
+        subject = next(g for g in subj_m.groups() if g)
+
+    return {
+        "to_email": to_m.group("email1") or to_m.group("email2"),
+        "to_name": to_m.group("name") or "",
+        "tone": guess_tone(prompt),
+        "cc": _emails(cc_m.group(1)) if cc_m else "",
+        "bcc": _emails(bcc_m.group(1)) if bcc_m else "",
+        # Only the leading verb decides: "send ... about the draft budget" is a send
+        "action": "draft" if verb_m.group(1).lower() == "draft" else "send",
+        "subject_override": subject.strip(),
+        # Empty notes: the writer then works from the full prompt.
+        "notes": "",
+    }
+
+
+def fast_parse(prompt: str) -> Optional[Dict[str, str]]:
+    """
+    Return parsed fields for confident, formulaic prompts; None to defer to the LLM.
+    """
+    data = _parse(prompt)
+    with _lock:
+        _stats["hits" if data is not None else "misses"] += 1
+    return data
+
+
+def fast_path_stats() -> Dict[str, float]:
+    """
+    Return: {hits, misses, hit_rate}
+    """
+    with _lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": (hits / total) if total else 0.0}
+
+
+def reset_fast_path_stats() -> None:
+    with _lock:
+        _stats["hits"] = _stats["misses"] = 0
@@ -0,0 +1,128 @@
+# tools/json_stream.py
+"""
+Incremental extractor for the top-level string fields of a streamed JSON object.
+
+Feed it completion chunks as they arrive; it returns (key, text) pieces for each
+string value as soon as the characters are decoded, without waiting for the
+object to close. Non-string values and nested containers are skipped.
+"""
+from __future__ import annotations
+from typing import Dict, List, Tuple
+
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldStreamer:
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self._state = "start"  # start | key | colon | value | string | skip | after
+        self._key: List[str] = []
+        self._current = ""
+        self._escape = ""  # pending escape sequence inside a string, e.g. "\\" or "\\u00"
+        self._high = ""  # \uD800-\uDBFF escape waiting for its low surrogate
+        self._skip_depth = 0
+        self._skip_in_str = False
+        self._skip_escape = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Consume a chunk; return the (key, text) pieces decoded from it, in order.
+        """
+        out: List[Tuple[str, str]] = []
+        buf: List[str] = []
+
+        def emit(ch: str) -> None:
+            if self._high:
+                # A high surrogate not followed by a low one can't be encoded; replace it
+                buf.append("\ufffd")
+                self._high = ""
+            buf.append(ch)
+
+        def emit_unicode(code: int) -> None:
+            if 0xD800 <= code <= 0xDBFF:
+                emit("")
+                self._high = chr(code)
+            elif 0xDC00 <= code <= 0xDFFF:
+                if self._high:
+                    high, self._high = ord(self._high), ""
+                    buf.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))
+                else:
+                    buf.append("\ufffd")
+            else:
+                emit(chr(code))
+
+        def flush():
+            if buf and self._state == "string" and self._current:
+                piece = "".join(buf)
+                self.values[self._current] = self.values.get(self._current, "") + piece
+                out.append((self._current, piece))
+            buf.clear()
+
+        for ch in chunk:
+            st = self._state
+            if st == "string":
+                if self._escape:
+                    self._escape += ch
+                    if self._escape[1] == "u":
+                        if len(self._escape) == 6:
+                            emit_unicode(int(self._escape[2:], 16))
+                            self._escape = ""
+                    else:
+                        emit(_ESCAPES.get(ch, ch))
+                        self._escape = ""
+                elif ch == "\\":
+                    self._escape = ch
+                elif ch == '"':
+                    emit("")
+                    flush()
+                    self.values.setdefault(self._current, "")
+                    self._state = "after"
+                else:
+                    emit(ch)
+            elif st == "start":
+                if ch == '"':
+                    self._key = []
+                    self._state = "key"
+            elif st == "key":
+                if ch == '"' and not (self._key and self._key[-1] == "\\"):
+                    self._current = "".join(self._key)
+                    self._state = "colon"
+                else:
+                    self._key.append(ch)
+            elif st == "colon":
+                if ch == ":":
+                    self._state = "value"
+            elif st == "value":
+                if ch == '"':
+                    self._state = "string"
+                elif ch in "{[":
+                    self._skip_depth, self._state = 1, "skip"
+                elif not ch.isspace():
+                    self._skip_depth, self._state = 0, "skip"
+            elif st == "skip":
+                if self._skip_in_str:
+                    if self._skip_escape:
+                        self._skip_escape = False
+                    elif ch == "\\":
+                        self._skip_escape = True
+                    elif ch == '"':
+                        self._skip_in_str = False
+                elif ch == '"':
+                    self._skip_in_str = True
+                elif ch in "{[":
+                    self._skip_depth += 1
+                elif ch in "}]":
+                    if self._skip_depth == 0:
+                        self._state = "start"
+                    else:
+                        self._skip_depth -= 1
+                        if self._skip_depth == 0:
+                            self._state = "after"
+                elif ch == "," and self._skip_depth == 0:
+                    self._state = "start"
+            elif st == "after":
+                if ch == ",":
+                    self._state = "start"
+        flush()
+        return out
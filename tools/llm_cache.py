@@ -0,0 +1,143 @@
+# tools/llm_cache.py
+"""
+Content-addressed cache for JSON completions.
+
+Entries are keyed on (model, system prompt, user content, temperature). An
+in-memory LRU sits in front of an optional on-disk SQLite store; both honour a
+TTL, and both are size-bounded (least recently used entries are evicted first).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def cache_key(model: str, system_prompt: str, user: str, temperature: float) -> str:
+    payload = json.dumps([model, system_prompt, user, float(temperature)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        *,
+        table: str = "completions",
+        ttl_s: float = 7 * 24 * 3600,
+        max_memory_items: int = 1024,
+        max_disk_items: int = 100_000,
+    ):
+        """
+        path: SQLite file for the disk tier; None keeps the cache in memory only.
+        """
+        assert table.isidentifier(), "table must be a plain identifier"
+        self.path = path
+        self.table = table
+        self.ttl_s = ttl_s
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a fresh copy of the cached object, or None.
+        """
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and now - hit[0] <= self.ttl_s:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return json.loads(hit[1])
+            if hit is not None:
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl_s:
+                    self._db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self._stats["disk_hits"] += 1
+                    return json.loads(row[0])
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now, encoded)
+            self._stats["writes"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, encoded, now, now),
+                )
+                # Trim the disk tier every so often rather than on every write
+                if self._stats["writes"] % 100 == 0:
+                    self._evict_disk(now)
+                self._db.commit()
+
+    def _remember(self, key: str, created: float, encoded: str) -> None:
+        self._memory[key] = (created, encoded)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_disk(self, now: float) -> None:
+        cur = self._db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl_s,))
+        removed = cur.rowcount
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_disk_items:
+            cur = self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_disk_items,),
+            )
+            removed += cur.rowcount
+        self._stats["evictions"] += max(removed, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return: {memory_hits, disk_hits, misses, writes, evictions, hit_rate, memory_items}
+        """
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["memory_items"] = len(self._memory)
+        lookups = out["memory_hits"] + out["disk_hits"] + out["misses"]
+        out["hit_rate"] = ((out["memory_hits"] + out["disk_hits"]) / lookups) if lookups else 0.0
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.table}")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
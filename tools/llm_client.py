@@ -0,0 +1,104 @@
+# tools/llm_client.py
+"""
+Process-wide OpenAI clients.
+
+Clients are created once per process and keep an httpx connection pool with
+keep-alive, so writer calls reuse sockets instead of paying a TLS handshake each.
+
+Environment variables:
+  - OPENAI_API_KEY (required)
+  - OPENAI_API_BASE (optional, for compatible gateways)
+  - LLM_POOL_SIZE (max open connections, default 20)
+  - LLM_KEEPALIVE (max idle keep-alive connections, default 10)
+  - LLM_TIMEOUT (read timeout in seconds, default 60)
+  - LLM_CONNECT_TIMEOUT (connect timeout in seconds, default 10)
+"""
+from __future__ import annotations
+import os
+import threading
+from typing import Optional
+
+
+_lock = threading.Lock()
+_sync_client = None
+_async_client = None
+
+
+def _client_kwargs() -> dict:
+    api_key = os.getenv("OPENAI_API_KEY")
+    assert api_key, "Set OPENAI_API_KEY in your environment."
+    kwargs = {"api_key": api_key, "max_retries": 2}
+    base = os.getenv("OPENAI_API_BASE")  # e.g., https://api.aimlapi.com/v1
+    if base:
+        kwargs["base_url"] = base
+    return kwargs
+
+
+def _pool_settings():
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_POOL_SIZE", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_KEEPALIVE", "10")),
+        keepalive_expiry=30.0,
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("LLM_TIMEOUT", "60")),
+        connect=float(os.getenv("LLM_CONNECT_TIMEOUT", "10")),
+    )
+    return limits, timeout
+
+
+def get_client():
+    """
+    Return the shared synchronous OpenAI client, creating it on first use.
+    """
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                import httpx
+                from openai import OpenAI
+
+                limits, timeout = _pool_settings()
+                _sync_client = OpenAI(
+                    http_client=httpx.Client(limits=limits, timeout=timeout),
+                    timeout=timeout,
+                    **_client_kwargs(),
+                )
+    return _sync_client
+
+
+def get_async_client():
+    """
+    Return the shared AsyncOpenAI client, creating it on first use.
+    The underlying pool is bound to the event loop it is first used on.
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                import httpx
+                from openai import AsyncOpenAI
+
+                limits, timeout = _pool_settings()
+                _async_client = AsyncOpenAI(
+                    http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+                    timeout=timeout,
+                    **_client_kwargs(),
+                )
+    return _async_client
+
+
+def reset_clients(close: bool = True) -> None:
+    """
+    Drop the shared clients (e.g. after changing OPENAI_API_BASE or forking).
+    The async client can only be closed from a running loop, so it is just dropped.
+    """
+    global _sync_client, _async_client
+    with _lock:
+        client: Optional[object] = _sync_client
+        _sync_client = None
+        _async_client = None
+    if close and client is not None:
+        client.close()
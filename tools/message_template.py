@@ -0,0 +1,183 @@
+# tools/message_template.py
+"""
+Precompiled MIME messages for bulk sends.
+
+A MessageTemplate builds and serialises the MIME tree once, with slots for the
+per-recipient headers and bodies. Rendering a recipient fills the {{placeholder}}
+values into the (small) bodies, base64-encodes them and joins the bytes, instead
+of rebuilding and re-serialising the whole message (and re-encoding attachments)
+every time.
+
+Header values containing CR or LF are rejected with ValueError, as the email
+package does, so a CSV value can never add headers of its own.
+"""
+from __future__ import annotations
+import base64
+import html
+import os
+import re
+from email.charset import Charset
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr, getaddresses
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from tools.attachment_cache import AttachmentCache
+
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+_SLOT_RE = re.compile(rb"@@MT:(\w+):(\w+)@@")
+_HEADERS_SLOT = "@@MT:hdr:all@@"
+_HEADERS_LINE = f"X-Email-Agent-Headers: {_HEADERS_SLOT}\n".encode("ascii")
+_ADDRESS_HEADERS = ("From", "To", "Cc", "Bcc", "Reply-To")
+
+_UTF8 = Charset("utf-8")
+_UTF8.body_encoding = None  # the slot token is serialised verbatim; render() encodes the body
+
+
+def personalise(text: str, values: Dict[str, Any], *, escape: bool = False) -> str:
+    """
+    Replace {{name}} placeholders with values. Unknown placeholders are left
+    untouched; values are HTML-escaped when escape=True.
+    """
+    def sub(m: "re.Match[str]") -> str:
+        key = m.group(1)
+        if key not in values:
+            return m.group(0)
+        value = str(values[key])
+        return html.escape(value) if escape else value
+
+    return PLACEHOLDER_RE.sub(sub, text)
+
+
+def _header_line(name: str, value: str) -> str:
+    if "\r" in value or "\n" in value:
+        raise ValueError(f"{name} header may not contain CR or LF: {value!r}")
+    if value.isascii():
+        return f"{name}: {value}\n"
+    if name in _ADDRESS_HEADERS:
+        addrs = ", ".join(formataddr(pair, charset="utf-8") for pair in getaddresses([value]))
+        return f"{name}: {addrs}\n"
+    return f"{name}: {Header(value, 'utf-8', header_name=name).encode()}\n"
+
+
+def _body_part(index: int, subtype: str) -> MIMEText:
+    part = MIMEText(f"@@MT:body:{index}@@", subtype, _UTF8)
+    # base64 like create_message: no 998-octet line limit to break, whatever the values are
+    del part["Content-Transfer-Encoding"]
+    part["Content-Transfer-Encoding"] = "base64"
+    return part
+
+
+class MessageTemplate:
+    def __init__(
+        self,
+        *,
+        subject: str,
+        body_html: Optional[str] = None,
+        body_text: Optional[str] = None,
+        attachments: Optional[Iterable[str]] = None,
+        sender: Optional[str] = None,
+        attachment_cache: Optional[AttachmentCache] = None,
+    ):
+        """
+        Same content arguments as create_message; subject and bodies may contain
+        {{name}} placeholders, filled in per recipient by render().
+        """
+        self.subject = subject
+        self.sender = sender
+        paths = [p.strip() for p in (attachments or []) if p.strip()]
+        for path in paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Attachment not found: {path}")
+
+        # (text, html-escape values) per body slot
+        self._bodies: List[Tuple[str, bool]] = []
+
+        def body(text: str, subtype: str) -> MIMEText:
+            self._bodies.append((text, subtype == "html"))
+            return _body_part(len(self._bodies) - 1, subtype)
+
+        # Same structure create_message produces
+        if paths:
+            msg = MIMEMultipart()
+            alt = MIMEMultipart("alternative")
+            msg.attach(alt)
+            if body_text:
+                alt.attach(body(body_text, "plain"))
+            if body_html:
+                alt.attach(body(body_html, "html"))
+        else:
+            msg = MIMEMultipart("alternative")
+            if body_html:
+                msg.attach(body(body_html, "html"))
+            else:
+                msg.attach(body(body_text or "", "plain"))
+
+        msg["X-Email-Agent-Headers"] = _HEADERS_SLOT
+        cache = attachment_cache or AttachmentCache()
+        for path in paths:
+            msg.attach(cache.part(path))
+
+        skeleton = msg.as_bytes().replace(_HEADERS_LINE, _HEADERS_SLOT.encode("ascii"), 1)
+        self._segments: List[Union[bytes, Tuple[str, str]]] = []
+        pos = 0
+        for m in _SLOT_RE.finditer(skeleton):
+            self._segments.append(skeleton[pos:m.start()])
+            self._segments.append((m.group(1).decode("ascii"), m.group(2).decode("ascii")))
+            pos = m.end()
+        self._segments.append(skeleton[pos:])
+
+    def render_bytes(
+        self,
+        to: str,
+        values: Optional[Dict[str, Any]] = None,
+        *,
+        cc: Optional[str] = None,
+        bcc: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> bytes:
+        """
+        The RFC 822 message for one recipient.
+        Raises ValueError when a header value (including the filled-in subject) contains CR or LF.
+        """
+        values = values or {}
+        lines = [("To", to), ("Subject", personalise(self.subject, values))]
+        if self.sender:
+            lines.append(("From", self.sender))
+        if cc:
+            lines.append(("Cc", cc))
+        if bcc:
+            lines.append(("Bcc", bcc))
+        lines.extend((headers or {}).items())
+        header_block = "".join(_header_line(n, v) for n, v in lines).encode("utf-8")
+
+        out: List[bytes] = []
+        for seg in self._segments:
+            if isinstance(seg, bytes):
+                out.append(seg)
+                continue
+            kind, name = seg
+            if kind == "hdr":
+                out.append(header_block)
+            else:
+                text, escape = self._bodies[int(name)]
+                encoded = base64.encodebytes(personalise(text, values, escape=escape).encode("utf-8"))
+                out.append(encoded.rstrip(b"\n"))  # the skeleton already ends the line
+        return b"".join(out)
+
+    def render(
+        self,
+        to: str,
+        values: Optional[Dict[str, Any]] = None,
+        *,
+        cc: Optional[str] = None,
+        bcc: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Same shape as create_message: {"raw", "bcc"}.
+        """
+        raw = base64.urlsafe_b64encode(self.render_bytes(to, values, cc=cc, bcc=bcc, headers=headers)).decode()
+        return {"raw": raw, "bcc": bcc}
@@ -0,0 +1,380 @@
+# tools/model_router.py
+"""
+Latency-aware routing across several models for one role (parser or writer).
+
+Each model keeps a rolling window of recent calls: latency, errors and tokens.
+A request goes to the fastest healthy model that is allowed for its size, and
+when it runs past that model's p95 a hedged copy goes to the next-best model;
+whichever answers first wins. acall() cancels the loser; call() can't interrupt
+a blocking request, so there the loser finishes in the background. call() only
+leaves the calling thread when a hedge deadline applies.
+
+    PARSER_MODELS="gpt-4.1-nano@1500,gpt-4o-mini"
+    WRITER_MODELS="gpt-4o-mini,gpt-4o"
+
+"model@N" only takes prompts of up to N characters (small models for short
+prompts); models without a limit take anything. Order is the preference used
+until there are measurements. Without PARSER_MODELS / WRITER_MODELS the fixed
+PARSER_MODEL / WRITER_MODEL is used and nothing is routed.
+
+Other environment variables:
+  - LLM_HEDGE (send hedged requests; 0 disables, default 1)
+  - LLM_HEDGE_BUDGET (max share of requests that may be hedged, default 0.1)
+  - LLM_ROUTER_WINDOW (seconds of history per model, default 300)
+  - LLM_ROUTER_EXPLORE (share of requests sent to a random other model so a
+    slow or failing one that has recovered is noticed, default 0.05)
+  - LLM_PRICES (per-million-token prices, "model=input/output,...", for cost stats)
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from tools import instrumentation
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+LLM_ROUTER_WINDOW = float(os.getenv("LLM_ROUTER_WINDOW", "300"))
+LLM_ROUTER_EXPLORE = float(os.getenv("LLM_ROUTER_EXPLORE", "0.05"))
+
+# Calls needed before a model's p95 is trusted as a hedging deadline
+MIN_SAMPLES = 10
+# Error share (over at least MIN_ERROR_SAMPLES calls) above which a model is skipped
+MAX_ERROR_RATE = 0.5
+MIN_ERROR_SAMPLES = 3
+
+_Sample = Tuple[float, float, bool, int, int]  # (at, latency_s, ok, prompt_tokens, completion_tokens)
+
+
+def parse_model_list(spec: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    "a@1500, b" -> [("a", 1500), ("b", None)]
+    """
+    models = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, limit = item.rpartition("@") if "@" in item else (item, "", "")
+        models.append((name.strip(), int(limit) if limit else None))
+    return models
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    "a=0.15/0.6,b=2.5/10" -> {"a": (0.15, 0.6), "b": (2.5, 10.0)}  (USD per million tokens)
+    """
+    prices = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, _, pair = item.partition("=")
+        inp, _, out = pair.partition("/")
+        prices[name.strip()] = (float(inp), float(out or inp))
+    return prices
+
+
+LLM_PRICES = parse_prices(os.getenv("LLM_PRICES", ""))
+
+
+def _percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+class ModelStats:
+    def __init__(self, name: str, max_chars: Optional[int] = None, window_s: float = LLM_ROUTER_WINDOW):
+        self.name = name
+        self.max_chars = max_chars
+        self.window_s = window_s
+        self.samples: Deque[_Sample] = deque()
+        self.calls = 0
+        self.cost_usd = 0.0
+
+    def _prune(self, now: float) -> None:
+        while self.samples and self.samples[0][0] < now - self.window_s:
+            self.samples.popleft()
+
+    def record(self, latency_s: float, ok: bool, usage: Any = None) -> None:
+        prompt = int(getattr(usage, "prompt_tokens", 0) or 0) if usage is not None else 0
+        completion = int(getattr(usage, "completion_tokens", 0) or 0) if usage is not None else 0
+        now = time.time()
+        self.samples.append((now, latency_s, ok, prompt, completion))
+        self.calls += 1
+        price = LLM_PRICES.get(self.name)
+        if price:
+            self.cost_usd += (prompt * price[0] + completion * price[1]) / 1e6
+        self._prune(now)
+
+    def latencies(self) -> List[float]:
+        self._prune(time.time())
+        return [s[1] for s in self.samples if s[2]]
+
+    def error_rate(self) -> float:
+        self._prune(time.time())
+        if not self.samples:
+            return 0.0
+        return sum(1 for s in self.samples if not s[2]) / len(self.samples)
+
+    def healthy(self) -> bool:
+        return len(self.samples) < MIN_ERROR_SAMPLES or self.error_rate() <= MAX_ERROR_RATE
+
+    def p(self, q: float) -> Optional[float]:
+        lat = self.latencies()
+        return _percentile(lat, q) if lat else None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return: {model, max_chars, calls, window_calls, p50_s, p95_s, error_rate, tokens, cost_usd}
+        """
+        self._prune(time.time())
+        p50, p95 = self.p(0.5), self.p(0.95)
+        return {
+            "model": self.name,
+            "max_chars": self.max_chars,
+            "calls": self.calls,
+            "window_calls": len(self.samples),
+            "p50_s": round(p50, 4) if p50 is not None else None,
+            "p95_s": round(p95, 4) if p95 is not None else None,
+            "error_rate": round(self.error_rate(), 4),
+            "tokens": sum(s[3] + s[4] for s in self.samples),
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        return _executor
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        models: List[Tuple[str, Optional[int]]],
+        *,
+        hedge: bool = LLM_HEDGE,
+        hedge_budget: float = LLM_HEDGE_BUDGET,
+        window_s: float = LLM_ROUTER_WINDOW,
+        explore: float = LLM_ROUTER_EXPLORE,
+    ):
+        assert models, "ModelRouter needs at least one model"
+        self.models = [ModelStats(name, limit, window_s) for name, limit in models]
+        self.hedge = hedge
+        self.hedge_budget = hedge_budget
+        self.explore = explore
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def ranked(self, size: int = 0) -> List[ModelStats]:
+        """
+        Models allowed for a prompt of `size` characters, best first: healthy before
+        unhealthy, then models without recent measurements (so they get measured),
+        then lowest p50. Falls back to every model if none is allowed for the size.
+        """
+        with self._lock:
+            allowed = [m for m in self.models if m.max_chars is None or size <= m.max_chars] or list(self.models)
+
+            def score(m: ModelStats) -> tuple:
+                p50 = m.p(0.5)
+                return (not m.healthy(), p50 is not None, p50 or 0.0, m.error_rate())
+
+            # sorted() is stable, so configured order breaks ties
+            return sorted(allowed, key=score)
+
+    def choose(self, size: int = 0) -> str:
+        """
+        Name of the best model for a prompt of `size` characters (for callers that
+        cannot go through call(), e.g. streaming; report back with record()).
+        """
+        return self.ranked(size)[0].name
+
+    def record(self, name: str, latency_s: float, ok: bool, usage: Any = None) -> None:
+        for m in self.models:
+            if m.name == name:
+                self._record(m, latency_s, ok, usage)
+                return
+
+    def _deadline(self, model: ModelStats) -> Optional[float]:
+        if not self.hedge:
+            return None
+        with self._lock:
+            lat = model.latencies()
+            return _percentile(lat, 0.95) if len(lat) >= MIN_SAMPLES else None
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.hedge_budget * self.requests:
+                return False
+            self.hedges += 1
+        instrumentation.incr("llm_hedges")
+        return True
+
+    def _record(self, model: ModelStats, latency_s: float, ok: bool, usage: Any = None) -> None:
+        with self._lock:
+            model.record(latency_s, ok, usage)
+
+    def _timed(self, model: ModelStats, fn: Callable[[str], Any]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            resp = fn(model.name)
+        except Exception:
+            self._record(model, time.perf_counter() - t0, False)
+            raise
+        self._record(model, time.perf_counter() - t0, True, getattr(resp, "usage", None))
+        return resp
+
+    async def _atimed(self, model: ModelStats, afn: Callable[[str], Awaitable[Any]]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            resp = await afn(model.name)
+        except Exception:
+            self._record(model, time.perf_counter() - t0, False)
+            raise
+        self._record(model, time.perf_counter() - t0, True, getattr(resp, "usage", None))
+        return resp
+
+    def _plan(self, size: int) -> Tuple[ModelStats, ModelStats]:
+        with self._lock:
+            self.requests += 1
+        ranked = self.ranked(size)
+        if len(ranked) > 1 and random.random() < self.explore:
+            # Measure another model now and then; the best one is the fallback
+            return random.choice(ranked[1:]), ranked[0]
+        return ranked[0], ranked[1] if len(ranked) > 1 else ranked[0]
+
+    def call(self, fn: Callable[[str], Any], *, size: int = 0) -> Any:
+        """
+        fn(model_name) -> response. Runs it on the best model and fails over once to the
+        next-best on error. Past the model's p95 a hedge goes to the next-best model and
+        whichever answers first wins; the other request finishes in the background.
+        """
+        primary, backup = self._plan(size)
+        deadline = self._deadline(primary) if backup is not primary else None
+        if deadline is None:
+            try:
+                return self._timed(primary, fn)
+            except Exception:
+                if backup is primary:
+                    raise
+                instrumentation.incr("llm_failovers")
+                return self._timed(backup, fn)
+
+        # Both requests run in the caller's context, so their spans and tokens land in the caller's trace
+        ctx = contextvars.copy_context()
+        first = _pool().submit(ctx.copy().run, self._timed, primary, fn)
+        done, _ = wait([first], timeout=deadline)
+        if first in done:
+            if first.exception() is None:
+                return first.result()
+            instrumentation.incr("llm_failovers")
+            return self._timed(backup, fn)
+        if not self._take_hedge():
+            return first.result()
+
+        second = _pool().submit(ctx.copy().run, self._timed, backup, fn)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is second:
+                        instrumentation.incr("llm_hedge_wins")
+                    return f.result()
+                error = f.exception()
+        raise error
+
+    async def acall(self, afn: Callable[[str], Awaitable[Any]], *, size: int = 0) -> Any:
+        """
+        Async variant of call(); the losing request of a hedge is cancelled.
+        """
+        primary, backup = self._plan(size)
+        deadline = self._deadline(primary)
+        if deadline is None:
+            try:
+                return await self._atimed(primary, afn)
+            except Exception:
+                if backup is primary:
+                    raise
+                instrumentation.incr("llm_failovers")
+                return await self._atimed(backup, afn)
+
+        first = asyncio.ensure_future(self._atimed(primary, afn))
+        done, _ = await asyncio.wait({first}, timeout=deadline)
+        if first in done:
+            if first.exception() is None:
+                return first.result()
+            if backup is primary:
+                raise first.exception()
+            instrumentation.incr("llm_failovers")
+            return await self._atimed(backup, afn)
+        if not self._take_hedge():
+            return await first
+
+        second = asyncio.ensure_future(self._atimed(backup, afn))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for f in done:
+                    if f.exception() is None:
+                        if f is second:
+                            instrumentation.incr("llm_hedge_wins")
+                        return f.result()
+                    error = f.exception()
+            raise error
+        finally:
+            for f in pending:
+                f.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return: {requests, hedges, models: [ModelStats.stats(), ...]}
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "models": [m.stats() for m in self.models],
+            }
+
+
+_routers_lock = threading.Lock()
+_routers: Dict[str, Optional[ModelRouter]] = {}
+
+
+def get_router(kind: str) -> Optional[ModelRouter]:
+    """
+    Shared router for 'parser' (PARSER_MODELS) or 'writer' (WRITER_MODELS);
+    None when that variable is unset.
+    """
+    assert kind in ("parser", "writer")
+    with _routers_lock:
+        if kind not in _routers:
+            models = parse_model_list(os.getenv(f"{kind.upper()}_MODELS", ""))
+            _routers[kind] = ModelRouter(models) if models else None
+        return _routers[kind]
+
+
+def router_stats() -> Dict[str, Any]:
+    """
+    Return: {kind: ModelRouter.stats()} for the routers in use.
+    """
+    with _routers_lock:
+        routers = {k: r for k, r in _routers.items() if r is not None}
+    return {k: r.stats() for k, r in routers.items()}
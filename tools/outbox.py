@@ -0,0 +1,296 @@
+# tools/outbox.py
+"""
+Durable outbox for built messages.
+
+Messages are enqueued in SQLite with an idempotency key and drained by a pool of
+worker threads. Every state change is committed before and after the Gmail
+call, so a crashed run resumes where it stopped:
+  - 'pending' rows are simply picked up again;
+  - 'sending' rows whose lease expired, or whose owning process on this host
+    is gone (the worker died mid-call), and any row being retried, are checked
+    against Gmail by their Message-ID first, so a message that did go out is
+    recorded rather than sent twice.
+
+Environment variables:
+  - OUTBOX_DEDUPE_WINDOW (seconds a repeated prompt without an explicit
+    idempotency key maps to the same row, default 3600)
+"""
+from __future__ import annotations
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from tools.gmail_tool import send_message, create_draft, RETRYABLE_STATUSES, _http_status
+
+
+MESSAGE_ID_DOMAIN = "email-agent.local"
+OUTBOX_DEDUPE_WINDOW = float(os.getenv("OUTBOX_DEDUPE_WINDOW", "3600"))
+
+
+def make_idempotency_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def windowed_key(base_key: str, window_s: float = OUTBOX_DEDUPE_WINDOW, now: Optional[float] = None) -> str:
+    """
+    base_key scoped to the window_s-long time bucket `now` falls in.
+    """
+    now = time.time() if now is None else now
+    return f"{base_key}-{int(now // window_s)}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # exists but not ours, or the platform can't tell
+        return True
+    return True
+
+
+def message_id_for(idempotency_key: str) -> str:
+    """
+    Deterministic Message-ID header for a key; used to find already-sent messages.
+    """
+    return f"<{idempotency_key}@{MESSAGE_ID_DOMAIN}>"
+
+
+class Outbox:
+    def __init__(self, path: str = "outbox.sqlite", *, lease_s: float = 300.0, max_attempts: int = 5):
+        """
+        lease_s: how long a claimed row stays reserved before another worker may recover it.
+        """
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._host = socket.gethostname()
+        # Recorded on every claim so a later drain can tell abandoned rows from live ones
+        self.owner = f"{self._host}:{os.getpid()}"
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " idempotency_key TEXT NOT NULL UNIQUE,"
+            " action TEXT NOT NULL,"
+            " raw TEXT NOT NULL,"
+            " to_addr TEXT, subject TEXT,"
+            " status TEXT NOT NULL DEFAULT 'pending',"  # pending | sending | sent | failed
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " gmail_id TEXT, error TEXT,"
+            " lease_until REAL, owner TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        columns = {r["name"] for r in db.execute("PRAGMA table_info(outbox)")}
+        if "owner" not in columns:  # outboxes created before owners were recorded
+            db.execute("ALTER TABLE outbox ADD COLUMN owner TEXT")
+        db.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox(status, id)")
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite handles cross-thread/process locking
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def enqueue(
+        self,
+        message: Dict[str, Any],
+        *,
+        idempotency_key: str,
+        action: str = "send",
+        to: str = "",
+        subject: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Add a message built by create_message (with headers={"Message-ID": message_id_for(key)}).
+        Enqueuing an existing key is a no-op. Returns the stored row.
+        """
+        assert message and "raw" in message
+        assert action in ("send", "draft")
+        now = time.time()
+        db = self._db()
+        db.execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, action, raw, to_addr, subject, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (idempotency_key, action, message["raw"], to, subject, now, now),
+        )
+        return self.get(idempotency_key)
+
+    def get(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        row = self._db().execute("SELECT * FROM outbox WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        return dict(row) if row else None
+
+    def find_recent(self, base_key: str, window_s: float = OUTBOX_DEDUPE_WINDOW) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Return (key to enqueue under, row enqueued for base_key in the last window_s seconds or None).
+        """
+        now = time.time()
+        key = windowed_key(base_key, window_s, now)
+        previous = windowed_key(base_key, window_s, now - window_s)
+        row = self._db().execute(
+            "SELECT * FROM outbox WHERE idempotency_key IN (?, ?) AND created >= ? ORDER BY id DESC LIMIT 1",
+            (key, previous, now - window_s),
+        ).fetchone()
+        return key, dict(row) if row else None
+
+    def release_abandoned(self) -> int:
+        """
+        Expire the leases of 'sending' rows claimed by processes on this host that
+        no longer run, so they are recovered now rather than after lease_s.
+        Returns the number of rows released.
+        """
+        db = self._db()
+        owners = [r[0] for r in db.execute("SELECT DISTINCT owner FROM outbox WHERE status = 'sending'")]
+        dead = []
+        for owner in owners:
+            host, _, pid = (owner or "").rpartition(":")
+            if host == self._host and pid.isdigit() and owner != self.owner and not _process_alive(int(pid)):
+                dead.append(owner)
+        released = 0
+        for owner in dead:
+            released += db.execute(
+                "UPDATE outbox SET lease_until = 0 WHERE status = 'sending' AND owner = ?", (owner,)
+            ).rowcount
+        return released
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically reserve the next pending (or abandoned 'sending') row.
+        The returned row has recovering=True when a previous attempt may have reached Gmail.
+        """
+        now = time.time()
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT * FROM outbox WHERE (status = 'pending' AND (lease_until IS NULL OR lease_until < ?))"
+                " OR (status = 'sending' AND lease_until < ?) ORDER BY id LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE outbox SET status = 'sending', attempts = attempts + 1, lease_until = ?, owner = ?,"
+                    " updated = ? WHERE id = ?",
+                    (now + self.lease_s, self.owner, now, row["id"]),
+                )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        item = dict(row)
+        item["attempts"] += 1
+        # Any earlier attempt (crashed, timed out, errored) may have reached Gmail
+        item["recovering"] = row["attempts"] > 0
+        return item
+
+    def mark_sent(self, row_id: int, gmail_id: Optional[str]) -> None:
+        self._db().execute(
+            "UPDATE outbox SET status = 'sent', gmail_id = ?, error = NULL, lease_until = NULL, updated = ?"
+            " WHERE id = ?",
+            (gmail_id, time.time(), row_id),
+        )
+
+    def mark_failed(self, row_id: int, error: str, *, retry: bool, attempts: int = 1) -> None:
+        """
+        retry=True puts the row back to 'pending', held back with exponential backoff.
+        """
+        now = time.time()
+        not_before = now + min(60.0, 1.5 ** attempts) if retry else None
+        self._db().execute(
+            "UPDATE outbox SET status = ?, error = ?, lease_until = ?, updated = ? WHERE id = ?",
+            ("pending" if retry else "failed", error, not_before, now, row_id),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        out = {"pending": 0, "sending": 0, "sent": 0, "failed": 0}
+        out.update({r[0]: r[1] for r in rows})
+        return out
+
+
+def _find_existing(service, item: Dict[str, Any]) -> Optional[str]:
+    """
+    Look up a message/draft Gmail already holds for this row's Message-ID.
+    """
+    q = f"rfc822msgid:{message_id_for(item['idempotency_key'])}"
+    if item["action"] == "draft":
+        found = service.users().drafts().list(userId="me", q=q, maxResults=1).execute().get("drafts", [])
+    else:
+        found = service.users().messages().list(userId="me", q=q, maxResults=1).execute().get("messages", [])
+    return found[0]["id"] if found else None
+
+
+def _process(outbox: Outbox, service, item: Dict[str, Any]) -> None:
+    can_retry = item["attempts"] < outbox.max_attempts
+    try:
+        if item["recovering"]:
+            existing = _find_existing(service, item)
+            if existing:
+                outbox.mark_sent(item["id"], existing)
+                return
+        message = {"raw": item["raw"]}
+        if item["action"] == "draft":
+            res = create_draft(service, message=message)
+        else:
+            res = send_message(service, message=message)
+        outbox.mark_sent(item["id"], res.get("id"))
+    except HttpError as e:
+        retry = can_retry and _http_status(e) in RETRYABLE_STATUSES
+        outbox.mark_failed(item["id"], str(e), retry=retry, attempts=item["attempts"])
+    except Exception as e:
+        outbox.mark_failed(item["id"], str(e), retry=can_retry, attempts=item["attempts"])
+
+
+def drain(
+    outbox: Outbox,
+    service_factory: Callable[[], Any],
+    *,
+    workers: int = 4,
+    stop_when_empty: bool = True,
+    poll_s: float = 1.0,
+) -> Dict[str, int]:
+    """
+    Send everything in the outbox with `workers` threads; call again after a crash to resume.
+    Rows a dead process on this host left in 'sending' are recovered at once; rows
+    still leased by another process are waited for.
+    Each worker gets its service from service_factory(); services from build_gmail_service
+    are thread-safe, so the factory may return the same one every time.
+    Returns outbox.stats() when done.
+    """
+    released = outbox.release_abandoned()
+    if released:
+        print(f"🔁 Recovering {released} message(s) left mid-send by a stopped process")
+
+    def worker() -> int:
+        service = service_factory()
+        done = 0
+        while True:
+            item = outbox.claim()
+            if item is None:
+                # Rows waiting out a retry backoff are still 'pending'; 'sending' rows
+                # are either in flight or come back when their lease expires
+                stats = outbox.stats()
+                if stop_when_empty and stats["pending"] == 0 and stats["sending"] == 0:
+                    return done
+                time.sleep(poll_s)
+                continue
+            _process(outbox, service, item)
+            done += 1
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbox") as pool:
+        for f in [pool.submit(worker) for _ in range(workers)]:
+            f.result()
+    return outbox.stats()
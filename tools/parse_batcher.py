@@ -0,0 +1,374 @@
+# tools/parse_batcher.py
+"""
+Micro-batched intent parsing.
+
+Prompts that arrive within a few milliseconds of each other are parsed with
+one parser completion over a JSON array instead of one completion each:
+
+    batcher = get_parse_batcher()
+    fields = batcher.parse(prompt)          # from many threads, or
+    fields = await batcher.aparse(prompt)   # from many tasks
+
+Each caller gets the same dict parse_prompt_to_fields would return: the fast
+path and the parser cache are checked per prompt first, and every item goes
+through the usual normalisation and regex fallback. Items missing from a batch
+answer, a malformed answer, and items naming an address that is not in their
+own prompt (the model mixed up ids) are re-parsed with single calls. Batch
+answers are never cached. Token usage of a batch is split evenly over its
+callers' traces.
+
+Environment variables:
+  - PARSE_BATCH_WINDOW_MS (how long the first prompt waits for company, default 10)
+  - PARSE_BATCH_SIZE (max prompts per completion, default 16)
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import json
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from tools import instrumentation
+from tools.email_writer import (
+    FAST_PARSE,
+    PARSER_MODEL,
+    _PARSER_SYSTEM_PROMPT,
+    _achat_json,
+    _chat_json,
+    _normalize_fields,
+    aparse_prompt_to_fields,
+    get_cache,
+    parse_prompt_to_fields,
+)
+from tools.intent_parser import fast_parse
+from tools.llm_cache import cache_key
+from tools.model_router import get_router
+
+PARSE_BATCH_WINDOW_MS = float(os.getenv("PARSE_BATCH_WINDOW_MS", "10"))
+PARSE_BATCH_SIZE = int(os.getenv("PARSE_BATCH_SIZE", "16"))
+
+_BATCH_PARSER_SYSTEM_PROMPT = (
+    "Extract email-send intent from each user instruction in a JSON array of {id, prompt} objects. "
+    'Return JSON {"results": [...]} with one object per instruction, in the same order, with keys: '
+    "id, to_email, to_name, tone, cc, bcc, action, subject_override, notes. "
+    "cc/bcc must be comma-separated strings or empty. "
+    "If an item is missing, set it to an empty string. DO NOT invent emails. "
+    "Each instruction is independent: never copy details from one into another."
+)
+
+_USAGE_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens")
+_EMAIL_RE = re.compile(r"[\w\.\+-]+@[\w\.-]+\.\w+")
+_ADDRESS_FIELDS = ("to_email", "cc", "bcc")
+
+# (fields, this caller's share of the batch's token usage)
+_Result = Tuple[Dict[str, Any], Dict[str, float]]
+
+
+def split_batch_answer(data: Any, n: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Map a batch answer back to its n prompts; None where an item is missing or malformed.
+    Items are matched by id when they carry one, else by position (only if the count matches).
+    """
+    results = data.get("results") if isinstance(data, dict) else None
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+    if not isinstance(results, list):
+        return out
+    by_position = len(results) == n
+    for pos, item in enumerate(results):
+        if not isinstance(item, dict):
+            continue
+        i = item.pop("id", None)
+        if not isinstance(i, int) or isinstance(i, bool):
+            i = pos if by_position else None
+        if i is not None and 0 <= i < n and out[i] is None:
+            out[i] = item
+    return out
+
+
+def addresses_in_prompt(item: Dict[str, Any], prompt: str) -> bool:
+    """
+    True if every address in the item's to_email / cc / bcc appears in its prompt.
+    """
+    text = prompt.lower()
+    for field in _ADDRESS_FIELDS:
+        for addr in _EMAIL_RE.findall(str(item.get(field) or "")):
+            if addr.lower() not in text:
+                return False
+    return True
+
+
+def _share(usage: Dict[str, int], n: int) -> Dict[str, float]:
+    return {k: usage.get(k, 0) / n for k in _USAGE_KEYS}
+
+
+class ParseBatcher:
+    def __init__(
+        self,
+        *,
+        window_ms: float = PARSE_BATCH_WINDOW_MS,
+        max_batch: int = PARSE_BATCH_SIZE,
+        fast_path: Optional[bool] = None,
+    ):
+        assert max_batch >= 1, "max_batch must be at least 1"
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.fast_path = FAST_PARSE if fast_path is None else fast_path
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._timer: Optional[threading.Timer] = None
+        # Per event loop: its futures can only be resolved on that loop
+        self._apending: Dict[asyncio.AbstractEventLoop, List[Tuple[str, "asyncio.Future[_Result]"]]] = {}
+        self._ahandles: Dict[asyncio.AbstractEventLoop, asyncio.TimerHandle] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"local": 0, "batches": 0, "batched": 0, "single": 0, "fallbacks": 0}
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def _local(self, prompt: str) -> Optional[Dict[str, Any]]:
+        # Same shortcuts parse_prompt_to_fields takes, so they never wait for a batch
+        if self.fast_path:
+            data = fast_parse(prompt)
+            if data is not None:
+                self._count("local")
+                return _normalize_fields(data, prompt)
+        cache = get_cache("parser")
+        if cache:
+            hit = cache.get(cache_key(PARSER_MODEL, _PARSER_SYSTEM_PROMPT, prompt, 0))
+            if hit is not None:
+                self._count("local")
+                instrumentation.incr("llm_cache_hits")
+                return _normalize_fields(dict(hit), prompt)
+        return None
+
+    def _request(self, prompts: List[str]) -> str:
+        return json.dumps([{"id": i, "prompt": p} for i, p in enumerate(prompts)], ensure_ascii=False)
+
+    def _accept(self, prompts: List[str], data: Any) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+        """
+        Return (normalised fields or None per prompt, indexes that need a single call).
+        """
+        items = split_batch_answer(data, len(prompts))
+        fields: List[Optional[Dict[str, Any]]] = [None] * len(prompts)
+        missing = []
+        for i, (prompt, item) in enumerate(zip(prompts, items)):
+            # Nothing ties an item to its prompt but the model's id, so an address from
+            # another caller's prompt means a mix-up; those are parsed alone. Batch
+            # answers are not cached: single calls fill the cache.
+            if item is None or not addresses_in_prompt(item, prompt):
+                missing.append(i)
+                continue
+            fields[i] = _normalize_fields(item, prompt)
+        return fields, missing
+
+    # ---- threads ----
+
+    def parse(self, prompt: str) -> Dict[str, Any]:
+        """
+        Same result as parse_prompt_to_fields(prompt); blocks until the batch is answered.
+        """
+        local = self._local(prompt)
+        if local is not None:
+            return local
+        fut: Future = Future()
+        batch = None
+        with self._lock:
+            self._pending.append((prompt, fut))
+            if len(self._pending) >= self.max_batch:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window_s, self._flush_due)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._run(batch)
+        fields, usage = fut.result()
+        instrumentation.record_usage(usage)
+        return fields
+
+    def _take(self) -> List[Tuple[str, Any]]:
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _flush_due(self) -> None:
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_batch, thread_name_prefix="parse-batch")
+            return self._executor
+
+    def _run(self, batch: List[Tuple[str, Future]]) -> None:
+        prompts = [p for p, _ in batch]
+        futures = [f for _, f in batch]
+        # A private trace collects the batch's tokens so they can be split over the callers
+        with instrumentation.trace() as t:
+            try:
+                fields, missing = self._call(prompts)
+            except BaseException as e:
+                for f in futures:
+                    f.set_exception(e)
+                return
+            errors: Dict[int, BaseException] = {}
+            if missing:
+                ctx = contextvars.copy_context()
+                single = {
+                    i: self._pool().submit(ctx.copy().run, parse_prompt_to_fields, prompts[i], fast_path=False)
+                    for i in missing
+                }
+                for i, f in single.items():
+                    try:
+                        fields[i] = f.result()
+                    except Exception as e:
+                        errors[i] = e
+        share = _share(t.as_dict()["usage"].get("total", {}), len(batch))
+        for i, f in enumerate(futures):
+            if i in errors:
+                f.set_exception(errors[i])
+            else:
+                f.set_result((fields[i], share))
+
+    def _call(self, prompts: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+        if len(prompts) == 1:
+            self._count("single")
+            return [parse_prompt_to_fields(prompts[0], fast_path=False)], []
+        self._count("batches")
+        self._count("batched", len(prompts))
+        try:
+            data = _chat_json(
+                PARSER_MODEL, _BATCH_PARSER_SYSTEM_PROMPT, self._request(prompts), temperature=0,
+                router=get_router("parser"),
+            )
+        except ValueError as e:  # not JSON
+            print(f"⚠️ Batch parse answer was malformed ({e}); parsing one by one")
+            data = None
+        fields, missing = self._accept(prompts, data)
+        if missing:
+            self._count("fallbacks", len(missing))
+        return fields, missing
+
+    # ---- asyncio ----
+
+    async def aparse(self, prompt: str) -> Dict[str, Any]:
+        """
+        Async variant of parse(); batches are per event loop.
+        """
+        local = self._local(prompt)
+        if local is not None:
+            return local
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            pending = self._apending.setdefault(loop, [])
+            pending.append((prompt, fut))
+            batch = self._atake(loop) if len(pending) >= self.max_batch else None
+            if batch is None and loop not in self._ahandles:
+                self._ahandles[loop] = loop.call_later(self.window_s, self._aflush_due, loop)
+        if batch:
+            loop.create_task(self._arun(batch))
+        fields, usage = await fut
+        instrumentation.record_usage(usage)
+        return fields
+
+    def _atake(self, loop: asyncio.AbstractEventLoop) -> List[Tuple[str, "asyncio.Future[_Result]"]]:
+        # Called with self._lock held
+        batch = self._apending.pop(loop, [])
+        handle = self._ahandles.pop(loop, None)
+        if handle is not None:
+            handle.cancel()
+        return batch
+
+    def _aflush_due(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            batch = self._atake(loop)
+        if batch:
+            loop.create_task(self._arun(batch))
+
+    async def _arun(self, batch: List[Tuple[str, "asyncio.Future[_Result]"]]) -> None:
+        prompts = [p for p, _ in batch]
+        futures = [f for _, f in batch]
+        with instrumentation.trace() as t:
+            try:
+                fields, missing = await self._acall(prompts)
+                single = await asyncio.gather(
+                    *(aparse_prompt_to_fields(prompts[i], fast_path=False) for i in missing), return_exceptions=True
+                )
+            except Exception as e:
+                for f in futures:
+                    if not f.done():
+                        f.set_exception(e)
+                return
+            except BaseException:
+                for f in futures:
+                    f.cancel()
+                raise
+        errors: Dict[int, BaseException] = {}
+        for i, res in zip(missing, single):
+            if isinstance(res, BaseException):
+                errors[i] = res
+            else:
+                fields[i] = res
+        share = _share(t.as_dict()["usage"].get("total", {}), len(batch))
+        for i, f in enumerate(futures):
+            if f.done():  # caller went away
+                continue
+            if i in errors:
+                f.set_exception(errors[i])
+            else:
+                f.set_result((fields[i], share))
+
+    async def _acall(self, prompts: List[str]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+        if len(prompts) == 1:
+            self._count("single")
+            return [await aparse_prompt_to_fields(prompts[0], fast_path=False)], []
+        self._count("batches")
+        self._count("batched", len(prompts))
+        try:
+            data = await _achat_json(
+                PARSER_MODEL, _BATCH_PARSER_SYSTEM_PROMPT, self._request(prompts), temperature=0,
+                router=get_router("parser"),
+            )
+        except ValueError as e:
+            print(f"⚠️ Batch parse answer was malformed ({e}); parsing one by one")
+            data = None
+        fields, missing = self._accept(prompts, data)
+        if missing:
+            self._count("fallbacks", len(missing))
+        return fields, missing
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return: {local, batches, batched, single, fallbacks, avg_batch}
+        local: fast-path / cache answers; batched: prompts sent in batches;
+        single: one-prompt windows; fallbacks: batch items re-parsed one by one.
+        """
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+        out["avg_batch"] = round(out["batched"] / out["batches"], 2) if out["batches"] else 0.0
+        return out
+
+
+_default_lock = threading.Lock()
+_default: Optional[ParseBatcher] = None
+
+
+def get_parse_batcher() -> ParseBatcher:
+    """
+    Process-wide batcher, so concurrent agents and workers share batches.
+    """
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ParseBatcher()
+        return _default
@@ -0,0 +1,158 @@
+# tools/rate_limiter.py
+"""
+Token-bucket limiter for Gmail per-user quota units.
+
+Gmail allows roughly 250 quota units per user per second, and each method costs
+a different number of units (messages.send = 100, drafts.create = 10). Acquiring
+units before each call keeps us just under the ceiling instead of hitting 429s
+and backing off.
+
+With a `path`, the bucket lives in a SQLite file, so every thread and every
+process on the host that uses the same file and key shares one budget.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+
+QUOTA_COSTS: Dict[str, int] = {
+    "messages.send": 100,
+    "drafts.create": 10,
+    "drafts.send": 100,
+    "users.getProfile": 1,
+}
+
+DEFAULT_UNITS_PER_SECOND = 250.0
+
+
+class QuotaRateLimiter:
+    def __init__(
+        self,
+        rate: float = DEFAULT_UNITS_PER_SECOND,
+        capacity: Optional[float] = None,
+        *,
+        path: Optional[str] = None,
+        key: str = "me",
+    ):
+        """
+        rate: units refilled per second; capacity: burst size (defaults to one second of
+        rate, but at least the most expensive call, so a low rate still lets sends through).
+        path: SQLite file shared across processes; None keeps the bucket in this process.
+        key: bucket name, normally the Gmail account.
+        Raises ValueError for a non-positive rate or a capacity below the most expensive call.
+        """
+        largest = max(QUOTA_COSTS.values())
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(self.rate, largest))
+        if self.rate <= 0:
+            raise ValueError(f"Gmail quota rate must be positive, got {rate}")
+        if self.capacity < largest:
+            raise ValueError(f"Gmail quota capacity {self.capacity:g} can't cover a {largest}-unit call")
+        self.key = key
+        self.path = path
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _take_local(self, units: float) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= units:
+            self._tokens -= units
+            return 0.0
+        return (units - self._tokens) / self.rate
+
+    def _take_shared(self, units: float) -> float:
+        # Wall clock, not monotonic: the timestamp is compared across processes
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+            wait = 0.0
+            if tokens >= units:
+                tokens -= units
+            else:
+                wait = (units - tokens) / self.rate
+            self._db.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (self.key, tokens, now)
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return wait
+
+    def available(self) -> float:
+        """
+        Units in the bucket right now, without taking any.
+        """
+        with self._lock:
+            if self._db is None:
+                return min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+            row = self._db.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (self.key,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + max(0.0, time.time() - row[1]) * self.rate)
+
+    def try_acquire(self, units: float) -> float:
+        """
+        Take `units` if available. Returns 0.0 on success, else the estimated seconds to wait.
+        """
+        if units > self.capacity:
+            raise ValueError(f"{units} units exceed bucket capacity {self.capacity}")
+        with self._lock:
+            return self._take_shared(units) if self._db is not None else self._take_local(units)
+
+    def acquire(self, units: float, timeout: Optional[float] = None) -> float:
+        """
+        Block until `units` are available; returns the seconds spent waiting.
+        Raises TimeoutError if that would take longer than `timeout`.
+        """
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(units)
+            if wait <= 0:
+                return time.monotonic() - start
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise TimeoutError(f"Gmail quota: {units} units not available within {timeout}s")
+            time.sleep(wait)
+
+    def acquire_for(self, method: str, timeout: Optional[float] = None) -> float:
+        """
+        acquire() the cost of a Gmail API method, e.g. 'messages.send'.
+        """
+        return self.acquire(QUOTA_COSTS[method], timeout=timeout)
+
+
+_default_lock = threading.Lock()
+_default: Dict[str, Optional[QuotaRateLimiter]] = {}
+
+
+def get_rate_limiter(key: Optional[str] = None) -> Optional[QuotaRateLimiter]:
+    """
+    Process-wide limiter for one Gmail account, shared with other processes through a SQLite file.
+    key: bucket name (default GMAIL_RATE_LIMIT_KEY); use the account address when sending from several.
+    Environment variables:
+      - GMAIL_RATE_LIMIT (quota units per second, default 250; 0 disables)
+      - GMAIL_RATE_LIMIT_PATH (default: gmail_quota.sqlite in the temp dir)
+      - GMAIL_RATE_LIMIT_KEY (bucket name, default 'me')
+    """
+    key = key or os.getenv("GMAIL_RATE_LIMIT_KEY", "me")
+    with _default_lock:
+        if key not in _default:
+            rate = float(os.getenv("GMAIL_RATE_LIMIT", str(DEFAULT_UNITS_PER_SECOND)))
+            path = os.getenv("GMAIL_RATE_LIMIT_PATH") or os.path.join(tempfile.gettempdir(), "gmail_quota.sqlite")
+            _default[key] = QuotaRateLimiter(rate, path=path, key=key) if rate > 0 else None
+        return _default[key]
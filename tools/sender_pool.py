@@ -0,0 +1,280 @@
+# tools/sender_pool.py
+"""
+Pool of Gmail accounts for sending beyond one account's quota.
+
+Each account keeps its own quota bucket (rate_limiter keyed by address), a
+daily send count (persisted in the token's sidecar, see tools/credentials.py)
+and a cool-down after 429 / rate-limit 403 responses. Each message goes to the
+least-loaded eligible account; a rate-limited send fails over to the next one,
+with the message rebuilt so its From header matches the account that sends it.
+"""
+from __future__ import annotations
+import glob
+import os
+import threading
+import time
+from collections import deque
+from datetime import date
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from tools.credentials import CredentialRefresher, load_token_meta, save_token_meta
+from tools.gmail_tool import (
+    _http_status,
+    build_gmail_service,
+    create_draft,
+    get_gmail_credentials,
+    get_sender_address,
+    send_message,
+)
+from tools.rate_limiter import QUOTA_COSTS, get_rate_limiter
+
+# Consumer Gmail allows ~500 recipients a day, Workspace ~2000
+DEFAULT_DAILY_LIMIT = int(os.getenv("GMAIL_DAILY_LIMIT", "500"))
+DEFAULT_COOLDOWN_S = float(os.getenv("GMAIL_THROTTLE_COOLDOWN", "30"))
+MAX_COOLDOWN_S = 15 * 60
+RECENT_WINDOW_S = 10 * 60
+RATE_LIMIT_STATUSES = (403, 429)
+
+
+class NoSenderAvailable(RuntimeError):
+    pass
+
+
+class SenderAccount:
+    def __init__(
+        self,
+        token_path: str,
+        client_secret_path: str,
+        *,
+        daily_limit: int = DEFAULT_DAILY_LIMIT,
+        refresh_ahead: bool = True,
+    ):
+        self.token_path = token_path
+        self.client_secret_path = client_secret_path
+        self.daily_limit = daily_limit
+        self.refresh_ahead = refresh_ahead
+        self.refresher: Optional[CredentialRefresher] = None
+        self._service = None
+        self._service_lock = threading.Lock()
+        meta = load_token_meta(token_path)
+        self._email: Optional[str] = meta.get("email")
+        self.in_flight = 0
+        self.throttled_until = 0.0
+        self.consecutive_throttles = 0
+        self.recent_throttles: Deque[float] = deque()
+        today = date.today().isoformat()
+        self.sent_day = today
+        self.sent_today = int(meta.get("sent_count") or 0) if meta.get("sent_day") == today else 0
+
+    @property
+    def service(self):
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    creds = get_gmail_credentials(self.client_secret_path, self.token_path)
+                    if self.refresh_ahead:
+                        self.refresher = CredentialRefresher(creds, self.token_path).start()
+                    self._service = build_gmail_service(creds)
+        return self._service
+
+    @property
+    def email(self) -> str:
+        if self._email is None:
+            self._email = get_sender_address(self.service, token_path=self.token_path)
+        return self._email
+
+    @property
+    def domain(self) -> str:
+        return self.email.rsplit("@", 1)[-1].lower()
+
+    @property
+    def limiter(self):
+        return get_rate_limiter(self.email)
+
+    def remaining_today(self) -> int:
+        if self.sent_day != date.today().isoformat():
+            self.sent_day, self.sent_today = date.today().isoformat(), 0
+        return max(0, self.daily_limit - self.sent_today)
+
+    def recent_throttle_count(self) -> int:
+        cutoff = time.time() - RECENT_WINDOW_S
+        while self.recent_throttles and self.recent_throttles[0] < cutoff:
+            self.recent_throttles.popleft()
+        return len(self.recent_throttles)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return: {email, sent_today, remaining_today, in_flight, throttled_for_s, recent_throttles}
+        """
+        now = time.time()
+        return {
+            "email": self.email,
+            "sent_today": self.sent_today,
+            "remaining_today": self.remaining_today(),
+            "in_flight": self.in_flight,
+            "throttled_for_s": round(max(0.0, self.throttled_until - now), 1),
+            "recent_throttles": self.recent_throttle_count(),
+        }
+
+
+class SenderPool:
+    def __init__(self, accounts: Iterable[SenderAccount], *, cooldown_s: float = DEFAULT_COOLDOWN_S):
+        self.accounts: List[SenderAccount] = list(accounts)
+        assert self.accounts, "SenderPool needs at least one account"
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_token_paths(cls, token_paths: Iterable[str], client_secret_path: str, **kwargs) -> "SenderPool":
+        """
+        token_paths may contain glob patterns, e.g. "tokens/*.json" (sidecar .meta.json files are skipped).
+        """
+        daily_limit = kwargs.pop("daily_limit", DEFAULT_DAILY_LIMIT)
+        paths: List[str] = []
+        for pattern in token_paths:
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            paths.extend(p for p in matches if not p.endswith(".meta.json") and p not in paths)
+        return cls((SenderAccount(p, client_secret_path, daily_limit=daily_limit) for p in paths), **kwargs)
+
+    @staticmethod
+    def _quota_ready(account: SenderAccount, units: int) -> bool:
+        # May resolve the address (getProfile) and read the shared bucket; call without the pool lock
+        limiter = account.limiter
+        return limiter is None or limiter.available() >= units
+
+    @staticmethod
+    def _score(account: SenderAccount, quota_ready: bool) -> tuple:
+        # Lower is better: accounts whose quota bucket can take the call right away,
+        # then fewer in flight, then the larger share of today's quota left, then
+        # fewer recent throttles (throttled accounts are already skipped while cooling down)
+        used = 1.0 - account.remaining_today() / max(1, account.daily_limit)
+        return (not quota_ready, account.in_flight, used, account.recent_throttle_count())
+
+    def acquire(
+        self,
+        *,
+        action: str = "send",
+        from_domain: Optional[str] = None,
+        exclude: Iterable[SenderAccount] = (),
+        timeout: Optional[float] = None,
+    ) -> SenderAccount:
+        """
+        Reserve the least-loaded eligible account (call release() afterwards).
+        Waits for a throttled account to cool down if every eligible one is throttled;
+        raises NoSenderAvailable if none can send (daily limits, domain, exclusions) or timeout passes.
+        """
+        units = QUOTA_COSTS["drafts.create" if action == "draft" else "messages.send"]
+        exclude = set(map(id, exclude))
+        domain = from_domain.lower().lstrip("@") if from_domain else None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Addresses and quota buckets are read before taking the lock, so one
+            # account waiting on getProfile or a token refresh doesn't block the others
+            candidates = [
+                a for a in self.accounts
+                if id(a) not in exclude and (domain is None or a.domain == domain)
+            ]
+            quota_ready = {id(a): self._quota_ready(a, units) for a in candidates}
+            with self._lock:
+                now = time.time()
+                eligible = [a for a in candidates if action == "draft" or a.remaining_today() > 0]
+                if not eligible:
+                    raise NoSenderAvailable(
+                        f"No account can {action}" + (f" from @{domain}" if domain else "") + " right now"
+                    )
+                ready = [a for a in eligible if a.throttled_until <= now]
+                if ready:
+                    account = min(ready, key=lambda a: self._score(a, quota_ready[id(a)]))
+                    account.in_flight += 1
+                    return account
+                wait = min(a.throttled_until for a in eligible) - now
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise NoSenderAvailable(f"All eligible accounts are throttled for another {wait:.0f}s")
+            time.sleep(wait)
+
+    def release(self, account: SenderAccount, *, sent: bool = False, throttled: bool = False,
+                daily_exhausted: bool = False) -> None:
+        with self._lock:
+            account.in_flight -= 1
+            if throttled:
+                account.consecutive_throttles += 1
+                account.recent_throttles.append(time.time())
+                cooldown = min(MAX_COOLDOWN_S, self.cooldown_s * 2 ** (account.consecutive_throttles - 1))
+                account.throttled_until = time.time() + cooldown
+            elif sent:
+                account.consecutive_throttles = 0
+            if daily_exhausted:
+                account.remaining_today()
+                account.sent_today = max(account.sent_today, account.daily_limit)
+            elif sent:
+                account.remaining_today()
+                account.sent_today += 1
+            day, count = account.sent_day, account.sent_today
+        if sent or daily_exhausted:
+            save_token_meta(account.token_path, sent_day=day, sent_count=count)
+
+    def deliver(
+        self,
+        build: Callable[[SenderAccount], Dict[str, Any]],
+        *,
+        action: str = "send",
+        from_domain: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_failovers: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        build(account) -> outgoing {action, message, ...} built with account.email as sender.
+        Sends through the chosen account, failing over to another one on rate limiting
+        (at most max_failovers times, default twice the pool size).
+        Returns the Gmail response with "account" (the sending address) added.
+        """
+        max_failovers = 2 * len(self.accounts) if max_failovers is None else max_failovers
+        tried: List[SenderAccount] = []
+        failovers = 0
+        while True:
+            try:
+                # Untried accounts first; once every account has been tried, wait for a cool-down
+                account = self.acquire(action=action, from_domain=from_domain, exclude=tried,
+                                       timeout=0 if tried else timeout)
+            except NoSenderAvailable:
+                if not tried:
+                    raise
+                tried = []
+                continue
+
+            try:
+                out = build(account)
+                if out["action"] == "draft":
+                    res = create_draft(account.service, message=out["message"], limiter=account.limiter)
+                else:
+                    # One attempt: on rate limiting we move on to another account instead of backing off
+                    res = send_message(account.service, message=out["message"], max_retries=1,
+                                       limiter=account.limiter)
+            except HttpError as e:
+                status = _http_status(e)
+                if status not in RATE_LIMIT_STATUSES:
+                    self.release(account)
+                    raise
+                text = str(e).lower()
+                self.release(account, throttled=True, daily_exhausted="daily" in text or "quota exceeded" in text)
+                failovers += 1
+                if failovers > max_failovers:
+                    raise
+                print(f"⚠️ {account.email} rate-limited ({status}); trying another account…")
+                tried.append(account)
+                continue
+            except BaseException:
+                self.release(account)
+                raise
+            self.release(account, sent=out["action"] != "draft")
+            res = dict(res or {})
+            res["account"] = account.email
+            return res
+
+    def stats(self) -> List[Dict[str, Any]]:
+        for a in self.accounts:
+            a.email  # resolve outside the lock
+        with self._lock:
+            return [a.stats() for a in self.accounts]
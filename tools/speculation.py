@@ -0,0 +1,212 @@
+# tools/speculation.py
+"""
+Speculative drafting: start draft_email from the raw prompt while the parser
+call is still in flight, so a prompt costs about one LLM round-trip instead of two.
+
+The speculative draft is written for a "{{name}}" recipient, in the tone words
+found in the prompt, from the full prompt as instruction. Once the parse is
+back it is kept (with the parsed name filled in) unless the parse would have
+produced a meaningfully different draft:
+  - tone: the parsed tone differs from the tone words in the prompt
+  - notes: the parsed notes add content words the prompt does not contain
+  - name: a recipient name was parsed but the draft has no {{name}} slot
+in which case the email is re-drafted the usual way.
+"""
+from __future__ import annotations
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from typing import Any, Dict, Optional, Tuple
+
+from tools import instrumentation
+from tools.email_writer import (
+    DEFAULT_TONE,
+    FAST_PARSE,
+    _normalize_fields,
+    adraft_email,
+    aparse_prompt_to_fields,
+    draft_email,
+    parse_prompt_to_fields,
+)
+from tools.intent_parser import fast_parse, guess_tone
+from tools.message_template import PLACEHOLDER_RE, personalise
+
+SPECULATIVE_NAME = "{{name}}"
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_TONE_FILLER = {"and", "or", "but", "yet", "tone", "with", "a", "an", "the", "very", "slightly", "somewhat"}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_stats: Dict[str, Any] = {"kept": 0, "redrafted": 0, "unused": 0, "skipped": 0, "reasons": {}}
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="speculative-draft")
+        return _executor
+
+
+def _words(text: str) -> set:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _tone_words(tone: str) -> set:
+    return _words(tone) - _TONE_FILLER
+
+
+def _redraft_reason(prompt: str, tone: str, parsed: Dict[str, Any], drafted: Dict[str, str]) -> Optional[str]:
+    if _tone_words(parsed["tone"]) != _tone_words(tone):
+        return "tone"
+    notes = parsed.get("notes") or ""
+    if notes and {w for w in _words(notes) if len(w) > 3} - _words(prompt):
+        return "notes"
+    if parsed.get("to_name") and not any(PLACEHOLDER_RE.search(drafted[k] or "") for k in ("plain", "html")):
+        return "name"
+    return None
+
+
+def _record(outcome: str, reason: Optional[str] = None) -> None:
+    with _lock:
+        _stats[outcome] += 1
+        if reason:
+            _stats["reasons"][reason] = _stats["reasons"].get(reason, 0) + 1
+    instrumentation.incr(f"speculative_{outcome}")
+
+
+def _fill_name(drafted: Dict[str, str], to_name: str) -> Dict[str, str]:
+    values = {"name": to_name or "there"}
+    return {
+        "subject": personalise(drafted["subject"], values),
+        "plain": personalise(drafted["plain"], values),
+        "html": personalise(drafted["html"], values, escape=True),
+    }
+
+
+def _settle(
+    prompt: str, tone: str, parsed: Dict[str, Any], speculative: Optional[Dict[str, str]]
+) -> Tuple[Optional[Dict[str, str]], str]:
+    """
+    Return (draft to keep or None to re-draft, outcome).
+    """
+    if not (parsed.get("to_email") or "").strip():
+        _record("unused")
+        return None, "unused"
+    reason = "error" if speculative is None else _redraft_reason(prompt, tone, parsed, speculative)
+    if reason:
+        _record("redrafted", reason)
+        return None, "redrafted"
+    _record("kept")
+    return _fill_name(speculative, parsed.get("to_name", "")), "kept"
+
+
+def _local_fields(prompt: str, fast_path: Optional[bool]) -> Optional[Dict[str, Any]]:
+    if fast_path if fast_path is not None else FAST_PARSE:
+        data = fast_parse(prompt)
+        if data is not None:
+            return _normalize_fields(data, prompt)
+    return None
+
+
+def speculative_parse_and_draft(prompt: str, *, fast_path: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Same result as parse_prompt_to_fields + draft_email, with the draft started
+    before the parse finishes.
+    Returns: {to_email, to_name, tone, cc, bcc, action, subject_override, notes,
+              draft: {subject, plain, html} or None (no recipient),
+              speculation: 'kept' | 'redrafted' | 'unused' | 'skipped'}
+    """
+    parsed = _local_fields(prompt, fast_path)
+    if parsed is not None:
+        # Parsed locally, so there is no round-trip to overlap
+        _record("skipped")
+        if not parsed["to_email"]:
+            return {**parsed, "draft": None, "speculation": "skipped"}
+        with instrumentation.span("draft"):
+            drafted = draft_email(parsed.get("to_name", ""), parsed.get("notes") or prompt, parsed["tone"])
+        return {**parsed, "draft": drafted, "speculation": "skipped"}
+
+    tone = guess_tone(prompt) or DEFAULT_TONE
+    ctx = contextvars.copy_context()
+
+    def speculate() -> Dict[str, str]:
+        with instrumentation.span("draft"):
+            return draft_email(SPECULATIVE_NAME, prompt, tone)
+
+    future = _pool().submit(ctx.run, speculate)
+    with instrumentation.span("parse"):
+        parsed = parse_prompt_to_fields(prompt, fast_path=False)
+    try:
+        speculative = future.result()
+    except Exception as e:
+        print(f"⚠️ Speculative draft failed ({e}); drafting again")
+        speculative = None
+
+    drafted, outcome = _settle(prompt, tone, parsed, speculative)
+    if drafted is None and outcome == "redrafted":
+        with instrumentation.span("draft"):
+            drafted = draft_email(parsed.get("to_name", ""), parsed.get("notes") or prompt, parsed["tone"])
+    return {**parsed, "draft": drafted, "speculation": outcome}
+
+
+async def aspeculative_parse_and_draft(prompt: str, *, fast_path: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Async variant of speculative_parse_and_draft.
+    """
+    parsed = _local_fields(prompt, fast_path)
+    if parsed is not None:
+        _record("skipped")
+        if not parsed["to_email"]:
+            return {**parsed, "draft": None, "speculation": "skipped"}
+        with instrumentation.span("draft"):
+            drafted = await adraft_email(parsed.get("to_name", ""), parsed.get("notes") or prompt, parsed["tone"])
+        return {**parsed, "draft": drafted, "speculation": "skipped"}
+
+    tone = guess_tone(prompt) or DEFAULT_TONE
+
+    async def speculate() -> Dict[str, str]:
+        with instrumentation.span("draft"):
+            return await adraft_email(SPECULATIVE_NAME, prompt, tone)
+
+    task = asyncio.ensure_future(speculate())
+    try:
+        with instrumentation.span("parse"):
+            parsed = await aparse_prompt_to_fields(prompt, fast_path=False)
+    except BaseException:
+        task.cancel()
+        raise
+    try:
+        speculative = await task
+    except Exception as e:
+        print(f"⚠️ Speculative draft failed ({e}); drafting again")
+        speculative = None
+
+    drafted, outcome = _settle(prompt, tone, parsed, speculative)
+    if drafted is None and outcome == "redrafted":
+        with instrumentation.span("draft"):
+            drafted = await adraft_email(parsed.get("to_name", ""), parsed.get("notes") or prompt, parsed["tone"])
+    return {**parsed, "draft": drafted, "speculation": outcome}
+
+
+def speculation_stats() -> Dict[str, Any]:
+    """
+    Return: {kept, redrafted, unused, skipped, keep_rate, reasons: {tone, notes, name, error}}
+    keep_rate is kept / (kept + redrafted).
+    """
+    with _lock:
+        out = dict(_stats)
+        out["reasons"] = dict(_stats["reasons"])
+    settled = out["kept"] + out["redrafted"]
+    out["keep_rate"] = out["kept"] / settled if settled else 0.0
+    return out
+
+
+def reset_speculation_stats() -> None:
+    with _lock:
+        for k in ("kept", "redrafted", "unused", "skipped"):
+            _stats[k] = 0
+        _stats["reasons"] = {}